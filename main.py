@@ -8,14 +8,12 @@ import os
 import sys
 from urllib.parse import urlparse, urljoin
 
-# For parsing a webpage.
-from bs4 import BeautifulSoup
 # pylint: disable=line-too-long
 from flask import Flask, jsonify, make_response, render_template, request, Response, send_from_directory
 from flask_cors import CORS
 
 # For crawling a webpage.
-import requests
+from util.page_metadata import fetch_page_metadata
 from util.post import Post
 from util.post_db import PostDB
 
@@ -258,32 +256,23 @@ def api_add_post():
     url = post["url"]
     _comment = post["comment"]
 
-    title = ''
-    main_image = ''
-    description = ''
-
-    # Crawl and parse a webpage.
-    source_code = requests.get(url).text
-    soup = BeautifulSoup(source_code, 'html.parser')
-    for each_text in soup.findAll('meta'):
-        if each_text.get('property') == 'og:title':
-            title = each_text.get('content')
-        if each_text.get('property') == 'og:image':
-            main_image = each_text.get('content')
-        if each_text.get('property') == 'og:url':
-            og_url = each_text.get('content')
-            full_url = get_full_url(url, og_url)
-            if full_url:
-                url = full_url
-                logger.info('New URL from og:url: %s', url)
-            else:
-                logger.warning('Failed to generate a full URL from %s', og_url)
-                return Response(
-                    status=500,
-                    response="INSERT operation failed.",
-                )
-        if each_text.get('property') == 'og:description':
-            description = each_text.get('content')
+    # Crawl a webpage and extract metadata from its <head>.
+    metadata = fetch_page_metadata(url)
+    title = metadata.title
+    main_image = metadata.image
+    description = metadata.description
+    if metadata.url:
+        full_url = get_full_url(url, metadata.url)
+        if full_url:
+            url = full_url
+            logger.info('New URL from og:url: %s', url)
+        else:
+            logger.warning(
+                'Failed to generate a full URL from %s', metadata.url)
+            return Response(
+                status=500,
+                response="INSERT operation failed.",
+            )
     # Can't extract the published date yet.
     published_date = 0
     author = ""
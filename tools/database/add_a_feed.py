@@ -9,10 +9,10 @@ import getopt
 import logging
 import sys
 
-import requests
 from util.feed import Feed
 from util.feed_db import FeedDB
 from util.feed_reader_factory import FeedReaderFactory, infer_feed_type
+from util.http_fetcher import HttpFetcher
 from util.url import url_to_hashkey
 
 logger = logging.getLogger()
@@ -60,7 +60,7 @@ def main(argv):
         sys.exit()
 
     # Fetch a feed and extract information.
-    feed_doc = requests.get(url)
+    feed_doc = HttpFetcher.get_instance().get(url)
 
     if feed_doc.status_code != 200:
         logger.warning(
@@ -77,7 +77,9 @@ def main(argv):
             description=reader.description,
             language=reader.language, feed_type=feed_type,
             first_fetched_time=datetime.utcnow(),
-            latest_fetched_time=datetime.utcnow())
+            latest_fetched_time=datetime.utcnow(),
+            etag=feed_doc.headers.get("ETag", ""),
+            last_modified=feed_doc.headers.get("Last-Modified", ""))
 
     feed_db.insert_feed(feed)
 
@@ -0,0 +1,302 @@
+"""Migrate feed tables in the backend database.
+
+Adds columns, indexes and tables introduced after the tables were created,
+and partitions feed_fetch_log by month. Unlike reset_feed_tables.py,
+existing records are kept. Steps which are already done are skipped, so it
+is safe to run the migration more than once.
+
+Partitioning copies feed_fetch_log, so run it when the crawler is stopped
+(after rollup_feed_fetch_log.py has dropped old events, it is fast).
+
+  Typical usage example:
+  $ PYTHONPATH=./ python3 tools/database/migrate_feed_tables.py \
+      -m <mode: prod, dev, test(default)> -d <dryrun: true, false>
+"""
+from datetime import datetime
+import getopt
+import logging
+import sys
+
+import sqlalchemy
+from util import database
+from util.fetch_log_rollup import (
+    PARTITION_MONTHS_AHEAD, monthly_partitions, next_month,
+    partition_definitions)
+
+logger = logging.getLogger()
+
+# (table, column, column definition) to add to existing tables.
+COLUMN_MIGRATIONS = [
+    ("feeds", "etag", "VARCHAR(255)"),
+    ("feeds", "last_modified", "VARCHAR(64)"),
+    ("feed_fetch_log", "bytes_transferred", "INT"),
+    ("feeds", "publish_histogram", "CHAR(168)"),
+    ("feeds", "newest_post_published_date", "DATETIME"),
+    ("feeds", "publish_interval_mean", "DOUBLE"),
+    ("feeds", "publish_interval_variance", "DOUBLE"),
+    ("feeds", "publish_interval_count", "INT"),
+    ("feeds", "lease_owner", "VARCHAR(64)"),
+    ("feeds", "lease_expires_time", "DATETIME"),
+    ("feeds", "consecutive_failures", "INT"),
+    ("feeds", "last_error", "VARCHAR(64)"),
+    ("feeds", "quarantined_time", "DATETIME"),
+    ("feeds", "item_budget", "INT"),
+    ("feeds", "age_window_secs", "INT"),
+    ("feeds", "latest_success_time", "DATETIME"),
+    ("feeds", "body_fingerprint", "CHAR(40)"),
+    ("feeds", "link_fingerprint", "CHAR(40)"),
+]
+
+# (table, index name, indexed columns) to add to existing tables.
+INDEX_MIGRATIONS = [
+    ("feeds", "scheduled_fetch_time_idx", "scheduled_fetch_time"),
+    ("feed_fetch_log", "url_key_fetched_time_idx", "url_key, fetched_time"),
+]
+
+# (table, column definitions) to create if missing.
+TABLE_MIGRATIONS = [
+    ("feed_fetch_daily", """
+    url_key CHAR(24) NOT NULL,
+    fetch_date DATE NOT NULL,
+    num_fetches INT,
+    num_updates INT,
+    median_gap_secs INT,
+    bytes_transferred BIGINT,
+    newest_post_published_date DATETIME,
+    PRIMARY KEY(url_key, fetch_date)"""),
+    ("host_states", """
+    host VARCHAR(255) NOT NULL,
+    consecutive_failures INT,
+    open_until DATETIME,
+    updated_time DATETIME,
+    PRIMARY KEY(host)"""),
+]
+
+def column_exists(conn, table_name, column_name):
+    """Checks if a column exists in a table.
+
+    Args:
+        conn: a database connection.
+        table_name: A full table name e.g. test_feeds.
+        column_name: A column name.
+
+    Returns:
+        True if the column exists.
+    """
+    stmt = sqlalchemy.text("""
+        SELECT COUNT(*)
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE()
+          AND TABLE_NAME = :table_name
+          AND COLUMN_NAME = :column_name
+        """)
+    return conn.execute(
+        stmt, table_name=table_name, column_name=column_name).scalar() > 0
+
+def index_exists(conn, table_name, index_name):
+    """Checks if an index exists in a table.
+
+    Args:
+        conn: a database connection.
+        table_name: A full table name e.g. test_feeds.
+        index_name: An index name.
+
+    Returns:
+        True if the index exists.
+    """
+    stmt = sqlalchemy.text("""
+        SELECT COUNT(*)
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE()
+          AND TABLE_NAME = :table_name
+          AND INDEX_NAME = :index_name
+        """)
+    return conn.execute(
+        stmt, table_name=table_name, index_name=index_name).scalar() > 0
+
+def is_partitioned(conn, table_name):
+    """Checks if a table is partitioned.
+
+    Args:
+        conn: a database connection.
+        table_name: A full table name e.g. test_feed_fetch_log.
+
+    Returns:
+        True if the table has partitions.
+    """
+    stmt = sqlalchemy.text("""
+        SELECT COUNT(*)
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE()
+          AND TABLE_NAME = :table_name
+          AND PARTITION_NAME IS NOT NULL
+        """)
+    return conn.execute(stmt, table_name=table_name).scalar() > 0
+
+def foreign_keys(conn, table_name):
+    """Lists the names of foreign keys of a table.
+
+    Args:
+        conn: a database connection.
+        table_name: A full table name e.g. test_feed_fetch_log.
+
+    Returns:
+        A list of constraint names.
+    """
+    stmt = sqlalchemy.text("""
+        SELECT CONSTRAINT_NAME
+        FROM information_schema.REFERENTIAL_CONSTRAINTS
+        WHERE CONSTRAINT_SCHEMA = DATABASE()
+          AND TABLE_NAME = :table_name
+        """)
+    return [row[0] for row in conn.execute(stmt, table_name=table_name)]
+
+def partition_fetch_log(conn, mode, dryrun):
+    """Partitions feed_fetch_log by month of fetched_time.
+
+    Partitioned tables can't have foreign keys, so the one to feeds is
+    dropped first.
+
+    Args:
+        conn: a database connection.
+        mode: prod/dev/test mode.
+        dryrun: dryrun doesn't execute quries.
+    """
+    table_name = "{mode}_feed_fetch_log".format(mode=mode)
+    if is_partitioned(conn, table_name):
+        print("Table already partitioned: %s" % table_name)
+        return
+
+    stmts = [
+        sqlalchemy.text(
+            "  ALTER TABLE {table_name} DROP FOREIGN KEY {name};".format(
+                table_name=table_name, name=name))
+        for name in foreign_keys(conn, table_name)]
+
+    first_month = conn.execute(
+        "SELECT MIN(fetched_time) FROM {table_name}".format(
+            table_name=table_name)).scalar() or datetime.utcnow()
+    last_month = datetime.utcnow()
+    for _ in range(PARTITION_MONTHS_AHEAD):
+        last_month = next_month(last_month)
+    stmts.append(sqlalchemy.text("""
+  ALTER TABLE {table_name}
+  PARTITION BY RANGE (TO_DAYS(fetched_time)) (
+    {partitions}
+  );""".format(
+        table_name=table_name, partitions=partition_definitions(
+            monthly_partitions(first_month, last_month)))))
+
+    for stmt in stmts:
+        if dryrun:
+            print("SQL query to execute: \n%s" % stmt)
+        else:
+            print("Executing the following command: \n%s" % stmt)
+            conn.execute(stmt)
+
+def migrate_tables(db_instance, mode, dryrun):
+    """Adds missing columns, indexes and tables at 'mode'.
+
+    Args:
+        db_instance: a database instance.
+        mode: prod/dev/test mode.
+        dryrun: dryrun doesn't execute quries.
+
+    Returns:
+        N/A
+
+    Raises:
+        N/A
+    """
+    with db_instance.connect() as conn:
+        for table, column, definition in COLUMN_MIGRATIONS:
+            table_name = "{mode}_{table}".format(mode=mode, table=table)
+            if column_exists(conn, table_name, column):
+                print("Column already exists: %s.%s" % (table_name, column))
+                continue
+
+            stmt = sqlalchemy.text(
+                "  ALTER TABLE {table_name} ADD COLUMN {column} {definition};"
+                .format(
+                    table_name=table_name, column=column,
+                    definition=definition))
+            if dryrun:
+                print("SQL query to execute: \n%s" % stmt)
+            else:
+                print("Executing the following command: \n%s" % stmt)
+                conn.execute(stmt)
+
+        for table, index, columns in INDEX_MIGRATIONS:
+            table_name = "{mode}_{table}".format(mode=mode, table=table)
+            if index_exists(conn, table_name, index):
+                print("Index already exists: %s.%s" % (table_name, index))
+                continue
+
+            stmt = sqlalchemy.text(
+                "  CREATE INDEX {index} ON {table_name} ({columns});".format(
+                    index=index, table_name=table_name, columns=columns))
+            if dryrun:
+                print("SQL query to execute: \n%s" % stmt)
+            else:
+                print("Executing the following command: \n%s" % stmt)
+                conn.execute(stmt)
+
+        for table, columns in TABLE_MIGRATIONS:
+            stmt = sqlalchemy.text(
+                "  CREATE TABLE IF NOT EXISTS {table_name} ({columns}\n  );"
+                .format(
+                    table_name="{mode}_{table}".format(mode=mode, table=table),
+                    columns=columns))
+            if dryrun:
+                print("SQL query to execute: \n%s" % stmt)
+            else:
+                print("Executing the following command: \n%s" % stmt)
+                conn.execute(stmt)
+
+        partition_fetch_log(conn, mode, dryrun)
+
+def main(argv):
+    """Main entry point.
+
+    Adds missing columns, indexes and tables to the feed tables.
+
+    Args:
+        --mode: {prod, dev} prod/dev mode for a table set.
+        --dryrun: {true, false} dryrun doesn't execute the queries.
+    """
+    mode = "test"
+    dryrun = True
+
+    try:
+        opts, _ = getopt.getopt(argv,"hm:d:",["mode=","dryrun="])
+    except getopt.GetoptError:
+        # pylint: disable=line-too-long
+        print("migrate_feed_tables.py -m <mode: prod, dev, test(default)> -d <dryrun: true(default), false>")
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == "-h":
+            # pylint: disable=line-too-long
+            print("migrate_feed_tables.py -m <mode: prod, dev, test(default)> -d <dryrun: true(default), false>")
+            sys.exit()
+        elif opt in ("-m", "--mode"):
+            mode = arg
+            if mode not in ("prod", "dev", "test"):
+                print("Unknown 'mode': %s", mode)
+                sys.exit(2)
+        elif opt in ("-d", "--dryrun"):
+            dryrun_arg = arg
+            if dryrun_arg not in ("true", "false"):
+                dryrun = True
+                print("Unknown 'dryrun': %s (hint: case sensitive), run as dryrun.", dryrun_arg)
+            else:
+                dryrun = (dryrun_arg == "true")
+
+    print("Migrating the database started.")
+
+    db_instance = database.init_connection_engine()
+    migrate_tables(db_instance, mode, dryrun)
+
+    print("Migrating the database completed.")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
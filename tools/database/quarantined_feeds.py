@@ -0,0 +1,101 @@
+"""List and release quarantined feeds and failing hosts.
+
+Feeds which failed QUARANTINE_FAILURES times in a row are quarantined and
+not fetched until released here. Hosts whose circuit is open are skipped
+by the crawler until the circuit half-opens; releasing a host closes it.
+
+  Typical usage example:
+  $ PYTHONPATH=./ python3 tools/database/quarantined_feeds.py --mode=prod
+
+  Release a feed (fetched on the next run), all feeds, or a host:
+  $ PYTHONPATH=./ python3 tools/database/quarantined_feeds.py --mode=prod \
+      --release=<url_key>
+  $ PYTHONPATH=./ python3 tools/database/quarantined_feeds.py --mode=prod \
+      --release_all
+  $ PYTHONPATH=./ python3 tools/database/quarantined_feeds.py --mode=prod \
+      --release_host=www.example.com
+"""
+from datetime import datetime
+import getopt
+import logging
+import sys
+
+from util.feed_db import FeedDB, HostStateDB
+
+logger = logging.getLogger()
+
+def print_quarantined_feeds(feeds):
+    """Prints quarantined feeds.
+
+    Args:
+      feeds: A list of Feed instances.
+    """
+    print("%d quarantined feeds:" % len(feeds))
+    for feed in feeds:
+        print("  %s since %s (%d failures, last: %s): %s" % (
+            feed.url_key, feed.quarantined_time, feed.consecutive_failures,
+            feed.last_error, feed.url))
+
+def print_open_hosts(hosts):
+    """Prints hosts whose circuit is open.
+
+    Args:
+      hosts: (host, consecutive failures, open until) tuples.
+    """
+    print("%d hosts with an open circuit:" % len(hosts))
+    for host, failures, open_until in hosts:
+        print("  %s until %s (%d failures)" % (host, open_until, failures))
+
+def main(argv):
+    """main function.
+    """
+    mode = "test"
+    release_keys = []
+    release_all = False
+    release_hosts = []
+
+    try:
+        opts, _ = getopt.getopt(
+            argv,"hm:r:",
+            ["mode=","release=","release_all","release_host="])
+    except getopt.GetoptError:
+        # pylint: disable=line-too-long
+        print("quarantined_feeds.py -m <mode: prod, dev, test(default)> -r <url_key to release> --release_all --release_host=<host>")
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == "-h":
+            # pylint: disable=line-too-long
+            print("quarantined_feeds.py -m <mode: prod, dev, test(default)> -r <url_key to release> --release_all --release_host=<host>")
+            sys.exit()
+        elif opt in ("-m", "--mode"):
+            mode = arg
+            if mode not in ("prod", "dev", "test"):
+                print("Unknown 'mode': %s", mode)
+                sys.exit(2)
+        elif opt in ("-r", "--release"):
+            release_keys.append(arg)
+        elif opt == "--release_all":
+            release_all = True
+        elif opt == "--release_host":
+            release_hosts.append(arg)
+
+    feed_db = FeedDB(mode)
+    host_state_db = HostStateDB(mode)
+
+    if release_all:
+        release_keys = [
+            feed.url_key for feed in feed_db.scan_quarantined_feeds()]
+    for url_key in release_keys:
+        if feed_db.release_quarantine(url_key):
+            print("Released: %s" % url_key)
+        else:
+            print("Not quarantined: %s" % url_key)
+    for host in release_hosts:
+        host_state_db.release(host)
+        print("Released host: %s" % host)
+
+    print_quarantined_feeds(feed_db.scan_quarantined_feeds())
+    print_open_hosts(host_state_db.list_open(datetime.utcnow()))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -5,12 +5,16 @@ Drop tables and recreate them.
   Typical usage example:
   $ reset_feed_tables.py -m <mode: prod, dev, test(default)> -d <dryrun: true, false>
 """
+from datetime import datetime
 import getopt
 import logging
 import sys
 
 import sqlalchemy
 from util import database
+from util.fetch_log_rollup import (
+    PARTITION_MONTHS_AHEAD, monthly_partitions, next_month,
+    partition_definitions)
 
 logger = logging.getLogger()
 
@@ -50,7 +54,25 @@ def create_tables(db_instance, mode, dryrun):
     latest_fetched_time DATETIME,
     latest_item_url VARCHAR(2084),
     latest_item_title VARCHAR(128),
-    PRIMARY KEY(url_key) 
+    etag VARCHAR(255),
+    last_modified VARCHAR(64),
+    publish_histogram CHAR(168),
+    newest_post_published_date DATETIME,
+    publish_interval_mean DOUBLE,
+    publish_interval_variance DOUBLE,
+    publish_interval_count INT,
+    lease_owner VARCHAR(64),
+    lease_expires_time DATETIME,
+    consecutive_failures INT,
+    last_error VARCHAR(64),
+    quarantined_time DATETIME,
+    item_budget INT,
+    age_window_secs INT,
+    latest_success_time DATETIME,
+    body_fingerprint CHAR(40),
+    link_fingerprint CHAR(40),
+    PRIMARY KEY(url_key),
+    INDEX scheduled_fetch_time_idx (scheduled_fetch_time)
   );
             """.format(mode=mode)
         )
@@ -80,7 +102,12 @@ def create_tables(db_instance, mode, dryrun):
             print("Executing the following command: \n%s" % stmt)
             conn.execute(stmt)
 
-        # Create feed_fetch_log if not exist.
+        # Create feed_fetch_log if not exist. It is partitioned by month
+        # to drop old events cheaply (partitioned tables can't have foreign
+        # keys, so delete_feed.py deletes the events of a feed).
+        last_month = datetime.utcnow()
+        for _ in range(PARTITION_MONTHS_AHEAD):
+            last_month = next_month(last_month)
         stmt = sqlalchemy.text("""
   CREATE TABLE IF NOT EXISTS {mode}_feed_fetch_log (
     url_key CHAR(24) NOT NULL,
@@ -89,7 +116,52 @@ def create_tables(db_instance, mode, dryrun):
     newest_post_published_date DATETIME,
     previous_changerate INT,
     previous_scheduled_fetch_time DATETIME,
-    FOREIGN KEY (url_key) REFERENCES {mode}_feeds(url_key)
+    bytes_transferred INT,
+    INDEX url_key_fetched_time_idx (url_key, fetched_time)
+  )
+  PARTITION BY RANGE (TO_DAYS(fetched_time)) (
+    {partitions}
+  );
+            """.format(
+                mode=mode, partitions=partition_definitions(
+                    monthly_partitions(datetime.utcnow(), last_month)))
+        )
+
+        if dryrun:
+            print("SQL query to execute: \n%s" % stmt)
+        else:
+            print("Executing the following command: \n%s" % stmt)
+            conn.execute(stmt)
+
+        # Create host_states if not exist.
+        stmt = sqlalchemy.text("""
+  CREATE TABLE IF NOT EXISTS {mode}_host_states (
+    host VARCHAR(255) NOT NULL,
+    consecutive_failures INT,
+    open_until DATETIME,
+    updated_time DATETIME,
+    PRIMARY KEY(host)
+  );
+            """.format(mode=mode)
+        )
+
+        if dryrun:
+            print("SQL query to execute: \n%s" % stmt)
+        else:
+            print("Executing the following command: \n%s" % stmt)
+            conn.execute(stmt)
+
+        # Create feed_fetch_daily if not exist.
+        stmt = sqlalchemy.text("""
+  CREATE TABLE IF NOT EXISTS {mode}_feed_fetch_daily (
+    url_key CHAR(24) NOT NULL,
+    fetch_date DATE NOT NULL,
+    num_fetches INT,
+    num_updates INT,
+    median_gap_secs INT,
+    bytes_transferred BIGINT,
+    newest_post_published_date DATETIME,
+    PRIMARY KEY(url_key, fetch_date)
   );
             """.format(mode=mode)
         )
@@ -115,6 +187,23 @@ def drop_tables(db_instance, mode, dryrun):
         N/A
     """
     with db_instance.connect() as conn:
+        stmt = sqlalchemy.text(
+                "  DROP TABLE IF EXISTS {mode}_host_states;".format(mode=mode))
+        if dryrun:
+            print("SQL query to execute: \n%s" % stmt)
+        else:
+            print("Executing the following command: \n%s" % stmt)
+            conn.execute(stmt)
+
+        stmt = sqlalchemy.text(
+                "  DROP TABLE IF EXISTS {mode}_feed_fetch_daily;".format(
+                    mode=mode))
+        if dryrun:
+            print("SQL query to execute: \n%s" % stmt)
+        else:
+            print("Executing the following command: \n%s" % stmt)
+            conn.execute(stmt)
+
         stmt = sqlalchemy.text(
                 "  DROP TABLE IF EXISTS {mode}_feed_fetch_log;".format(mode=mode))
         if dryrun:
@@ -0,0 +1,133 @@
+"""Roll up and expire old events of the feed fetch log.
+
+Events older than the retention period are compacted into per-feed daily
+aggregates in feed_fetch_daily, then dropped from feed_fetch_log (a DROP
+PARTITION per month if the table is partitioned, batched DELETEs
+otherwise). Partitions for the upcoming months are added as well, so run
+it daily (e.g. from cron).
+
+  Typical usage example:
+  $ PYTHONPATH=./ python3 tools/database/rollup_feed_fetch_log.py \
+      --mode=prod --retention_days=30 --dryrun=false
+"""
+from datetime import datetime, timedelta
+import getopt
+import logging
+import sys
+
+from util.feed_db import FeedFetchLogDB
+from util.fetch_log_rollup import (
+    PARTITION_MONTHS_AHEAD, RETENTION_DAYS, daily_rollups, expired_partitions,
+    month_start, monthly_partitions, next_month, retention_cutoff)
+
+logger = logging.getLogger()
+
+def rollup_days(log_db, cutoff, dryrun):
+    """Rolls up the days before 'cutoff' which are not rolled up yet.
+
+    Args:
+      log_db: A FeedFetchLogDB instance.
+      cutoff: A datetime at 00:00.
+      dryrun: dryrun doesn't write rollups.
+
+    Returns:
+      The # of rollups (feed-days).
+    """
+    oldest_fetched_time = log_db.oldest_fetched_time()
+    if not oldest_fetched_time:
+        return 0
+    day = datetime(
+        oldest_fetched_time.year, oldest_fetched_time.month,
+        oldest_fetched_time.day)
+    latest_rollup_date = log_db.latest_rollup_date()
+    if latest_rollup_date:
+        day = max(day, datetime(
+            latest_rollup_date.year, latest_rollup_date.month,
+            latest_rollup_date.day) + timedelta(days=1))
+
+    num_rollups = 0
+    while day < cutoff:
+        events = log_db.scan_by_time(day, day + timedelta(days=1))
+        rollups = daily_rollups(events)
+        print("%s: %d events of %d feeds." % (
+            day.date(), len(events), len(rollups)))
+        if not dryrun and not log_db.upsert_daily(rollups):
+            # Keep the raw events until the day is rolled up.
+            raise RuntimeError("Failed to write rollups of %s" % day.date())
+        num_rollups += len(rollups)
+        day += timedelta(days=1)
+    return num_rollups
+
+def expire_events(log_db, cutoff, dryrun):
+    """Drops events before 'cutoff' and adds partitions for upcoming months.
+
+    Args:
+      log_db: A FeedFetchLogDB instance.
+      cutoff: A datetime; events before it have been rolled up.
+      dryrun: dryrun doesn't change the table.
+    """
+    partitions = log_db.list_partitions()
+    if not partitions:
+        print("feed_fetch_log is not partitioned, deleting events before %s."
+              % cutoff)
+        if not dryrun:
+            print("Deleted %d events." % log_db.delete_before(cutoff))
+        return
+
+    last_month = datetime.utcnow()
+    for _ in range(PARTITION_MONTHS_AHEAD):
+        last_month = next_month(last_month)
+    new_partitions = []
+    if partitions[-1][1] <= month_start(last_month):
+        new_partitions = monthly_partitions(partitions[-1][1], last_month)
+    expired = expired_partitions(partitions, cutoff)
+
+    print("Partitions to add: %s" % [name for name, _ in new_partitions])
+    print("Partitions to drop: %s" % expired)
+    if not dryrun:
+        log_db.add_partitions(new_partitions)
+        log_db.drop_partitions(expired)
+
+def main(argv):
+    """main function.
+    """
+    mode = "test"
+    retention_days = RETENTION_DAYS
+    dryrun = True
+
+    try:
+        opts, _ = getopt.getopt(
+            argv,"hm:r:d:",["mode=","retention_days=","dryrun="])
+    except getopt.GetoptError:
+        # pylint: disable=line-too-long
+        print("rollup_feed_fetch_log.py -m <mode: prod, dev, test(default)> -r <retention days> -d <dryrun: true(default), false>")
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == "-h":
+            # pylint: disable=line-too-long
+            print("rollup_feed_fetch_log.py -m <mode: prod, dev, test(default)> -r <retention days> -d <dryrun: true(default), false>")
+            sys.exit()
+        elif opt in ("-m", "--mode"):
+            mode = arg
+            if mode not in ("prod", "dev", "test"):
+                print("Unknown 'mode': %s", mode)
+                sys.exit(2)
+        elif opt in ("-r", "--retention_days"):
+            retention_days = int(arg)
+        elif opt in ("-d", "--dryrun"):
+            dryrun_arg = arg
+            if dryrun_arg not in ("true", "false"):
+                dryrun = True
+                print("Unknown 'dryrun': %s (hint: case sensitive), run as dryrun.", dryrun_arg)
+            else:
+                dryrun = (dryrun_arg == "true")
+
+    log_db = FeedFetchLogDB(mode)
+    cutoff = retention_cutoff(datetime.utcnow(), retention_days)
+    print("Rolling up events before %s." % cutoff)
+    num_rollups = rollup_days(log_db, cutoff, dryrun)
+    print("Rolled up %d feed-days." % num_rollups)
+    expire_events(log_db, cutoff, dryrun)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,111 @@
+"""Backtests changerate policies on the feed fetch log.
+
+Publication times of each feed are taken from its fetch log. Each policy is
+replayed over the logged period, and the tool reports wasted fetches (no
+new post) against freshness delay (publication to fetch) for the former
+policy (newest event only), the EWMA estimator, and the EWMA estimator
+scheduled by the hour-of-week publication histogram.
+
+  Typical usage example:
+  $ PYTHONPATH=./ python3 tools/rss_crawler/backtest_changerate.py \
+      --mode=prod --count=1000 --events=1000 --per_feed
+"""
+import getopt
+import logging
+import sys
+
+from util.changerate import (
+    BacktestResult, backtest, ewma_changerate, legacy_changerate,
+    publication_times, to_naive_utc)
+from util.feed_db import FeedDB, FeedFetchLogDB
+from util.publish_histogram import histogram_changerate
+
+logger = logging.getLogger()
+
+POLICIES = (
+    ("legacy", legacy_changerate), ("ewma", ewma_changerate),
+    ("histogram", histogram_changerate))
+
+def format_result(name, result):
+    """Formats a backtest result in a line.
+
+    Args:
+      name: A name of the result.
+      result: A BacktestResult instance.
+
+    Returns:
+      A string.
+    """
+    wasted_ratio = result.num_wasted_fetches / result.num_fetches if (
+        result.num_fetches) else 0
+    return (
+        "%-9s fetches: %6d, wasted: %6d (%5.1f%%), posts: %5d, missed: %4d, "
+        "delay mean/p50/p90: %6.2f/%6.2f/%6.2f hours" % (
+            name, result.num_fetches, result.num_wasted_fetches,
+            wasted_ratio * 100, len(result.delays), result.num_missed,
+            result.mean_delay() / 3600,
+            result.delay_percentile(50) / 3600,
+            result.delay_percentile(90) / 3600))
+
+def main(argv):
+    """main function.
+    """
+    mode = "test"
+    count = 1000
+    num_events = 1000
+    per_feed = False
+
+    try:
+        opts, _ = getopt.getopt(
+            argv,"hm:c:e:",["mode=","count=","events=","per_feed"])
+    except getopt.GetoptError:
+        # pylint: disable=line-too-long
+        print("backtest_changerate.py -m <mode: prod, dev, test(default)> -c <# of feeds> -e <# of events per feed> --per_feed")
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == "-h":
+            # pylint: disable=line-too-long
+            print("backtest_changerate.py -m <mode: prod, dev, test(default)> -c <# of feeds> -e <# of events per feed> --per_feed")
+            sys.exit()
+        elif opt in ("-m", "--mode"):
+            mode = arg
+            if mode not in ("prod", "dev", "test"):
+                print("Unknown 'mode': %s", mode)
+                sys.exit(2)
+        elif opt in ("-c", "--count"):
+            count = int(arg)
+        elif opt in ("-e", "--events"):
+            num_events = int(arg)
+        elif opt == "--per_feed":
+            per_feed = True
+
+    feed_db = FeedDB(mode)
+    log_db = FeedFetchLogDB(mode)
+
+    totals = {name: BacktestResult() for name, _ in POLICIES}
+    num_feeds = 0
+    for feed in feed_db.scan_feeds(start_idx=0, count=count):
+        events = log_db.scan(feed.url_key, count=num_events)
+        publications = publication_times(events)
+        if len(events) < 2 or not publications:
+            continue
+        num_feeds += 1
+
+        fetched_times = [to_naive_utc(e["fetched_time"]) for e in events]
+        start_time, end_time = min(fetched_times), max(fetched_times)
+        if per_feed:
+            print("[%s] %d events, %d posts, %s - %s" % (
+                feed.url, len(events), len(publications), start_time,
+                end_time))
+        for name, policy in POLICIES:
+            result = backtest(publications, start_time, end_time, policy)
+            totals[name].add(result)
+            if per_feed:
+                print("  " + format_result(name, result))
+
+    print("Backtested %d feeds." % num_feeds)
+    for name, _ in POLICIES:
+        print(format_result(name, totals[name]))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,240 @@
+"""Benchmarks the crawl pipeline on a recorded corpus without network access.
+
+Runs process_feed (fetch, parse, DB writes) for every feed of a corpus
+recorded with main.py --record, serving the responses with ReplayAdapter,
+and prints feeds/sec, items/sec and p50/p99 per-feed latencies.
+
+Posts and fetches are kept in memory by default, so the numbers are about
+the crawler itself. With --db=mysql they are written to the tables of
+--mode (e.g. a local MySQL with DB_HOST=127.0.0.1:3306); posts inserted by a
+previous run are not new any more.
+
+Items are filtered by age as of the recording time, so a replay keeps the
+items of the live crawl.
+
+  Typical usage example:
+  $ PYTHONPATH=./ python3 tools/rss_crawler/main.py --force_fetch \
+      --record=/tmp/corpus
+  $ PYTHONPATH=./ python3 tools/rss_crawler/benchmark_crawl.py \
+      --corpus=/tmp/corpus --concurrency=16 --parse_workers=4 --repeat=3
+
+  Replay with the recorded network latencies (scaled by 1.0):
+  $ PYTHONPATH=./ python3 tools/rss_crawler/benchmark_crawl.py \
+      --corpus=/tmp/corpus --concurrency=16 --latency_scale=1
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import getopt
+import logging
+import math
+import sys
+import time
+
+# The crawler in this directory (on sys.path when run as a script).
+import main as crawler
+from util.crawl_corpus import CrawlCorpus, ReplayAdapter
+from util.crawl_metrics import CrawlMetrics
+from util.feed_db import FeedDB
+from util.http_fetcher import HttpFetcher
+from util.post_db import PostDB
+
+logger = logging.getLogger()
+
+class MemoryFeedDB:
+    """MemoryFeedDB keeps fetch events of a benchmark in memory.
+
+    It implements the FeedDB methods used by process_feed.
+    """
+    def __init__(self):
+        self.events = []
+
+    def record_fetch(self, feed, event):
+        """Keeps a fetch event and schedules the feed by its changerate.
+        """
+        self.events.append((feed.url_key, event))
+        feed.latest_fetched_time = event["fetched_time"]
+        feed.latest_item_url = event.get(
+            "latest_item_url", feed.latest_item_url)
+        feed.body_fingerprint = event.get(
+            "body_fingerprint", feed.body_fingerprint)
+        feed.link_fingerprint = event.get(
+            "link_fingerprint", feed.link_fingerprint)
+        feed.scheduled_fetch_time = event["fetched_time"] + timedelta(
+            seconds=feed.changerate)
+        return feed.scheduled_fetch_time
+
+    def defer_feed(self, feed, scheduled_fetch_time):
+        """Moves the schedule of a feed.
+        """
+        feed.scheduled_fetch_time = scheduled_fetch_time
+        return True
+
+class MemoryPostDB:
+    """MemoryPostDB keeps posts of a benchmark in memory.
+
+    It implements the PostDB methods used by process_feed.
+    """
+    def __init__(self):
+        self.posts = {}
+
+    def lookup_many(self, keys):
+        """Returns a dict of key to post for the keys found.
+        """
+        return {key: self.posts[key] for key in keys if key in self.posts}
+
+    def insert_many(self, posts):
+        """Inserts posts and returns the # of new ones.
+        """
+        num_inserted = 0
+        for post in posts:
+            if post.key not in self.posts:
+                self.posts[post.key] = post
+                num_inserted += 1
+        return num_inserted
+
+def percentile(values, q):
+    """Returns the q-th percentile of values (nearest rank), or 0 if empty.
+
+    Args:
+      values: A list of numbers.
+      q: A percentile in [0, 100].
+    """
+    if not values:
+        return 0
+    values = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(values)))
+    return values[rank - 1]
+
+def prepare_feeds(feed_db, feeds):
+    """Inserts corpus feeds missing from feeds table and reads them back.
+
+    Args:
+      feed_db: A FeedDB instance.
+      feeds: A list of Feed instances from the corpus.
+
+    Returns:
+      A list of Feed instances as read from feeds table.
+    """
+    stored_feeds = []
+    for feed in feeds:
+        stored_feed = feed_db.lookup_feed(feed.url_key)
+        if stored_feed is None:
+            feed_db.insert_feed(feed)
+            stored_feed = feed_db.lookup_feed(feed.url_key)
+        if stored_feed:
+            stored_feeds.append(stored_feed)
+    return stored_feeds
+
+def main(argv):
+    """main function.
+    """
+    corpus_path = ""
+    db = "memory"
+    mode = "test"
+    concurrency = crawler.DEFAULT_CONCURRENCY
+    per_host_limit = crawler.DEFAULT_PER_HOST_LIMIT
+    parse_workers = crawler.DEFAULT_PARSE_WORKERS
+    latency_scale = 0.0
+    repeat = 1
+
+    try:
+        opts, _ = getopt.getopt(
+            argv,"hc:r:",
+            ["corpus=","repeat=","db=","mode=","concurrency=",
+             "per_host_limit=","parse_workers=","latency_scale="])
+    except getopt.GetoptError:
+        # pylint: disable=line-too-long
+        print("benchmark_crawl.py -c <corpus dir> -r <repeat> --db=<memory(default), mysql> --mode=<prod, dev, test(default)> --concurrency=<concurrency> --per_host_limit=<limit> --parse_workers=<workers> --latency_scale=<scale>")
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == "-h":
+            # pylint: disable=line-too-long
+            print("benchmark_crawl.py -c <corpus dir> -r <repeat> --db=<memory(default), mysql> --mode=<prod, dev, test(default)> --concurrency=<concurrency> --per_host_limit=<limit> --parse_workers=<workers> --latency_scale=<scale>")
+            sys.exit()
+        elif opt in ("-c", "--corpus"):
+            corpus_path = arg
+        elif opt in ("-r", "--repeat"):
+            repeat = int(arg)
+        elif opt == "--db":
+            db = arg
+            if db not in ("memory", "mysql"):
+                print("Unknown 'db': %s" % db)
+                sys.exit(2)
+        elif opt == "--mode":
+            mode = arg
+            if mode not in ("prod", "dev", "test"):
+                print("Unknown 'mode': %s", mode)
+                sys.exit(2)
+        elif opt == "--concurrency":
+            concurrency = int(arg)
+        elif opt == "--per_host_limit":
+            per_host_limit = int(arg)
+        elif opt == "--parse_workers":
+            parse_workers = int(arg)
+        elif opt == "--latency_scale":
+            latency_scale = float(arg)
+    if not corpus_path:
+        print("'corpus' is required.")
+        sys.exit(2)
+
+    corpus = CrawlCorpus(corpus_path)
+    corpus_feeds = corpus.load_feeds()
+    if not corpus_feeds:
+        print("No feeds in the corpus: %s" % corpus_path)
+        sys.exit(1)
+    adapter = ReplayAdapter(corpus, latency_scale=latency_scale)
+    HttpFetcher.get_instance().mount(adapter)
+
+    # Keeps the items which were recent enough when recorded.
+    oldest_recorded_time = min(
+        recorded_time for _, recorded_time in corpus_feeds)
+    crawler.AGE_LIMIT_FOR_PAGE += (
+        datetime.utcnow() - oldest_recorded_time).total_seconds()
+
+    parse_executor = None
+    if parse_workers > 0:
+        parse_executor = ProcessPoolExecutor(max_workers=parse_workers)
+
+    metrics = CrawlMetrics()
+    durations = []
+    wall_time = 0.0
+    num_new_posts = 0
+    num_feeds = 0
+    for _ in range(repeat):
+        if db == "mysql":
+            feed_db = FeedDB(mode)
+            post_db = PostDB(mode)
+            feeds = prepare_feeds(
+                feed_db, [feed for feed, _ in corpus_feeds])
+        else:
+            feed_db = MemoryFeedDB()
+            post_db = MemoryPostDB()
+            # Fresh feeds, so no request is conditional.
+            feeds = [feed for feed, _ in corpus.load_feeds()]
+
+        start_time = time.perf_counter()
+        results = crawler.crawl_feeds(
+            feed_db, post_db, feeds, concurrency, per_host_limit,
+            parse_executor=parse_executor, metrics=metrics)
+        wall_time += time.perf_counter() - start_time
+        num_feeds += len(results)
+        num_new_posts += sum(new_posts for new_posts, _ in results)
+        durations.extend(duration for _, duration in results)
+
+    if parse_executor:
+        parse_executor.shutdown()
+
+    print("Corpus: %d feeds, %d requests not in the corpus" % (
+        len(corpus_feeds), adapter.num_misses))
+    print("%d feeds in %.3f secs: %.1f feeds/sec, %.1f items/sec, "
+          "%d new posts" % (
+              num_feeds, wall_time, num_feeds / wall_time,
+              metrics.num_items / wall_time, num_new_posts))
+    print("Per-feed latency: p50 %.1f ms, p99 %.1f ms, max %.1f ms" % (
+        percentile(durations, 50) * 1000, percentile(durations, 99) * 1000,
+        max(durations) * 1000))
+    if metrics.errors:
+        print("Errors: %s" % metrics.errors)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,163 @@
+"""Benchmarks feed reader backends on a corpus of feed documents.
+
+Parses every feed in the corpus with each backend and prints items per
+second and the peak RSS. Each backend runs in a fresh process, so the peak
+RSS of one backend doesn't hide the others.
+
+The corpus is util/testdata/*.xml and a synthetic RSS feed with
+--synthetic_items items (0 to skip it) unless --corpus is given.
+
+  Typical usage example:
+  $ PYTHONPATH=./ python3 tools/rss_crawler/benchmark_feed_readers.py \
+      --corpus=/tmp/feeds --repeat=10 --backends=soup,lxml
+"""
+from concurrent.futures import ProcessPoolExecutor
+import getopt
+import glob
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+from util.feed_reader_factory import (
+    FeedReaderFactory, READER_BACKENDS, infer_feed_type)
+
+logger = logging.getLogger()
+
+DEFAULT_CORPUS_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "..", "util", "testdata")
+DEFAULT_SYNTHETIC_ITEMS = 1000
+# Reads all the items of a feed.
+MAX_ITEMS = 1000000
+
+def create_synthetic_feed(num_items):
+    """Creates an RSS feed document with 'num_items' items.
+
+    Args:
+      num_items: The # of items.
+
+    Returns:
+      The feed as bytes.
+    """
+    items = []
+    for i in range(num_items):
+        items.append(
+            "<item><title>Post %d &amp; more</title>"
+            "<link>https://synthetic.example.com/%d</link>"
+            "<description><![CDATA[<p>%s</p>]]></description>"
+            "<dc:creator><![CDATA[Writer %d]]></dc:creator>"
+            "<pubDate>Mon, 05 Oct 2020 08:30:00 +0900</pubDate></item>" % (
+                i, i, "Some text to summarize. " * 40, i % 10))
+    return ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<rss version="2.0" '
+            'xmlns:dc="http://purl.org/dc/elements/1.1/"><channel>'
+            '<title>Synthetic</title>%s</channel></rss>' % "".join(
+                items)).encode("utf-8")
+
+def load_corpus(corpus_path, synthetic_items):
+    """Loads feed documents with their types.
+
+    Args:
+      corpus_path: A directory of *.xml feed documents.
+      synthetic_items: The # of items of a synthetic feed (0 to skip).
+
+    Returns:
+      A list of (url, feed type, content in bytes) tuples.
+    """
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(corpus_path, "*.xml"))):
+        with open(path, "rb") as feed_file:
+            content = feed_file.read()
+        url = "https://benchmark.example.com/" + os.path.basename(path)
+        feed_type = infer_feed_type(url, content)
+        if feed_type in ("RSS", "ATOM"):
+            corpus.append((url, feed_type, content))
+        else:
+            logger.warning("Skipping an unknown feed: %s", path)
+
+    if synthetic_items > 0:
+        corpus.append((
+            "https://synthetic.example.com/rss", "RSS",
+            create_synthetic_feed(synthetic_items)))
+    return corpus
+
+def run_backend(backend, corpus, repeat):
+    """Parses the corpus 'repeat' times with a backend.
+
+    Runs in a worker process.
+
+    Args:
+      backend: A reader backend.
+      corpus: A list of (url, feed type, content) tuples.
+      repeat: The # of times to parse the corpus.
+
+    Returns:
+      A tuple of (# of items, seconds, peak RSS in KB).
+    """
+    factory = FeedReaderFactory()
+    num_items = 0
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        for url, feed_type, content in corpus:
+            reader = factory.get_reader(
+                feed_type=feed_type, url=url, feed_content=content,
+                backend=backend)
+            num_items += len(reader.read(count=MAX_ITEMS))
+    duration = time.perf_counter() - start_time
+    return (num_items, duration,
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+def main(argv):
+    """main function.
+    """
+    corpus_path = DEFAULT_CORPUS_PATH
+    synthetic_items = DEFAULT_SYNTHETIC_ITEMS
+    repeat = 5
+    backends = list(READER_BACKENDS)
+
+    try:
+        opts, _ = getopt.getopt(
+            argv,"hc:r:b:",
+            ["corpus=","repeat=","backends=","synthetic_items="])
+    except getopt.GetoptError:
+        # pylint: disable=line-too-long
+        print("benchmark_feed_readers.py -c <corpus dir> -r <repeat> -b <backends: soup,lxml,stream> --synthetic_items=<items>")
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == "-h":
+            # pylint: disable=line-too-long
+            print("benchmark_feed_readers.py -c <corpus dir> -r <repeat> -b <backends: soup,lxml,stream> --synthetic_items=<items>")
+            sys.exit()
+        elif opt in ("-c", "--corpus"):
+            corpus_path = arg
+        elif opt in ("-r", "--repeat"):
+            repeat = int(arg)
+        elif opt in ("-b", "--backends"):
+            backends = arg.split(",")
+            for backend in backends:
+                if backend not in READER_BACKENDS:
+                    print("Unknown backend: %s" % backend)
+                    sys.exit(2)
+        elif opt == "--synthetic_items":
+            synthetic_items = int(arg)
+
+    corpus = load_corpus(corpus_path, synthetic_items)
+    print("Corpus: %d feeds, %d bytes" % (
+        len(corpus), sum(len(content) for _, _, content in corpus)))
+
+    # A fresh (spawned) process per backend to measure its own peak RSS.
+    context = multiprocessing.get_context("spawn")
+    for backend in backends:
+        with ProcessPoolExecutor(
+                max_workers=1, mp_context=context) as executor:
+            num_items, duration, peak_rss_kb = executor.submit(
+                run_backend, backend, corpus, repeat).result()
+        print("%-8s %8d items in %7.3f secs, %10.1f items/sec, "
+              "peak RSS %7.1f MB" % (
+                  backend, num_items, duration, num_items / duration,
+                  peak_rss_kb / 1024))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
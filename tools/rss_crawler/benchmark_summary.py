@@ -0,0 +1,70 @@
+"""Benchmarks summary extraction on post descriptions of various lengths.
+
+Compares extract_from_post (stops parsing once the summary is long enough)
+with the former BeautifulSoup implementation.
+
+  Typical usage example:
+  $ PYTHONPATH=./ python3 tools/rss_crawler/benchmark_summary.py \
+      --repeat=100
+"""
+import getopt
+import logging
+import sys
+import timeit
+
+from util.feed_text import extract_from_post, extract_from_post_with_soup
+
+logger = logging.getLogger()
+
+# The # of paragraphs of a description.
+DESCRIPTION_SIZES = (1, 10, 100, 1000)
+
+def create_description(num_paragraphs):
+    """Creates a full article description in HTML.
+
+    Args:
+      num_paragraphs: The # of paragraphs.
+
+    Returns:
+      An HTML string.
+    """
+    paragraph = (
+        "<p>리드모아 &amp; <b>readmoa</b> 본문 텍스트입니다. "
+        "<a href='https://www.example.com/'>A link</a> and more text.</p>\n")
+    return "<div class='article'>%s</div>" % (paragraph * num_paragraphs)
+
+def main(argv):
+    """main function.
+    """
+    repeat = 100
+
+    try:
+        opts, _ = getopt.getopt(argv,"hr:",["repeat="])
+    except getopt.GetoptError:
+        print("benchmark_summary.py -r <repeat>")
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == "-h":
+            print("benchmark_summary.py -r <repeat>")
+            sys.exit()
+        elif opt in ("-r", "--repeat"):
+            repeat = int(arg)
+
+    # Silences "Extracted summary" logs.
+    logger.setLevel(logging.WARNING)
+    for num_paragraphs in DESCRIPTION_SIZES:
+        description = create_description(num_paragraphs)
+        assert extract_from_post(description) == extract_from_post_with_soup(
+            description)
+
+        # pylint: disable=cell-var-from-loop
+        soup_secs = timeit.timeit(
+            lambda: extract_from_post_with_soup(description), number=repeat)
+        streaming_secs = timeit.timeit(
+            lambda: extract_from_post(description), number=repeat)
+        print("%8d chars: soup %8.3f ms, streaming %8.3f ms (%6.1fx)" % (
+            len(description), soup_secs * 1000 / repeat,
+            streaming_secs * 1000 / repeat, soup_secs / streaming_secs))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,75 @@
+"""Fills main images of recent posts without one.
+
+The RSS crawler inserts posts without main images and fills them in the
+background. This tool backfills posts the crawler didn't finish (e.g. the
+crawler ran with --enrich_workers=0).
+
+  Typical usage example:
+  $ PYTHONPATH=./ python3 tools/rss_crawler/enrich_images.py \
+      --mode=test --hours=24 --count=100 --workers=4 \
+      --metadata_cache=/tmp/page_metadata.sqlite3
+"""
+from datetime import datetime, timedelta
+import getopt
+import logging
+import sys
+
+from util.image_enricher import DEFAULT_NUM_WORKERS, ImageEnricher
+from util.page_metadata_cache import DEFAULT_CACHE_PATH, PageMetadataCache
+from util.post_db import PostDB
+
+logger = logging.getLogger()
+
+def main(argv):
+    """main function.
+    """
+    mode = "test"
+    hours = 24
+    count = 100
+    num_workers = DEFAULT_NUM_WORKERS
+    cache_path = DEFAULT_CACHE_PATH
+
+    try:
+        opts, _ = getopt.getopt(
+            argv,"hm:H:c:w:",
+            ["mode=","hours=","count=","workers=","metadata_cache="])
+    except getopt.GetoptError:
+        # pylint: disable=line-too-long
+        print("enrich_images.py -m <mode: prod, dev, test(default)> -H <hours> -c <count> -w <workers> --metadata_cache=<path, empty to disable>")
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == "-h":
+            # pylint: disable=line-too-long
+            print("enrich_images.py -m <mode: prod, dev, test(default)> -H <hours> -c <count> -w <workers> --metadata_cache=<path, empty to disable>")
+            sys.exit()
+        elif opt in ("-m", "--mode"):
+            mode = arg
+            if mode not in ("prod", "dev", "test"):
+                print("Unknown 'mode': %s", mode)
+                sys.exit(2)
+        elif opt in ("-H", "--hours"):
+            hours = int(arg)
+        elif opt in ("-c", "--count"):
+            count = int(arg)
+        elif opt in ("-w", "--workers"):
+            num_workers = int(arg)
+        elif opt == "--metadata_cache":
+            cache_path = arg
+
+    post_db = PostDB(mode)
+    posts = post_db.scan_missing_main_image(
+        since=datetime.utcnow() - timedelta(hours=hours), count=count)
+    print("Posts without a main image: %d" % len(posts))
+
+    cache = PageMetadataCache(cache_path) if cache_path else None
+    enricher = ImageEnricher(post_db, num_workers=num_workers, cache=cache)
+    enricher.start()
+    for post in posts:
+        enricher.enqueue(post)
+    enricher.stop()
+
+    print("Main images filled: %d, failed: %d, cache hits: %d" % (
+        enricher.num_enriched, enricher.num_failed, enricher.num_cache_hits))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
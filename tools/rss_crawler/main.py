@@ -5,99 +5,708 @@ to the post table.
 
   Typical usage example:
   $ PYTHONPATH=./ python3 tools/rss_crawler/main.py
+
+  Fetch up to 16 feeds at once (at most 2 per host) and parse them on 4
+  worker processes:
+  $ PYTHONPATH=./ python3 tools/rss_crawler/main.py --concurrency=16 \
+      --per_host_limit=2 --parse_workers=4 --enrich_workers=4
+
+  Write latency histograms and the slowest feeds of the run:
+  $ PYTHONPATH=./ python3 tools/rss_crawler/main.py \
+      --metrics_json=/tmp/crawl_metrics.json \
+      --metrics_prometheus=/tmp/crawl_metrics.prom
+
+  Run as a long-running scheduler which fetches each feed when it is due:
+  $ PYTHONPATH=./ python3 tools/rss_crawler/main.py --mode=prod --daemon
+
+  Run as one of several workers (on any machines) sharing the feeds table.
+  Due feeds are claimed with leases, so each is fetched by one worker:
+  $ PYTHONPATH=./ python3 tools/rss_crawler/main.py --mode=prod \
+      --worker=host1-0 --metrics_prometheus=/tmp/crawl_metrics.{worker}.prom
+
+  Record the responses of a crawl into a local corpus, and crawl again from
+  the corpus without network access (see benchmark_crawl.py):
+  $ PYTHONPATH=./ python3 tools/rss_crawler/main.py --force_fetch \
+      --record=/tmp/corpus
+  $ PYTHONPATH=./ python3 tools/rss_crawler/main.py --force_fetch \
+      --replay=/tmp/corpus
+
+  Failing feeds back off and are quarantined, and hosts which keep failing
+  are short-circuited (see util/circuit_breaker.py). List and release them
+  with tools/database/quarantined_feeds.py.
 """
-from datetime import datetime, timezone
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 import getopt
 import logging
 import sys
+import time
+from urllib.parse import urlparse
 
 import pytz
 import requests
-from util.feed_db import FeedDB, FeedFetchLogDB
+from util.circuit_breaker import CircuitBreaker, is_host_error
+from util.crawl_corpus import CrawlCorpus, RecordingAdapter, ReplayAdapter
+from util.crawl_metrics import CrawlMetrics, FeedMetrics
+from util.feed_db import DEFAULT_LEASE_SECS, FeedDB, HostStateDB
+from util.feed_fingerprint import body_fingerprint, link_fingerprint
+from util.feed_scheduler import FeedScheduler
+from util.http_fetcher import (
+    DEFAULT_POOL_CONNECTIONS, DEFAULT_POOL_MAXSIZE, HttpFetcher, read_capped)
+from util.image_enricher import DEFAULT_NUM_WORKERS, ImageEnricher
+from util.item_budget import MAX_ITEM_BUDGET, plan_items
+from util.page_metadata_cache import DEFAULT_CACHE_PATH, PageMetadataCache
 from util.post import post_from_feed_item
 from util.post_db import PostDB
-from util.feed_reader_factory import FeedReaderFactory, infer_feed_type
-from util.url import url_to_hashkey
+from util.feed_reader_factory import parse_feed_items, sniff_feed_type
 
 # Uncomment to output logging messages.
 #import sys
 #logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
 logger = logging.getLogger()
 
-MAX_NUM_RECORDS_TO_READ_PER_FEED = 2
+# Max bytes of a feed to download. The rest of a larger feed is dropped.
+MAX_FEED_BYTES = 4 * 1024 * 1024
+# Media types which can't be feeds. The body is not downloaded.
+NON_FEED_MEDIA_TYPE_PREFIXES = (
+    "image/", "audio/", "video/", "font/", "application/json",
+    "application/pdf", "application/zip")
+# The age window of a feed fetched right after the previous one. It widens
+# with the time since the last successful fetch (see util/item_budget.py).
 AGE_LIMIT_FOR_PAGE = 86400 * 1 # seconds
+# Feed reader backend. "stream" stops parsing once the item budget is read
+# (or MAX_ITEM_BUDGET items above the newest item of the previous fetch), or
+# that item or old items are reached.
+FEED_READER_BACKEND = "stream"
+# The number of feeds to process at the same time (1: sequential crawl).
+DEFAULT_CONCURRENCY = 1
+# The number of feeds to process at the same time for a single host.
+DEFAULT_PER_HOST_LIMIT = 2
+# The number of worker processes to parse feeds (0: parse in-process).
+DEFAULT_PARSE_WORKERS = 0
+# The number of threads to fill main images of new posts in the background
+# (0: leave them to tools/rss_crawler/enrich_images.py).
+DEFAULT_ENRICH_WORKERS = DEFAULT_NUM_WORKERS
+# How often the scheduler daemon looks up due feeds (e.g. newly added feeds)
+# from the feeds table.
+DEFAULT_REFRESH_INTERVAL = 600 # seconds
+# Min delay to fetch a feed again if its schedule wasn't moved forward (e.g.
+# processing the feed failed).
+MIN_RESCHEDULE_DELAY = 600 # seconds
+# How often a worker looks for due feeds when it has none.
+DEFAULT_POLL_INTERVAL = 30 # seconds
+# Feeds a worker claims at once per concurrent slot.
+CLAIMS_PER_SLOT = 4
+
+class FetchResult:
+    """FetchResult holds a response for a feed fetch.
+
+    Attributes:
+      status_code int: The HTTP status code.
+      content bytes: The body of the response (empty if not modified or
+        skipped).
+      etag string: The ETag header value.
+      last_modified string: The Last-Modified header value.
+      bytes_transferred int: The # of bytes read from the network.
+      skip_reason string: Why the body is not worth parsing ("" to parse).
+    """
+    def __init__(
+            self, status_code, content, etag="", last_modified="",
+            bytes_transferred=0, skip_reason=""):
+        self.status_code = status_code
+        self.content = content
+        self.etag = etag
+        self.last_modified = last_modified
+        self.bytes_transferred = bytes_transferred
+        self.skip_reason = skip_reason
+
+    def not_modified(self):
+        """True if the feed hasn't changed since the previous fetch.
+        """
+        return self.status_code == 304
+
+def is_non_feed_content_type(content_type):
+    """True if the content type can't be a feed (e.g. images, JSON).
+
+    Feeds are often served as text/html or text/plain, so those are checked
+    by the root element instead.
+
+    Args:
+      content_type: The Content-Type header value.
+
+    Returns:
+      True if the response should not be parsed as a feed.
+    """
+    media_type = content_type.split(";")[0].strip().lower()
+    return media_type.startswith(NON_FEED_MEDIA_TYPE_PREFIXES)
+
+def error_class_of_skip(fetch_result):
+    """Returns the error class of a fetch whose body was skipped.
+
+    Args:
+      fetch_result: A FetchResult instance with skip_reason.
+
+    Returns:
+      e.g. "HTTP 4xx", "HTTP 429", "NotAFeed".
+    """
+    # Too Many Requests is about the host, not the feed.
+    if fetch_result.status_code == 429:
+        return "HTTP 429"
+    if not 200 <= fetch_result.status_code < 300:
+        return "HTTP %dxx" % (fetch_result.status_code // 100)
+    return "NotAFeed"
+
+def record_host_result(breaker, host, error_class, now):
+    """Counts a fetch of a host on the circuit breaker.
+
+    Args:
+      breaker: A CircuitBreaker (None to skip).
+      host: The host of the fetched feed.
+      error_class: The error class of the fetch ("" if succeeded).
+      now: The current datetime (naive UTC).
+    """
+    if breaker is None:
+        return
+    if is_host_error(error_class):
+        breaker.record_failure(host, now)
+    else:
+        # The host responded, even if the feed is broken.
+        breaker.record_success(host)
+
+def failed_fetch_event(fetched_time, error_class):
+    """Returns a fetch event of a failed fetch for FeedDB.record_fetch.
+    """
+    return dict(
+        fetched_time=fetched_time, feed_updated=False,
+        newest_post_published_date=datetime(1970, 1, 1, tzinfo=pytz.UTC),
+        bytes_transferred=0, error_class=error_class)
+
+def sync_host_states(breaker, host_state_db):
+    """Saves host states changed by this process and loads all of them.
 
-def fetch_rss(url):
+    Args:
+      breaker: A CircuitBreaker.
+      host_state_db: A HostStateDB instance.
+    """
+    host_state_db.save(breaker.pop_changed())
+    breaker.load(host_state_db.load())
+
+def fetch_rss(url, etag="", last_modified="", max_bytes=MAX_FEED_BYTES):
     """Fetch RSS document from the given URL.
 
+    Sends a conditional GET request when validators from the previous fetch
+    are available. The body is streamed and read only if it is worth
+    parsing: the response is 2xx and looks like a feed. Reading stops at
+    'max_bytes' (items are listed newest first, so a cut feed still has the
+    latest items).
+
     Args:
       url: URL for RSS XML document.
+      etag: The ETag value from the previous fetch.
+      last_modified: The Last-Modified value from the previous fetch.
+      max_bytes: Max # of bytes to read.
 
     Returns:
-      The content of RSS document.
+      A FetchResult instance.
     """
-    rss_doc = requests.get(url)
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
 
-    if rss_doc.status_code != 200:
+    with HttpFetcher.get_instance().get(
+            url, headers=headers, stream=True) as rss_doc:
+        result = FetchResult(
+            status_code=rss_doc.status_code, content=b"",
+            etag=rss_doc.headers.get("ETag", ""),
+            last_modified=rss_doc.headers.get("Last-Modified", ""))
+        content_type = rss_doc.headers.get("Content-Type", "")
+
+        if result.not_modified():
+            return result
+        if not 200 <= rss_doc.status_code < 300:
+            logger.warning(
+                    "Failed to fetch with Response Code %d for %s",
+                    rss_doc.status_code, rss_doc.url)
+            result.skip_reason = "status %d" % rss_doc.status_code
+            return result
+        if is_non_feed_content_type(content_type):
+            logger.warning(
+                "Not a feed (Content-Type: %s): %s", content_type, url)
+            result.skip_reason = "content type %s" % content_type
+            return result
+
+        content, result.bytes_transferred, truncated = read_capped(
+            rss_doc, max_bytes)
+
+    if truncated:
+        logger.warning("Feed cut at %d bytes: %s", max_bytes, url)
+    if sniff_feed_type(content) == "UNKNOWN":
         logger.warning(
-                "Failed to fetch with Response Code %d for %s",
-                rss_doc.status_code, rss_doc.url)
+            "No feed root element (Content-Type: %s): %s", content_type, url)
+        result.skip_reason = "no feed root element"
+        return result
+
+    result.content = content
+    return result
+
+def parse_items(
+        feed, content, count, published_after, parse_executor=None):
+    """Parses the items of a fetched feed.
+
+    Parsing is CPU-bound, so it runs on a worker process if available. The
+    stored feed type saves inferring it from the document. Items seen by
+    the previous fetch are not parsed, and the new items above them are
+    read past 'count', up to MAX_ITEM_BUDGET.
+
+    Args:
+      feed: A Feed instance read from feeds table.
+      content: The fetched document.
+      count: The max # of items to read (the item budget).
+      published_after: Items published before this are not read.
+      parse_executor: A process pool (parsed in-process if None).
+
+    Returns:
+      A list of FeedItem instances.
+    """
+    if parse_executor:
+        return parse_executor.submit(
+            parse_feed_items, feed.url, content, count,
+            feed_type=feed.feed_type, backend=FEED_READER_BACKEND,
+            published_after=published_after,
+            stop_at_url=feed.latest_item_url,
+            max_count=MAX_ITEM_BUDGET).result()
+    return parse_feed_items(
+        feed.url, content, count, feed_type=feed.feed_type,
+        backend=FEED_READER_BACKEND, published_after=published_after,
+        stop_at_url=feed.latest_item_url, max_count=MAX_ITEM_BUDGET)
 
-    return rss_doc.content
+def unchanged_document(feed, fetch_result, fingerprints):
+    """True if a fetched document is the same as the last one read.
 
-def process_feed(feed_db, post_db, log_db, url):
+    Args:
+      feed: A Feed instance read from feeds table.
+      fetch_result: A FetchResult with the document.
+      fingerprints: A dict which "body_fingerprint" and "link_fingerprint"
+        of the document are set to.
+    """
+    fingerprints["body_fingerprint"] = body_fingerprint(fetch_result.content)
+    if (fingerprints["body_fingerprint"] and
+            fingerprints["body_fingerprint"] == feed.body_fingerprint):
+        return True
+    # The same items with e.g. a new build time or an edited summary.
+    fingerprints["link_fingerprint"] = link_fingerprint(fetch_result.content)
+    return bool(
+        fingerprints["link_fingerprint"] and
+        fingerprints["link_fingerprint"] == feed.link_fingerprint)
+
+def process_feed(
+        feed_db, post_db, feed, parse_executor=None, enricher=None,
+        feed_metrics=None, breaker=None):
     """Process one feed.
 
-    Fetches a web feed, insert new posts into posts table.
+    Fetches a web feed, insert new posts into posts table, then logs the
+    fetch and updates the schedule of the feed in one transaction. The
+    document is parsed once: up to the item budget of the feed, or up to
+    the high-water mark (at most MAX_ITEM_BUDGET items). A document whose
+    body or item links match the fingerprints of the last one read is not
+    parsed. A feed whose host circuit is open is not fetched but deferred
+    until the circuit half-opens.
 
     Args:
       feed_db: Feeds database instance.
       post_db: Posts database instance.
-      url: URL for RSS XML document.
+      feed: A Feed instance read from feeds table (updated in place).
+      parse_executor: A process pool to parse the feed (parsed in-process if
+        None).
+      enricher: An ImageEnricher to fill main images of new posts (optional).
+      feed_metrics: A FeedMetrics to record timings and counts (optional).
+      breaker: A CircuitBreaker of hosts (optional).
 
     Returns:
       The # of new posts inserted into posts table.
     """
-    feed_content = fetch_rss(url)
+    url = feed.url
+    host = urlparse(url).netloc
+    if feed_metrics is None:
+        feed_metrics = FeedMetrics(url)
 
-    feed_type = infer_feed_type(url, feed_content)
-    reader = FeedReaderFactory().get_reader(
-        feed_type=feed_type, url=url, feed_content=feed_content)
-    fetched_time = datetime.utcnow()
+    now = datetime.utcnow()
+    if breaker and not breaker.allow(host, now):
+        deferred_until = breaker.open_until(host)
+        if deferred_until is None or deferred_until <= now:
+            # Half-open with a probe running.
+            deferred_until = now + timedelta(seconds=MIN_RESCHEDULE_DELAY)
+        logger.info("Circuit open, deferred to %s: %s", deferred_until, url)
+        feed_metrics.error_class = "CircuitOpen"
+        with feed_metrics.time("db"):
+            feed_db.defer_feed(feed, deferred_until)
+        return 0
 
-    items = reader.read(count=MAX_NUM_RECORDS_TO_READ_PER_FEED)
+    fetch_error = None
+    with feed_metrics.time("fetch"):
+        try:
+            fetch_result = fetch_rss(
+                url, etag=feed.etag, last_modified=feed.last_modified)
+        except requests.RequestException as ex:
+            fetch_error = ex
+    fetched_time = datetime.utcnow()
+    if fetch_error is not None:
+        feed_metrics.error_class = type(fetch_error).__name__
+        logger.warning(
+            "Failed to fetch (%s): %s", feed_metrics.error_class, url)
+        record_host_result(
+            breaker, host, feed_metrics.error_class, fetched_time)
+        with feed_metrics.time("db"):
+            feed_db.record_fetch(feed, failed_fetch_event(
+                fetched_time, feed_metrics.error_class))
+        return 0
+    feed_metrics.bytes_transferred = fetch_result.bytes_transferred
+    if fetch_result.skip_reason:
+        feed_metrics.error_class = error_class_of_skip(fetch_result)
+    record_host_result(breaker, host, feed_metrics.error_class, fetched_time)
 
     num_new_posts = 0
     newest_post_published_date = datetime(1970, 1, 1, tzinfo=pytz.UTC)
-    for item in items:
-        post = post_from_feed_item(item)
-        logger.info(
-            "Incoming link: Key - %s (published: %s), URL - %s", post.key,
-            post.published_date, post.post_url)
-        age = datetime.now(timezone.utc) - post.published_date
-        if age.total_seconds() > AGE_LIMIT_FOR_PAGE:
-            logging.info("Too old - %s, %s ago", post.published_date, age)
-            continue
+    # HTTP cache validators are stored only with a read response.
+    validators = {}
+    # The newest item, where the next fetch stops reading (the high-water
+    # mark), and the fingerprints of the document. Kept as they are unless
+    # all the new posts are stored.
+    high_water_mark = {}
+    # The item budget of this fetch, which the next budget is planned from.
+    budget_usage = {}
+    fingerprints = {}
+    if fetch_result.not_modified():
+        logger.info("Not modified since the previous fetch: %s", url)
+    elif fetch_result.skip_reason:
+        logger.info("Skipped parsing (%s): %s", fetch_result.skip_reason, url)
+    elif unchanged_document(feed, fetch_result, fingerprints):
+        logger.info("Same document as the previous fetch: %s", url)
+        high_water_mark = fingerprints
+        validators = {
+            "etag": fetch_result.etag,
+            "last_modified": fetch_result.last_modified}
+    else:
+        budget, window_secs = plan_items(
+            feed, fetched_time, min_window_secs=AGE_LIMIT_FOR_PAGE)
+        published_after = datetime.now(timezone.utc) - timedelta(
+            seconds=window_secs)
+        with feed_metrics.time("parse"):
+            # Without a high-water mark, the budget is all that can
+            # plausibly be new; filling it doubles the next budget.
+            items = parse_items(
+                feed, fetch_result.content, budget, published_after,
+                parse_executor=parse_executor)
+            if len(items) >= budget:
+                logger.info(
+                    "Item budget %d filled (%d items): %s",
+                    budget, len(items), url)
+            feed_metrics.num_items = len(items)
+            budget_usage = {"item_budget": budget, "num_items": len(items)}
 
-        if not post_db.lookup(post.key):
-            num_new_posts += 1
-            post_db.insert(post)
+            posts = []
+            for item in items:
+                # Main images are filled later not to block the crawl.
+                post = post_from_feed_item(item, fetch_main_image=False)
+                logger.info(
+                    "Incoming link: Key - %s (published: %s), URL - %s",
+                    post.key, post.published_date, post.post_url)
+                age = datetime.now(timezone.utc) - post.published_date
+                if age.total_seconds() > window_secs:
+                    logging.info(
+                        "Too old - %s, %s ago", post.published_date, age)
+                    continue
+                posts.append(post)
 
-        # Keeps the newest published time.
-        if post.published_date > newest_post_published_date:
-            newest_post_published_date = post.published_date
+                # Keeps the newest published time.
+                if post.published_date > newest_post_published_date:
+                    newest_post_published_date = post.published_date
 
-    # Log a feed fetch event.
-    url_key = url_to_hashkey(url)
-    feed_updated = (num_new_posts > 0)
+        with feed_metrics.time("db"):
+            # One read and one write per feed. Posts inserted by someone else
+            # in between are skipped by INSERT IGNORE.
+            existing_posts = post_db.lookup_many([post.key for post in posts])
+            new_posts = [
+                post for post in posts if post.key not in existing_posts]
+            num_new_posts = post_db.insert_many(new_posts)
+            if enricher:
+                for post in new_posts:
+                    enricher.enqueue(post)
+        if num_new_posts == len(new_posts):
+            if items:
+                high_water_mark = {
+                    "latest_item_url": items[0].url,
+                    "latest_item_title": items[0].title}
+            high_water_mark.update(fingerprints)
+        validators = {
+            "etag": fetch_result.etag,
+            "last_modified": fetch_result.last_modified}
+    feed_metrics.num_new_posts = num_new_posts
 
-    feed = feed_db.lookup_feed(url_key)
-    log_db.log(
-        url_key, fetched_time, feed_updated, newest_post_published_date,
-        feed.changerate, feed.scheduled_fetch_time)
-    feed_db.update_changerate(url_key)
+    # Log a feed fetch event (a 304 response or the same document is logged
+    # as not updated). A skipped response counts as a failure of the feed.
+    with feed_metrics.time("db"):
+        feed_db.record_fetch(feed, dict(
+            fetched_time=fetched_time, feed_updated=(num_new_posts > 0),
+            newest_post_published_date=newest_post_published_date,
+            bytes_transferred=fetch_result.bytes_transferred,
+            error_class=feed_metrics.error_class, **validators,
+            **high_water_mark, **budget_usage))
     return num_new_posts
 
+def crawl_feed(
+        feed_db, post_db, feed, parse_executor=None, enricher=None,
+        metrics=None, breaker=None):
+    """Processes one feed and measures the time spent on it.
+
+    Fetch, HTTP and document errors are counted as failures of the feed by
+    process_feed. Any other error is a bug of the crawler (e.g. in parsing,
+    post building or the DBs): it is logged and the feed is deferred by its
+    changerate, without counting toward its backoff nor quarantine. Neither
+    stops the rest of the crawl.
+
+    Args:
+      feed_db: Feeds database instance.
+      post_db: Posts database instance.
+      feed: A Feed instance to process.
+      parse_executor: A process pool to parse the feed (optional).
+      enricher: An ImageEnricher to fill main images (optional).
+      metrics: A CrawlMetrics to add the measurements of the feed to
+        (optional).
+      breaker: A CircuitBreaker of hosts (optional).
+
+    Returns:
+      A tuple of (# of new posts, processing time in seconds).
+    """
+    print("RSS processing started for ", feed.url)
+    feed_metrics = FeedMetrics(feed.url)
+    num_new_posts = 0
+    with feed_metrics.time("total"):
+        try:
+            num_new_posts = process_feed(
+                feed_db, post_db, feed,
+                parse_executor=parse_executor, enricher=enricher,
+                feed_metrics=feed_metrics, breaker=breaker)
+        # pylint: disable=broad-except
+        except Exception as ex:
+            logger.exception("RSS processing failed for %s: %s", feed.url, ex)
+            feed_metrics.error_class = type(ex).__name__
+            feed_db.defer_feed(feed, datetime.utcnow() + timedelta(
+                seconds=max(feed.changerate or 0, MIN_RESCHEDULE_DELAY)))
+    duration = feed_metrics.durations["total"]
+    if metrics:
+        metrics.add_feed(feed_metrics)
+    print(
+        "RSS processing completed for %s (%d new posts, %.2f secs)." %
+        (feed.url, num_new_posts, duration))
+    return num_new_posts, duration
+
+async def crawl_feeds_async(
+        feed_db, post_db, feeds, concurrency, per_host_limit,
+        parse_executor=None, enricher=None, metrics=None, breaker=None):
+    """Processes feeds concurrently.
+
+    Blocking fetches and DB writes run on a thread pool. A global semaphore
+    bounds the number of feeds in flight and a semaphore per host keeps the
+    crawler from hammering a single web server.
+
+    Args:
+      feed_db: Feeds database instance.
+      post_db: Posts database instance.
+      feeds: A list of Feed instances to process.
+      concurrency: Max # of feeds to process at the same time.
+      per_host_limit: Max # of feeds to process at the same time per host.
+      parse_executor: A process pool to parse feeds (optional).
+      enricher: An ImageEnricher to fill main images (optional).
+      metrics: A CrawlMetrics to collect measurements (optional).
+      breaker: A CircuitBreaker of hosts (optional).
+
+    Returns:
+      A list of (# of new posts, processing time in seconds) per feed.
+    """
+    loop = asyncio.get_running_loop()
+    global_limit = asyncio.Semaphore(concurrency)
+    host_limits = {}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        async def crawl_one(feed):
+            host = urlparse(feed.url).netloc
+            if host not in host_limits:
+                host_limits[host] = asyncio.Semaphore(per_host_limit)
+            # Waits for the host first not to hold a global slot idle.
+            async with host_limits[host]:
+                async with global_limit:
+                    return await loop.run_in_executor(
+                        executor, crawl_feed, feed_db, post_db, feed,
+                        parse_executor, enricher, metrics, breaker)
+
+        return await asyncio.gather(*[crawl_one(feed) for feed in feeds])
+
+def crawl_feeds(
+        feed_db, post_db, feeds, concurrency, per_host_limit,
+        parse_executor=None, enricher=None, metrics=None, breaker=None):
+    """Processes feeds sequentially or concurrently.
+
+    Args:
+      feed_db: Feeds database instance.
+      post_db: Posts database instance.
+      feeds: A list of Feed instances to process.
+      concurrency: Max # of feeds to process at the same time.
+      per_host_limit: Max # of feeds to process at the same time per host.
+      parse_executor: A process pool to parse feeds (optional).
+      enricher: An ImageEnricher to fill main images (optional).
+      metrics: A CrawlMetrics to collect measurements (optional).
+      breaker: A CircuitBreaker of hosts (optional).
+
+    Returns:
+      A list of (# of new posts, processing time in seconds) per feed.
+    """
+    # Feeds of a host are processed one after another to reuse its pooled
+    # connections.
+    feeds = sorted(feeds, key=lambda feed: urlparse(feed.url).netloc)
+    if concurrency > 1:
+        return asyncio.run(crawl_feeds_async(
+            feed_db, post_db, feeds, concurrency, per_host_limit,
+            parse_executor=parse_executor, enricher=enricher,
+            metrics=metrics, breaker=breaker))
+
+    return [
+        crawl_feed(
+            feed_db, post_db, feed, parse_executor=parse_executor,
+            enricher=enricher, metrics=metrics, breaker=breaker)
+        for feed in feeds]
+
+def run_scheduler(
+        feed_db, post_db, concurrency, per_host_limit,
+        parse_executor=None, enricher=None,
+        refresh_interval=DEFAULT_REFRESH_INTERVAL, metrics=None,
+        metrics_json_path="", metrics_prometheus_path="", breaker=None,
+        host_state_db=None):
+    """Runs the crawler as a long-running scheduler.
+
+    Feeds are kept in a min-heap keyed on scheduled_fetch_time. The scheduler
+    sleeps until the next feed is due, processes all due feeds and puts them
+    back with the schedule updated by FeedDB.record_fetch. The feeds
+    table is only queried for feeds due before the next refresh, which also
+    picks up newly added feeds. Quarantined feeds are dropped.
+
+    Args:
+      feed_db: Feeds database instance.
+      post_db: Posts database instance.
+      concurrency: Max # of feeds to process at the same time.
+      per_host_limit: Max # of feeds to process at the same time per host.
+      parse_executor: A process pool to parse feeds (optional).
+      enricher: An ImageEnricher to fill main images (optional).
+      refresh_interval: Seconds between lookups of due feeds.
+      metrics: A CrawlMetrics to collect measurements (optional).
+      metrics_json_path: A path to write metrics as JSON after each batch.
+      metrics_prometheus_path: A path to write metrics in the Prometheus
+        text format after each batch.
+      breaker: A CircuitBreaker of hosts (optional).
+      host_state_db: A HostStateDB to persist the breaker after each batch
+        (optional).
+    """
+    scheduler = FeedScheduler()
+    next_refresh_time = datetime.utcnow()
+
+    while True:
+        now = datetime.utcnow()
+        if now >= next_refresh_time:
+            next_refresh_time = now + timedelta(seconds=refresh_interval)
+            due_feeds = feed_db.scan_due_feeds(due_time=next_refresh_time)
+            for feed in due_feeds:
+                if feed.url_key not in scheduler:
+                    scheduler.push(feed)
+            logger.info(
+                "[Scheduler] %d feeds due by %s, %d scheduled.",
+                len(due_feeds), next_refresh_time, len(scheduler))
+
+        due_feeds = scheduler.pop_due(now)
+        if due_feeds:
+            results = crawl_feeds(
+                feed_db, post_db, due_feeds, concurrency,
+                per_host_limit, parse_executor=parse_executor,
+                enricher=enricher, metrics=metrics, breaker=breaker)
+            if breaker and host_state_db:
+                sync_host_states(breaker, host_state_db)
+            if metrics:
+                metrics.write(metrics_json_path, metrics_prometheus_path)
+            print("[Scheduler] processed %d feeds (%d new posts)." % (
+                len(results), sum(num_new_posts for num_new_posts, _ in results)))
+
+            min_next_fetch_time = datetime.utcnow() + timedelta(
+                seconds=MIN_RESCHEDULE_DELAY)
+            for due_feed in due_feeds:
+                # Reads the schedule updated by record_fetch. A deleted or
+                # quarantined feed is dropped from the scheduler.
+                feed = feed_db.lookup_feed(due_feed.url_key)
+                if feed and not feed.quarantined_time:
+                    scheduler.push(feed, scheduled_fetch_time=max(
+                        feed.scheduled_fetch_time, min_next_fetch_time))
+            continue
+
+        wake_up_time = next_refresh_time
+        next_fetch_time = scheduler.next_fetch_time()
+        if next_fetch_time is not None and next_fetch_time < wake_up_time:
+            wake_up_time = next_fetch_time
+        time.sleep(max(0, (wake_up_time - datetime.utcnow()).total_seconds()))
+
+def run_worker(
+        feed_db, post_db, worker_id, concurrency, per_host_limit,
+        parse_executor=None, enricher=None, lease_secs=DEFAULT_LEASE_SECS,
+        poll_interval=DEFAULT_POLL_INTERVAL, metrics=None,
+        metrics_json_path="", metrics_prometheus_path="", breaker=None,
+        host_state_db=None):
+    """Runs the crawler as one of several workers sharing the feeds table.
+
+    The worker claims due feeds in batches (FeedDB.claim_due_feeds) and
+    processes them. FeedDB.record_fetch releases each lease with the new
+    schedule, backing off failed feeds. Feeds of a dead worker are claimed
+    again when their lease expires. Open circuits are shared with other
+    workers through host_state_db.
+
+    Args:
+      feed_db: Feeds database instance.
+      post_db: Posts database instance.
+      worker_id: A unique name of the worker (e.g. hostname-index).
+      concurrency: Max # of feeds to process at the same time.
+      per_host_limit: Max # of feeds to process at the same time per host.
+      parse_executor: A process pool to parse feeds (optional).
+      enricher: An ImageEnricher to fill main images (optional).
+      lease_secs: Seconds to hold claimed feeds. It should cover a batch.
+      poll_interval: Seconds to wait when no feed is due.
+      metrics: A CrawlMetrics to collect measurements (optional).
+      metrics_json_path: A path to write metrics as JSON after each batch.
+      metrics_prometheus_path: A path to write metrics in the Prometheus
+        text format after each batch.
+      breaker: A CircuitBreaker of hosts (optional).
+      host_state_db: A HostStateDB to persist the breaker after each batch
+        (optional).
+    """
+    batch_size = concurrency * CLAIMS_PER_SLOT
+    while True:
+        feeds = feed_db.claim_due_feeds(
+            worker_id, datetime.utcnow(), count=batch_size,
+            lease_secs=lease_secs)
+        if not feeds:
+            time.sleep(poll_interval)
+            continue
+
+        results = crawl_feeds(
+            feed_db, post_db, feeds, concurrency, per_host_limit,
+            parse_executor=parse_executor, enricher=enricher, metrics=metrics,
+            breaker=breaker)
+        if breaker and host_state_db:
+            sync_host_states(breaker, host_state_db)
+        if metrics:
+            metrics.write(metrics_json_path, metrics_prometheus_path)
+        print("[Worker %s] processed %d feeds (%d new posts)." % (
+            worker_id, len(results),
+            sum(num_new_posts for num_new_posts, _ in results)))
+
 def main(argv):
     """Main entry point.
 
@@ -108,16 +717,34 @@ def main(argv):
     """
     mode = "test"
     force_fetch = False
+    concurrency = DEFAULT_CONCURRENCY
+    per_host_limit = DEFAULT_PER_HOST_LIMIT
+    parse_workers = DEFAULT_PARSE_WORKERS
+    enrich_workers = DEFAULT_ENRICH_WORKERS
+    metadata_cache_path = DEFAULT_CACHE_PATH
+    daemon = False
+    refresh_interval = DEFAULT_REFRESH_INTERVAL
+    metrics_json_path = ""
+    metrics_prometheus_path = ""
+    worker_id = ""
+    lease_secs = DEFAULT_LEASE_SECS
+    record_path = ""
+    replay_path = ""
     try:
-        opts, _ = getopt.getopt(argv,"hm:f:",["mode=", "force_fetch"])
+        opts, _ = getopt.getopt(
+            argv,"hm:f:c:p:",
+            ["mode=", "force_fetch", "concurrency=", "per_host_limit=",
+             "parse_workers=", "enrich_workers=", "metadata_cache=", "daemon",
+             "refresh_interval=", "metrics_json=", "metrics_prometheus=",
+             "worker=", "lease_secs=", "record=", "replay="])
     except getopt.GetoptError:
         # pylint: disable=line-too-long
-        print("main.py -m <mode: prod, dev, test(default)> -f ")
+        print("main.py -m <mode: prod, dev, test(default)> -f -c <concurrency> --per_host_limit=<limit> -p <parse_workers> --enrich_workers=<workers> --metadata_cache=<path> --daemon --refresh_interval=<secs> --metrics_json=<path> --metrics_prometheus=<path> --worker=<id> --lease_secs=<secs> --record=<corpus dir> --replay=<corpus dir>")
         sys.exit(2)
     for opt, arg in opts:
         if opt == "-h":
             # pylint: disable=line-too-long
-            print("main.py -m <mode: prod, dev, test(default)> -f ")
+            print("main.py -m <mode: prod, dev, test(default)> -f -c <concurrency> --per_host_limit=<limit> -p <parse_workers> --enrich_workers=<workers> --metadata_cache=<path> --daemon --refresh_interval=<secs> --metrics_json=<path> --metrics_prometheus=<path> --worker=<id> --lease_secs=<secs> --record=<corpus dir> --replay=<corpus dir>")
             sys.exit()
         elif opt in ("-m", "--mode"):
             mode = arg
@@ -126,33 +753,191 @@ def main(argv):
                 sys.exit(2)
         elif opt in ("-f", "--force_fetch"):
             force_fetch = True
+        elif opt in ("-c", "--concurrency"):
+            concurrency = int(arg)
+            if concurrency < 1:
+                print("'concurrency' should be positive: %d" % concurrency)
+                sys.exit(2)
+        elif opt == "--per_host_limit":
+            per_host_limit = int(arg)
+            if per_host_limit < 1:
+                print("'per_host_limit' should be positive: %d" %
+                      per_host_limit)
+                sys.exit(2)
+        elif opt in ("-p", "--parse_workers"):
+            parse_workers = int(arg)
+            if parse_workers < 0:
+                print("'parse_workers' should not be negative: %d" %
+                      parse_workers)
+                sys.exit(2)
+        elif opt == "--enrich_workers":
+            enrich_workers = int(arg)
+            if enrich_workers < 0:
+                print("'enrich_workers' should not be negative: %d" %
+                      enrich_workers)
+                sys.exit(2)
+        elif opt == "--metadata_cache":
+            # An empty path disables the cache.
+            metadata_cache_path = arg
+        elif opt == "--daemon":
+            daemon = True
+        elif opt == "--refresh_interval":
+            refresh_interval = int(arg)
+            if refresh_interval < 1:
+                print("'refresh_interval' should be positive: %d" %
+                      refresh_interval)
+                sys.exit(2)
+        elif opt == "--metrics_json":
+            metrics_json_path = arg
+        elif opt == "--metrics_prometheus":
+            metrics_prometheus_path = arg
+        elif opt == "--worker":
+            worker_id = arg
+        elif opt == "--lease_secs":
+            lease_secs = int(arg)
+            if lease_secs < 1:
+                print("'lease_secs' should be positive: %d" % lease_secs)
+                sys.exit(2)
+        elif opt == "--record":
+            record_path = arg
+        elif opt == "--replay":
+            replay_path = arg
+
+    if record_path and (daemon or worker_id or replay_path):
+        print("'record' works with a one-time crawl only.")
+        sys.exit(2)
+    corpus = None
+    if record_path:
+        corpus = CrawlCorpus(record_path)
+        HttpFetcher.get_instance().mount(RecordingAdapter(
+            corpus, pool_connections=DEFAULT_POOL_CONNECTIONS,
+            pool_maxsize=DEFAULT_POOL_MAXSIZE))
+    elif replay_path:
+        HttpFetcher.get_instance().mount(
+            ReplayAdapter(CrawlCorpus(replay_path)))
 
     post_db = PostDB(mode)
     feed_db = FeedDB(mode)
-    log_db = FeedFetchLogDB(mode)
+    # Open circuits carry across runs and are shared by workers.
+    host_state_db = HostStateDB(mode)
+    breaker = CircuitBreaker()
+    breaker.load(host_state_db.load())
+
+    # "{worker}" in metrics paths is replaced with the worker ID, so workers
+    # on a machine write their own files.
+    metrics = CrawlMetrics(worker=worker_id)
+    metrics_json_path = metrics_json_path.replace("{worker}", worker_id)
+    metrics_prometheus_path = metrics_prometheus_path.replace(
+        "{worker}", worker_id)
+    parse_executor = None
+    if parse_workers > 0:
+        parse_executor = ProcessPoolExecutor(max_workers=parse_workers)
+
+    enricher = None
+    if enrich_workers > 0:
+        cache = None
+        if metadata_cache_path:
+            cache = PageMetadataCache(metadata_cache_path)
+        enricher = ImageEnricher(
+            post_db, num_workers=enrich_workers, cache=cache, metrics=metrics)
+        enricher.start()
+
+    if worker_id:
+        print("[Worker %s] began at %s" % (worker_id, datetime.utcnow()))
+        try:
+            run_worker(
+                feed_db, post_db, worker_id, concurrency, per_host_limit,
+                parse_executor=parse_executor, enricher=enricher,
+                lease_secs=lease_secs, metrics=metrics,
+                metrics_json_path=metrics_json_path,
+                metrics_prometheus_path=metrics_prometheus_path,
+                breaker=breaker, host_state_db=host_state_db)
+        except KeyboardInterrupt:
+            print("[Worker %s] stopped at %s" % (worker_id, datetime.utcnow()))
+        finally:
+            if parse_executor:
+                parse_executor.shutdown()
+            if enricher:
+                enricher.stop()
+        return
+
+    if daemon:
+        print("[RSS scheduler] began at %s" % (datetime.utcnow()))
+        try:
+            run_scheduler(
+                feed_db, post_db, concurrency, per_host_limit,
+                parse_executor=parse_executor, enricher=enricher,
+                refresh_interval=refresh_interval, metrics=metrics,
+                metrics_json_path=metrics_json_path,
+                metrics_prometheus_path=metrics_prometheus_path,
+                breaker=breaker, host_state_db=host_state_db)
+        except KeyboardInterrupt:
+            print("[RSS scheduler] stopped at %s" % (datetime.utcnow()))
+        finally:
+            if parse_executor:
+                parse_executor.shutdown()
+            if enricher:
+                enricher.stop()
+        return
 
     feeds = feed_db.scan_feeds(start_idx=0, count=10000)
 
-    total_new_posts = 0
     rss_import_start_time = datetime.utcnow()
     print("[RSS import] began at %s" % (rss_import_start_time))
+    due_feeds = []
     for feed in feeds:
-        if force_fetch or datetime.utcnow() > feed.scheduled_fetch_time:
-            print("RSS processing started for ", feed.url)
-            num_new_posts = process_feed(feed_db, post_db, log_db, feed.url)
-            total_new_posts += num_new_posts
-            print(
-                "RSS processing completed for %s (%d new posts)." %
-                (feed.url, num_new_posts))
+        if feed.quarantined_time:
+            print("RSS processing skipped (quarantined since %s): %s" %
+                  (feed.quarantined_time, feed.url))
+        elif force_fetch or datetime.utcnow() > feed.scheduled_fetch_time:
+            due_feeds.append(feed)
         else:
             print(
                 "RSS processing skipped (scheduled at %s): %s" %
                 (feed.scheduled_fetch_time, feed.url))
 
+    if corpus:
+        corpus.save_feeds(due_feeds)
+
+    wall_start_time = time.monotonic()
+    results = crawl_feeds(
+        feed_db, post_db, due_feeds, concurrency, per_host_limit,
+        parse_executor=parse_executor, enricher=enricher, metrics=metrics,
+        breaker=breaker)
+    wall_time = time.monotonic() - wall_start_time
+    host_state_db.save(breaker.pop_changed())
+
+    if parse_executor:
+        parse_executor.shutdown()
+    if enricher:
+        # Waits for main images of the new posts.
+        enricher.stop()
+        print(
+            "[RSS import] main images filled: %d, failed: %d, cache hits: %d"
+            % (enricher.num_enriched, enricher.num_failed,
+               enricher.num_cache_hits))
+
+    total_new_posts = sum(num_new_posts for num_new_posts, _ in results)
+    summed_feed_time = sum(duration for _, duration in results)
     rss_import_end_time = datetime.utcnow()
     print("[RSS import] completed (%d new posts) at %s (duration: %s)" % (
         total_new_posts, rss_import_end_time,
         rss_import_end_time - rss_import_start_time))
+    print(
+        "[RSS import] %d feeds, wall time: %.2f secs, summed per-feed time: "
+        "%.2f secs (concurrency: %d, speedup: %.2fx)" % (
+            len(results), wall_time, summed_feed_time, concurrency,
+            summed_feed_time / wall_time if wall_time > 0 else 1.0))
+    print("[RSS import] fetch/parse/db/enrich secs: %s" % ", ".join(
+        "%s %.2f" % (stage, metrics.histograms[stage].sum)
+        for stage in ("fetch", "parse", "db", "enrich")))
+    if metrics.errors:
+        print("[RSS import] errors: %s" % metrics.errors)
+    for feed_metrics in metrics.slowest_feeds():
+        print("[RSS import] slow feed: %.2f secs %s %s" % (
+            feed_metrics.durations.get("total", 0.0), feed_metrics.durations,
+            feed_metrics.url))
+    metrics.write(metrics_json_path, metrics_prometheus_path)
 
 if __name__ == "__main__":
     main(sys.argv[1:])
@@ -8,8 +8,8 @@ import getopt
 import logging
 import sys
 
-import requests
 from util.feed_reader_factory import FeedReaderFactory
+from util.http_fetcher import HttpFetcher
 
 logger = logging.getLogger()
 
@@ -41,7 +41,7 @@ def main(argv):
                 print("Unknown 'feed_type': %s" % feed_type)
                 sys.exit(2)
 
-    feed = requests.get(url)
+    feed = HttpFetcher.get_instance().get(url)
 
     if feed.status_code != 200:
         logger.warning(
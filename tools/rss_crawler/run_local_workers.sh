@@ -0,0 +1,28 @@
+#!/bin/bash
+#
+# Runs crawler workers on this machine, sharing the feeds table through
+# leases. Each worker writes its own metrics to /tmp.
+#
+# $ ./tools/rss_crawler/run_local_workers.sh test 4 --concurrency=8
+
+mode=$1
+num_workers=$2
+shift 2
+
+echo "----------------------------------------------"
+echo "START $num_workers crawler workers ($mode)"
+echo "----------------------------------------------"
+
+# Stops all the workers on Ctrl-C.
+trap 'kill $(jobs -p) 2>/dev/null' INT TERM EXIT
+
+for ((i = 0; i < num_workers; i++)); do
+    worker=$(hostname)-$i
+    echo Starting worker: $worker
+    PYTHONPATH=./ python3 tools/rss_crawler/main.py --mode=$mode \
+        --worker=$worker \
+        --metrics_json=/tmp/crawl_metrics.$worker.json \
+        --metrics_prometheus=/tmp/crawl_metrics.$worker.prom "$@" &
+done
+
+wait
@@ -0,0 +1,395 @@
+"""Changerate estimation and backtesting of fetch schedules.
+
+  A changerate is the interval in seconds to fetch a feed again. It is
+  estimated from the publication times found in the fetch log of the feed:
+  an EWMA of the intervals between publications, moved earlier by their
+  deviation so a fetch comes shortly before the next post is expected.
+  The crawler keeps the EWMA on the feed row (ChangerateState) and adds
+  one publication per fetch.
+
+  Typical usage example:
+
+  from util.changerate import estimate_changerate
+
+  events = FeedFetchLogDB(mode).scan(url_key, count=CHANGERATE_HISTORY)
+  changerate = estimate_changerate(events).changerate
+"""
+from datetime import datetime, timedelta, timezone
+import logging
+import math
+
+logger = logging.getLogger()
+
+DEFAULT_CHANGERATE = 86400 # seconds
+MIN_CHANGERATE = 15 * 60 # seconds
+MAX_CHANGERATE = 14 * 86400 # seconds
+# The # of recent fetch events to estimate a changerate from.
+CHANGERATE_HISTORY = 100
+# Weight of the newest interval in the moving average.
+EWMA_ALPHA = 0.3
+# Fetch this many standard deviations before the expected publication,
+# but not sooner than this fraction of the mean interval (irregular feeds
+# have deviations as large as their mean).
+CONFIDENCE_Z = 1.0
+MIN_MEAN_FRACTION = 0.5
+# A feed silent for longer than mean + DORMANT_Z * std is backing off.
+DORMANT_Z = 2.0
+# Events without a recent post are logged with the epoch as the newest
+# published date.
+MIN_PUBLISHED_DATE = datetime(1971, 1, 1)
+# Posts older than this are not read by the crawler (AGE_LIMIT_FOR_PAGE).
+DEFAULT_AGE_LIMIT = 86400 # seconds
+# The crawler doesn't fetch a feed again sooner than this
+# (MIN_RESCHEDULE_DELAY).
+MIN_FETCH_INTERVAL = 600 # seconds
+
+def to_naive_utc(time):
+    """Converts a datetime to a naive one in UTC (as stored in MySQL).
+
+    Args:
+      time: A naive (UTC) or timezone-aware datetime.
+
+    Returns:
+      A naive datetime.
+    """
+    if time.tzinfo is None:
+        return time
+    return time.astimezone(timezone.utc).replace(tzinfo=None)
+
+def publication_times(events):
+    """Returns distinct publication times found in fetch events.
+
+    Args:
+      events: Fetch log events (see FeedFetchLogDB.scan).
+
+    Returns:
+      A sorted list of naive UTC datetimes.
+    """
+    times = set()
+    for event in events:
+        published_date = event.get("newest_post_published_date")
+        if not published_date:
+            continue
+        published_date = to_naive_utc(published_date)
+        if published_date >= MIN_PUBLISHED_DATE:
+            times.add(published_date)
+    return sorted(times)
+
+def ewma_interval(intervals, alpha=EWMA_ALPHA):
+    """Exponentially weighted mean and standard deviation of intervals.
+
+    Args:
+      intervals: Intervals in seconds, oldest first.
+      alpha: Weight of the newest interval.
+
+    Returns:
+      A tuple of (mean, standard deviation) in seconds.
+    """
+    state = ChangerateState()
+    for interval in intervals:
+        state.add_interval(interval, alpha=alpha)
+    return state.mean_interval, math.sqrt(state.variance)
+
+def clamp_changerate(changerate, max_changerate=MAX_CHANGERATE):
+    """Bounds a changerate to [MIN_CHANGERATE, max_changerate].
+    """
+    return int(max(
+        MIN_CHANGERATE, min(MAX_CHANGERATE, max_changerate, changerate)))
+
+class ChangerateEstimate:
+    """ChangerateEstimate holds an estimated changerate and its inputs.
+
+    Attributes:
+      changerate: The interval in seconds to fetch the feed again.
+      mean_interval: EWMA of intervals between publications (None if there
+        are fewer than two publications).
+      std_interval: Standard deviation of the intervals.
+      num_intervals: The # of intervals used.
+    """
+    def __init__(
+            self, changerate, mean_interval=None, std_interval=None,
+            num_intervals=0):
+        self.changerate = changerate
+        self.mean_interval = mean_interval
+        self.std_interval = std_interval
+        self.num_intervals = num_intervals
+
+class ChangerateState:
+    """ChangerateState is the running EWMA of a feed's publication intervals.
+
+    It is kept on the feed row, so a changerate is estimated from the
+    newest publication alone instead of the fetch history.
+
+    Attributes:
+      newest_published_date: The newest publication seen (naive UTC, None
+        if none yet).
+      mean_interval: EWMA of intervals in seconds (None without an
+        interval).
+      variance: Exponentially weighted variance of intervals.
+      num_intervals: The # of intervals added.
+    """
+    def __init__(
+            self, newest_published_date=None, mean_interval=None, variance=0.0,
+            num_intervals=0):
+        self.newest_published_date = newest_published_date
+        self.mean_interval = mean_interval
+        self.variance = variance if variance else 0.0
+        self.num_intervals = num_intervals if num_intervals else 0
+
+    def add_interval(self, interval, alpha=EWMA_ALPHA):
+        """Adds an interval between publications.
+
+        Args:
+          interval: Seconds.
+          alpha: Weight of the interval.
+        """
+        if self.num_intervals == 0:
+            self.mean_interval = interval
+            self.variance = 0.0
+        else:
+            diff = interval - self.mean_interval
+            increment = alpha * diff
+            self.mean_interval += increment
+            self.variance = (1 - alpha) * (self.variance + diff * increment)
+        self.num_intervals += 1
+
+    def add_publication(self, published_date):
+        """Adds a publication if it is newer than the ones seen.
+
+        Args:
+          published_date: A naive (UTC) or timezone-aware datetime. Dates
+            before MIN_PUBLISHED_DATE mean no recent post.
+
+        Returns:
+          True if the publication is new.
+        """
+        if not published_date:
+            return False
+        published_date = to_naive_utc(published_date)
+        if published_date < MIN_PUBLISHED_DATE:
+            return False
+        if self.newest_published_date is not None:
+            if published_date <= self.newest_published_date:
+                return False
+            self.add_interval(
+                (published_date - self.newest_published_date).total_seconds())
+        self.newest_published_date = published_date
+        return True
+
+    def estimate(
+            self, latest_fetched_time, now=None,
+            max_changerate=DEFAULT_AGE_LIMIT):
+        """Estimates the changerate (see estimate_changerate).
+
+        Args:
+          latest_fetched_time: The time of the latest fetch.
+          now: The time to schedule from (latest_fetched_time if None).
+          max_changerate: The upper bound.
+
+        Returns:
+          A ChangerateEstimate instance.
+        """
+        latest_fetched_time = to_naive_utc(latest_fetched_time)
+        now = to_naive_utc(now) if now else latest_fetched_time
+
+        if self.num_intervals == 0:
+            duration = (
+                latest_fetched_time - self.newest_published_date
+            ).total_seconds() if self.newest_published_date else 0
+            if duration <= 0:
+                duration = DEFAULT_CHANGERATE
+            return ChangerateEstimate(
+                clamp_changerate(duration, max_changerate))
+
+        mean = self.mean_interval
+        std = math.sqrt(self.variance)
+        changerate = max(mean - CONFIDENCE_Z * std, mean * MIN_MEAN_FRACTION)
+
+        silence = (now - self.newest_published_date).total_seconds()
+        if silence > mean + DORMANT_Z * std:
+            changerate = max(changerate, silence / 2)
+
+        return ChangerateEstimate(
+            clamp_changerate(changerate, max_changerate), mean_interval=mean,
+            std_interval=std, num_intervals=self.num_intervals)
+
+def changerate_state(events):
+    """Builds a ChangerateState from fetch events.
+
+    Args:
+      events: Fetch log events (see FeedFetchLogDB.scan), in any order.
+
+    Returns:
+      A ChangerateState instance.
+    """
+    state = ChangerateState()
+    for published_date in publication_times(events):
+        state.add_publication(published_date)
+    return state
+
+def estimate_changerate(events, now=None, max_changerate=DEFAULT_AGE_LIMIT):
+    """Estimates the changerate of a feed from its fetch history.
+
+    With two or more publications, the changerate is the EWMA of
+    inter-publication intervals minus CONFIDENCE_Z deviations (at least
+    MIN_MEAN_FRACTION of the mean). If the feed has been silent for much
+    longer than usual, it backs off to half of the silence. Otherwise it
+    falls back to the time between the latest fetch and the newest post.
+
+    Args:
+      events: Fetch log events (see FeedFetchLogDB.scan), in any order.
+      now: The time to schedule from (the latest fetch time if None).
+      max_changerate: The upper bound. The crawler drops posts older than
+        its age limit, so fetching less often than that loses posts.
+
+    Returns:
+      A ChangerateEstimate instance.
+    """
+    if not events:
+        return ChangerateEstimate(
+            clamp_changerate(DEFAULT_CHANGERATE, max_changerate))
+
+    latest_fetched_time = max(
+        to_naive_utc(event["fetched_time"]) for event in events)
+    return changerate_state(events).estimate(
+        latest_fetched_time, now=now, max_changerate=max_changerate)
+
+def legacy_changerate(events):
+    """The former changerate policy, kept as a baseline for backtests.
+
+    Looks only at the newest event and uses timedelta.seconds, which drops
+    the days of the duration.
+
+    Args:
+      events: Fetch log events.
+
+    Returns:
+      The changerate in seconds.
+    """
+    events = sorted(events, key=lambda e: e["fetched_time"], reverse=True)
+    duration = to_naive_utc(events[0]["fetched_time"]) - to_naive_utc(
+        events[0]["newest_post_published_date"])
+
+    if duration.seconds <= 0:
+        return 86400
+    elif duration.seconds > MAX_CHANGERATE:
+        return MAX_CHANGERATE
+    else:
+        return duration.seconds
+
+def ewma_changerate(events):
+    """The EWMA changerate policy (see estimate_changerate).
+
+    Args:
+      events: Fetch log events.
+
+    Returns:
+      The changerate in seconds.
+    """
+    return estimate_changerate(events).changerate
+
+class BacktestResult:
+    """BacktestResult holds the outcome of replaying a fetch policy.
+
+    Attributes:
+      num_fetches: The # of simulated fetches.
+      num_wasted_fetches: The # of fetches without a new post.
+      num_missed: The # of posts older than the age limit when fetched (the
+        crawler drops them).
+      delays: Seconds from each publication to the first fetch after it.
+    """
+    def __init__(self):
+        self.num_fetches = 0
+        self.num_wasted_fetches = 0
+        self.num_missed = 0
+        self.delays = []
+
+    def add(self, other):
+        """Adds up another result (e.g. of another feed).
+        """
+        self.num_fetches += other.num_fetches
+        self.num_wasted_fetches += other.num_wasted_fetches
+        self.num_missed += other.num_missed
+        self.delays.extend(other.delays)
+
+    def delay_percentile(self, percentile):
+        """Returns a percentile (0-100) of freshness delays in seconds.
+        """
+        if not self.delays:
+            return 0.0
+        delays = sorted(self.delays)
+        idx = min(len(delays) - 1, int(len(delays) * percentile / 100))
+        return delays[idx]
+
+    def mean_delay(self):
+        """Returns the mean freshness delay in seconds.
+        """
+        return sum(self.delays) / len(self.delays) if self.delays else 0.0
+
+def backtest(
+        publications, start_time, end_time, policy,
+        age_limit_secs=DEFAULT_AGE_LIMIT, history=CHANGERATE_HISTORY,
+        min_interval_secs=MIN_FETCH_INTERVAL):
+    """Replays a fetch policy against known publication times.
+
+    Each simulated fetch logs an event the way the crawler does: the newest
+    post younger than the age limit, or the epoch if there is none. The
+    policy computes the next changerate from the simulated events.
+
+    Args:
+      publications: Publication times of a feed.
+      start_time: The time of the first fetch.
+      end_time: No fetch is simulated after this time.
+      policy: A function from a list of events to a changerate in seconds.
+      age_limit_secs: Posts older than this are not seen by a fetch.
+      history: The # of recent events given to the policy.
+      min_interval_secs: Min seconds between fetches.
+
+    Returns:
+      A BacktestResult instance.
+    """
+    publications = sorted(to_naive_utc(time) for time in publications)
+    start_time = to_naive_utc(start_time)
+    end_time = to_naive_utc(end_time)
+    result = BacktestResult()
+    events = []
+    # Posts published before the first fetch are already known.
+    next_idx = 0
+    while (next_idx < len(publications)
+           and publications[next_idx] <= start_time):
+        next_idx += 1
+
+    fetch_time = start_time
+    while fetch_time <= end_time:
+        num_new_posts = 0
+        while (next_idx < len(publications)
+               and publications[next_idx] <= fetch_time):
+            delay = (fetch_time - publications[next_idx]).total_seconds()
+            result.delays.append(delay)
+            if delay > age_limit_secs:
+                result.num_missed += 1
+            next_idx += 1
+            num_new_posts += 1
+
+        newest_post_published_date = datetime(1970, 1, 1)
+        if next_idx > 0 and (
+                fetch_time - publications[next_idx - 1]).total_seconds() <= (
+                    age_limit_secs):
+            newest_post_published_date = publications[next_idx - 1]
+        events.append({
+            "fetched_time": fetch_time,
+            "feed_updated": num_new_posts > 0,
+            "newest_post_published_date": newest_post_published_date})
+        events = events[-history:]
+
+        result.num_fetches += 1
+        if num_new_posts == 0:
+            result.num_wasted_fetches += 1
+        fetch_time += timedelta(
+            seconds=max(min_interval_secs, policy(events)))
+
+    # Posts after the last fetch wait for the next one.
+    for published_date in publications[next_idx:]:
+        if published_date <= end_time:
+            result.delays.append((fetch_time - published_date).total_seconds())
+    return result
@@ -0,0 +1,120 @@
+"""Tests for changerate estimation.
+
+Commands:
+$ PYTHONPATH=./ python3 util/changerate_test.py
+"""
+from datetime import datetime, timedelta
+import random
+
+from util.changerate import (
+    DEFAULT_AGE_LIMIT, MIN_CHANGERATE, ChangerateState, backtest,
+    estimate_changerate, ewma_changerate, legacy_changerate)
+
+START_TIME = datetime(2020, 10, 1)
+
+def create_events(publications, fetch_interval, num_fetches):
+    """Creates fetch events the way the crawler logs them.
+    """
+    events = []
+    for i in range(num_fetches):
+        fetched_time = START_TIME + fetch_interval * i
+        published = [
+            time for time in publications if time <= fetched_time and (
+                fetched_time - time).total_seconds() <= DEFAULT_AGE_LIMIT]
+        events.append({
+            "fetched_time": fetched_time,
+            "feed_updated": bool(published),
+            "newest_post_published_date": max(
+                published) if published else datetime(1970, 1, 1)})
+    return events
+
+def test_regular_feed():
+    """Tests a feed publishing every 6 hours is fetched about as often.
+    """
+    publications = [START_TIME + timedelta(hours=6 * i) for i in range(20)]
+    events = create_events(publications, timedelta(hours=1), 100)
+
+    estimate = estimate_changerate(events)
+
+    assert estimate.num_intervals >= 10
+    assert abs(estimate.mean_interval - 6 * 3600) < 60
+    assert 5 * 3600 <= estimate.changerate <= 6 * 3600
+
+def test_gap_over_a_day():
+    """Tests durations over a day don't wrap around (timedelta.seconds).
+    """
+    events = [{
+        "fetched_time": START_TIME + timedelta(days=2, hours=1),
+        "feed_updated": False,
+        "newest_post_published_date": START_TIME}]
+
+    assert legacy_changerate(events) == 3600
+    assert estimate_changerate(events).changerate == DEFAULT_AGE_LIMIT
+    assert estimate_changerate(
+        events, max_changerate=7 * 86400).changerate == 49 * 3600
+
+def test_bounds():
+    """Tests changerates stay within bounds.
+    """
+    assert estimate_changerate([]).changerate == DEFAULT_AGE_LIMIT
+    publications = [START_TIME + timedelta(minutes=i) for i in range(30)]
+    events = create_events(publications, timedelta(minutes=1), 30)
+    assert estimate_changerate(events).changerate == MIN_CHANGERATE
+
+def test_backtest():
+    """Tests the EWMA policy wastes fewer fetches than the legacy one.
+    """
+    random.seed(0)
+    publications = [
+        START_TIME + timedelta(
+            hours=6 * i, minutes=random.randint(-30, 30))
+        for i in range(120)]
+    end_time = START_TIME + timedelta(days=30)
+
+    legacy = backtest(publications, START_TIME, end_time, legacy_changerate)
+    ewma = backtest(publications, START_TIME, end_time, ewma_changerate)
+
+    assert len(ewma.delays) == len(legacy.delays)
+    assert ewma.num_missed == 0
+    assert ewma.num_wasted_fetches < legacy.num_wasted_fetches / 2
+    assert ewma.mean_delay() <= legacy.mean_delay() * 1.1
+
+def test_incremental_state():
+    """Tests the state kept per fetch matches the estimate from the log.
+    """
+    random.seed(7)
+    publications = sorted(
+        START_TIME + timedelta(hours=random.uniform(0, 200))
+        for _ in range(30))
+    events = create_events(publications, timedelta(hours=1), 200)
+
+    state = ChangerateState()
+    for i, event in enumerate(events):
+        state.add_publication(event["newest_post_published_date"])
+        # Stored and read back, as the crawler does between fetches.
+        state = ChangerateState(
+            newest_published_date=state.newest_published_date,
+            mean_interval=state.mean_interval, variance=state.variance,
+            num_intervals=state.num_intervals)
+        estimate = estimate_changerate(events[:i + 1])
+        assert state.estimate(event["fetched_time"]).changerate == (
+            estimate.changerate)
+
+    # An older or epoch date is not a new publication.
+    assert not state.add_publication(publications[0])
+    assert not state.add_publication(datetime(1970, 1, 1))
+
+def main():
+    """Run tests for changerate estimation.
+    """
+    print("TEST started.")
+    test_regular_feed()
+    test_gap_over_a_day()
+    test_bounds()
+    test_backtest()
+    test_incremental_state()
+    print("TEST completed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""CircuitBreaker class definition and backoff of failing feeds.
+
+  CircuitBreaker counts consecutive failures per host. After
+  HOST_FAILURE_THRESHOLD failures the circuit of the host opens and its
+  feeds are not fetched until it half-opens again, with an exponential
+  backoff. One probe fetch is let through then; a success closes the
+  circuit and a failure opens it for longer.
+
+  Feeds back off the same way on their own failures and are quarantined
+  (not fetched until released) after QUARANTINE_FAILURES in a row.
+
+  Typical usage example:
+
+  from util.circuit_breaker import CircuitBreaker
+
+  breaker = CircuitBreaker()
+  if breaker.allow(host, datetime.utcnow()):
+      try:
+          fetch(url)
+          breaker.record_success(host)
+      except requests.ConnectionError:
+          breaker.record_failure(host, datetime.utcnow())
+"""
+from datetime import timedelta
+import logging
+import threading
+
+logger = logging.getLogger()
+
+# Consecutive failures to open the circuit of a host.
+HOST_FAILURE_THRESHOLD = 5
+HOST_BASE_OPEN_SECS = 5 * 60
+HOST_MAX_OPEN_SECS = 6 * 3600
+# Backoff of a failing feed. A feed is never fetched sooner than its
+# changerate says.
+FEED_BASE_BACKOFF_SECS = 10 * 60
+FEED_MAX_BACKOFF_SECS = 86400
+# Consecutive failures to quarantine a feed (about a week of backoff).
+QUARANTINE_FAILURES = 14
+# Errors which tell the host (not only the feed) is failing. Responses like
+# 404 mean the host is up.
+HOST_ERROR_CLASSES = frozenset([
+    "ConnectionError", "ConnectTimeout", "ReadTimeout", "Timeout",
+    "SSLError", "ProxyError", "ChunkedEncodingError", "HTTP 429"])
+
+def backoff_secs(failures, base_secs, max_secs):
+    """Returns an exponential backoff.
+
+    Args:
+      failures: The # of consecutive failures (1 for the first).
+      base_secs: The backoff after the first failure.
+      max_secs: The upper bound.
+
+    Returns:
+      base_secs * 2^(failures - 1), at most max_secs.
+    """
+    if failures < 1:
+        return 0
+    # Bounds the exponent not to build huge integers.
+    return min(max_secs, base_secs * 2 ** min(failures - 1, 32))
+
+def is_host_error(error_class):
+    """True if an error class means the host is failing.
+
+    Args:
+      error_class: An exception class name or e.g. "HTTP 5xx".
+    """
+    return error_class in HOST_ERROR_CLASSES or error_class == "HTTP 5xx"
+
+class HostState:
+    """HostState holds the failures of a host.
+
+    Attributes:
+      failures: The # of consecutive failures.
+      open_until: The circuit is open until this time (None if closed).
+      probing: True while a probe fetch of a half-open circuit is running.
+    """
+    def __init__(self, failures=0, open_until=None):
+        self.failures = failures
+        self.open_until = open_until
+        self.probing = False
+
+class CircuitBreaker:
+    """CircuitBreaker short-circuits fetches to failing hosts. Thread-safe.
+
+    Changed states are collected to persist them (see HostStateDB): load()
+    restores them, pop_changed() returns the ones to save.
+    """
+    def __init__(
+            self, failure_threshold=HOST_FAILURE_THRESHOLD,
+            base_open_secs=HOST_BASE_OPEN_SECS,
+            max_open_secs=HOST_MAX_OPEN_SECS):
+        self.failure_threshold = failure_threshold
+        self.base_open_secs = base_open_secs
+        self.max_open_secs = max_open_secs
+        self._hosts = {}
+        self._changed = set()
+        self._lock = threading.Lock()
+
+    def allow(self, host, now):
+        """Checks if a host may be fetched.
+
+        Args:
+          host: A host name (netloc).
+          now: The current datetime (naive UTC).
+
+        Returns:
+          False if the circuit is open, or half-open with a probe running.
+        """
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None or state.open_until is None:
+                return True
+            if now < state.open_until or state.probing:
+                return False
+            state.probing = True
+            return True
+
+    def open_until(self, host):
+        """Returns until when the circuit of a host is open (or None).
+        """
+        with self._lock:
+            state = self._hosts.get(host)
+            return state.open_until if state else None
+
+    def record_success(self, host):
+        """Closes the circuit of a host.
+        """
+        with self._lock:
+            if self._hosts.pop(host, None) is not None:
+                self._changed.add(host)
+                logger.info("Circuit closed: %s", host)
+
+    def record_failure(self, host, now):
+        """Counts a failure of a host and opens its circuit at the threshold.
+
+        Args:
+          host: A host name (netloc).
+          now: The current datetime (naive UTC).
+
+        Returns:
+          Until when the circuit is open (None if it is closed).
+        """
+        with self._lock:
+            state = self._hosts.setdefault(host, HostState())
+            state.failures += 1
+            state.probing = False
+            self._changed.add(host)
+            if state.failures < self.failure_threshold:
+                return None
+            state.open_until = now + timedelta(seconds=backoff_secs(
+                state.failures - self.failure_threshold + 1,
+                self.base_open_secs, self.max_open_secs))
+            logger.warning(
+                "Circuit open until %s after %d failures: %s",
+                state.open_until, state.failures, host)
+            return state.open_until
+
+    def load(self, states):
+        """Replaces the states (e.g. with the ones saved by other workers).
+
+        States changed since the last pop_changed() are kept. A probe which
+        ended without a result (e.g. an unexpected error) is forgotten, so
+        the host is probed again.
+
+        Args:
+          states: (host, failures, open_until) tuples.
+        """
+        with self._lock:
+            hosts = {
+                host: HostState(failures, open_until)
+                for host, failures, open_until in states}
+            for host in self._changed:
+                if host in self._hosts:
+                    hosts[host] = self._hosts[host]
+                else:
+                    hosts.pop(host, None)
+            self._hosts = hosts
+
+    def pop_changed(self):
+        """Returns the states changed since the last call.
+
+        Returns:
+          (host, failures, open_until) tuples. Closed hosts have 0 failures.
+        """
+        with self._lock:
+            changed = []
+            for host in sorted(self._changed):
+                state = self._hosts.get(host)
+                if state is None:
+                    changed.append((host, 0, None))
+                else:
+                    changed.append((host, state.failures, state.open_until))
+            self._changed = set()
+            return changed
@@ -0,0 +1,103 @@
+"""Tests for CircuitBreaker class and backoffs.
+
+Commands:
+$ PYTHONPATH=./ python3 util/circuit_breaker_test.py
+"""
+from datetime import datetime, timedelta
+
+from util.circuit_breaker import CircuitBreaker, backoff_secs, is_host_error
+
+HOST = "www.example.com"
+
+def test_backoff_secs():
+    """Tests the backoff doubles per failure up to the max.
+    """
+    assert backoff_secs(0, 600, 86400) == 0
+    assert backoff_secs(1, 600, 86400) == 600
+    assert backoff_secs(3, 600, 86400) == 2400
+    assert backoff_secs(8, 600, 86400) == 76800
+    assert backoff_secs(9, 600, 86400) == 86400
+    assert backoff_secs(1000, 600, 86400) == 86400
+
+def test_is_host_error():
+    """Tests which errors count against the host.
+    """
+    assert is_host_error("ConnectTimeout")
+    assert is_host_error("HTTP 5xx")
+    assert is_host_error("HTTP 429")
+    assert not is_host_error("HTTP 4xx")
+    assert not is_host_error("NotAFeed")
+    assert not is_host_error("")
+
+def test_open_and_probe():
+    """Tests the circuit opens at the threshold and lets one probe through.
+    """
+    now = datetime(2020, 10, 5, 12)
+    breaker = CircuitBreaker(
+        failure_threshold=3, base_open_secs=60, max_open_secs=3600)
+
+    assert breaker.record_failure(HOST, now) is None
+    assert breaker.record_failure(HOST, now) is None
+    assert breaker.allow(HOST, now)
+    assert breaker.record_failure(HOST, now) == now + timedelta(seconds=60)
+    assert not breaker.allow(HOST, now + timedelta(seconds=59))
+    assert breaker.allow("other.example.com", now)
+
+    # Half-open: a single probe.
+    later = now + timedelta(seconds=60)
+    assert breaker.allow(HOST, later)
+    assert not breaker.allow(HOST, later)
+
+    # A failed probe opens the circuit for longer.
+    assert breaker.record_failure(HOST, later) == later + timedelta(
+        seconds=120)
+    assert not breaker.allow(HOST, later + timedelta(seconds=119))
+
+    # A successful probe closes the circuit.
+    latest = later + timedelta(seconds=120)
+    assert breaker.allow(HOST, latest)
+    breaker.record_success(HOST)
+    assert breaker.open_until(HOST) is None
+    assert breaker.allow(HOST, latest)
+    assert breaker.allow(HOST, latest)
+
+def test_load_and_pop_changed():
+    """Tests states are persisted and loaded without losing local changes.
+    """
+    now = datetime(2020, 10, 5, 12)
+    open_until = now + timedelta(hours=1)
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.load([("a.example.com", 5, open_until), ("b.example.com", 1, None)])
+    assert not breaker.allow("a.example.com", now)
+
+    breaker.record_success("a.example.com")
+    breaker.record_failure("c.example.com", now)
+    # States saved by another worker don't undo local changes.
+    breaker.load([
+        ("a.example.com", 5, open_until), ("d.example.com", 2, open_until)])
+    assert breaker.allow("a.example.com", now)
+    assert not breaker.allow("d.example.com", now)
+    assert breaker.pop_changed() == [
+        ("a.example.com", 0, None), ("c.example.com", 1, None)]
+    assert breaker.pop_changed() == []
+
+    # A probe without a result is forgotten on the next load.
+    breaker.load([("d.example.com", 2, now)])
+    assert breaker.allow("d.example.com", now)
+    assert not breaker.allow("d.example.com", now)
+    breaker.load([("d.example.com", 2, now)])
+    assert breaker.allow("d.example.com", now)
+
+def main():
+    """Run tests for CircuitBreaker.
+    """
+    print("TEST started.")
+    test_backoff_secs()
+    test_is_host_error()
+    test_open_and_probe()
+    test_load_and_pop_changed()
+    print("TEST completed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""CrawlCorpus class definition and record/replay HTTP adapters.
+
+  CrawlCorpus is a local directory of HTTP responses (status, headers, body
+  and timing) recorded from a live crawl, and of the feeds which were
+  crawled. RecordingAdapter saves every response (feeds, redirects and
+  article pages) fetched through a requests.Session into a corpus, and
+  ReplayAdapter serves them back without network access, so crawls can be
+  measured offline and repeatably.
+
+  Bodies are stored decoded (the Content-Encoding is dropped) with the
+  bytes transferred on the wire. Failed requests (e.g. timeouts) are
+  recorded as errors and raised again on replay.
+
+  Typical usage example:
+
+  from util.crawl_corpus import CrawlCorpus, ReplayAdapter
+  from util.http_fetcher import HttpFetcher
+
+  HttpFetcher.get_instance().mount(ReplayAdapter(CrawlCorpus("/tmp/corpus")))
+"""
+from datetime import datetime
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.response import HTTPResponse
+
+from util.feed import Feed
+
+logger = logging.getLogger()
+
+RESPONSES_DIR = "responses"
+FEEDS_FILE = "feeds.jsonl"
+# Headers about the transfer on the wire, which doesn't apply to the
+# decoded bodies in a corpus.
+WIRE_HEADERS = frozenset([
+    "content-encoding", "transfer-encoding", "content-length", "connection",
+    "keep-alive"])
+# Feed attributes saved in a corpus.
+FEED_ATTRIBUTES = (
+    "url", "title", "description", "language", "feed_type", "changerate",
+    "label", "generator")
+
+def response_key(url):
+    """Returns the file name of the response of a URL in a corpus.
+    """
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+class RecordedResponse:
+    """RecordedResponse holds a response (or an error) of a GET request.
+
+    Attributes:
+      url: The requested URL.
+      status_code: The HTTP status code (0 for an error).
+      reason: The HTTP reason phrase.
+      headers: A dict of response headers (without WIRE_HEADERS).
+      body: The decoded body as bytes.
+      elapsed_secs: Seconds until the whole body was read.
+      bytes_transferred: The # of bytes read from the network.
+      error: The exception class of a failed request (e.g. "ReadTimeout"),
+        or "".
+      recorded_time: When it was recorded (UTC).
+    """
+    def __init__(
+            self, url, status_code=0, reason="", headers=None, body=b"",
+            elapsed_secs=0.0, bytes_transferred=0, error="",
+            recorded_time=None):
+        self.url = url
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers if headers else {}
+        self.body = body
+        self.elapsed_secs = elapsed_secs
+        self.bytes_transferred = bytes_transferred
+        self.error = error
+        self.recorded_time = (
+            recorded_time if recorded_time else datetime.utcnow())
+
+    def to_dict(self):
+        """Returns the metadata (everything but the body) as a dict.
+        """
+        return {
+            "url": self.url, "status_code": self.status_code,
+            "reason": self.reason, "headers": self.headers,
+            "elapsed_secs": self.elapsed_secs,
+            "bytes_transferred": self.bytes_transferred, "error": self.error,
+            "recorded_time": self.recorded_time.isoformat()}
+
+    @staticmethod
+    def from_dict(metadata, body):
+        """Creates a RecordedResponse from to_dict() and the body.
+        """
+        return RecordedResponse(
+            url=metadata["url"], status_code=metadata["status_code"],
+            reason=metadata["reason"], headers=metadata["headers"],
+            body=body, elapsed_secs=metadata["elapsed_secs"],
+            bytes_transferred=metadata["bytes_transferred"],
+            error=metadata["error"],
+            recorded_time=datetime.fromisoformat(metadata["recorded_time"]))
+
+class CrawlCorpus:
+    """CrawlCorpus reads and writes a corpus directory. Thread-safe.
+
+    responses/<sha1 of URL>.json holds the metadata of a response and
+    responses/<sha1 of URL>.body its body. feeds.jsonl lists the crawled
+    feeds. A response recorded again replaces the former one.
+
+    Attributes:
+      path: The corpus directory.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _response_path(self, url):
+        return os.path.join(self.path, RESPONSES_DIR, response_key(url))
+
+    def save_response(self, recorded):
+        """Saves a RecordedResponse.
+        """
+        path = self._response_path(recorded.url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written to temporary files first, so a reader never sees a
+        # partial response.
+        suffix = ".%d.tmp" % threading.get_ident()
+        with open(path + ".body" + suffix, "wb") as body_file:
+            body_file.write(recorded.body)
+        with open(path + ".json" + suffix, "w") as metadata_file:
+            json.dump(recorded.to_dict(), metadata_file)
+        os.replace(path + ".body" + suffix, path + ".body")
+        os.replace(path + ".json" + suffix, path + ".json")
+
+    def load_response(self, url):
+        """Loads the response of a URL.
+
+        Returns:
+          A RecordedResponse, or None if the URL is not in the corpus.
+        """
+        path = self._response_path(url)
+        try:
+            with open(path + ".json") as metadata_file:
+                metadata = json.load(metadata_file)
+            with open(path + ".body", "rb") as body_file:
+                body = body_file.read()
+        except FileNotFoundError:
+            return None
+        return RecordedResponse.from_dict(metadata, body)
+
+    def save_feeds(self, feeds):
+        """Appends feeds to the feed list of the corpus.
+
+        Args:
+          feeds: A list of Feed instances.
+        """
+        recorded_time = datetime.utcnow().isoformat()
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            with open(os.path.join(self.path, FEEDS_FILE), "a") as feeds_file:
+                for feed in feeds:
+                    line = {
+                        attribute: getattr(feed, attribute)
+                        for attribute in FEED_ATTRIBUTES}
+                    line["recorded_time"] = recorded_time
+                    feeds_file.write(json.dumps(line) + "\n")
+
+    def load_feeds(self):
+        """Loads the feed list of the corpus.
+
+        Returns:
+          A list of (Feed instance, recorded datetime) tuples, one per URL
+          (the latest one).
+        """
+        feeds = {}
+        try:
+            with open(os.path.join(self.path, FEEDS_FILE)) as feeds_file:
+                for line in feeds_file:
+                    attributes = json.loads(line)
+                    recorded_time = datetime.fromisoformat(
+                        attributes.pop("recorded_time"))
+                    feeds[attributes["url"]] = (
+                        Feed(**attributes), recorded_time)
+        except FileNotFoundError:
+            return []
+        return list(feeds.values())
+
+class RecordingAdapter(HTTPAdapter):
+    """RecordingAdapter sends requests and saves the responses to a corpus.
+
+    The whole body is read to save it, even if the caller would have read
+    only a part of it (e.g. read_capped), and the response is returned as
+    if it was streamed.
+    """
+    def __init__(self, corpus, **kwargs):
+        super().__init__(**kwargs)
+        self.corpus = corpus
+
+    # pylint: disable=too-many-arguments
+    def send(
+            self, request, stream=False, timeout=None, verify=True,
+            cert=None, proxies=None):
+        """Sends a request (see HTTPAdapter.send) and records the response.
+        """
+        start_time = time.monotonic()
+        try:
+            response = super().send(
+                request, stream=True, timeout=timeout, verify=verify,
+                cert=cert, proxies=proxies)
+            body = response.content
+        except requests.RequestException as ex:
+            self.corpus.save_response(RecordedResponse(
+                request.url, error=type(ex).__name__,
+                elapsed_secs=time.monotonic() - start_time))
+            raise
+
+        self.corpus.save_response(RecordedResponse(
+            request.url, status_code=response.status_code,
+            reason=response.reason or "",
+            headers={
+                name: value for name, value in response.headers.items()
+                if name.lower() not in WIRE_HEADERS},
+            body=body, elapsed_secs=time.monotonic() - start_time,
+            bytes_transferred=response.raw.tell() if response.raw else 0))
+        return response
+
+class ReplayAdapter(HTTPAdapter):
+    """ReplayAdapter serves responses from a corpus without network access.
+
+    A URL which is not in the corpus gets a 404 response. A conditional
+    request whose validators match the recorded response gets a 304.
+    Responses are kept in memory once loaded.
+
+    Attributes:
+      corpus: A CrawlCorpus instance.
+      latency_scale: Each response takes its recorded time multiplied by
+        this (0 to respond right away).
+      num_misses: The # of requests for URLs not in the corpus.
+    """
+    def __init__(self, corpus, latency_scale=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.corpus = corpus
+        self.latency_scale = latency_scale
+        self.num_misses = 0
+        self._responses = {}
+        self._lock = threading.Lock()
+
+    def recorded_response(self, url):
+        """Returns the RecordedResponse of a URL (or None).
+        """
+        with self._lock:
+            if url not in self._responses:
+                self._responses[url] = self.corpus.load_response(url)
+                if self._responses[url] is None:
+                    self.num_misses += 1
+                    logger.warning("Not in the corpus: %s", url)
+            return self._responses[url]
+
+    # pylint: disable=too-many-arguments
+    def send(
+            self, request, stream=False, timeout=None, verify=True,
+            cert=None, proxies=None):
+        """Returns the recorded response of a request (see HTTPAdapter.send).
+
+        Raises:
+          requests.RequestException: The recorded request failed.
+        """
+        recorded = self.recorded_response(request.url)
+        if recorded is None:
+            recorded = RecordedResponse(
+                request.url, status_code=404, reason="Not Found")
+        if self.latency_scale > 0:
+            time.sleep(recorded.elapsed_secs * self.latency_scale)
+        if recorded.error:
+            exception_class = getattr(
+                requests.exceptions, recorded.error, requests.ConnectionError)
+            raise exception_class(
+                "Recorded %s: %s" % (recorded.error, request.url),
+                request=request)
+
+        status_code = recorded.status_code
+        reason = recorded.reason
+        body = recorded.body
+        if status_code == 200 and self.not_modified(request, recorded):
+            status_code, reason, body = 304, "Not Modified", b""
+
+        raw = HTTPResponse(
+            body=io.BytesIO(body), headers=recorded.headers,
+            status=status_code, reason=reason, preload_content=False,
+            decode_content=False, request_method=request.method)
+        return self.build_response(request, raw)
+
+    @staticmethod
+    def not_modified(request, recorded):
+        """True if the validators of a conditional request match.
+        """
+        headers = CaseInsensitiveDict(recorded.headers)
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        return bool(
+            (etag and request.headers.get("If-None-Match") == etag) or
+            (last_modified and
+             request.headers.get("If-Modified-Since") == last_modified))
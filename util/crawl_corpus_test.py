@@ -0,0 +1,130 @@
+"""Tests for CrawlCorpus class and the record/replay adapters.
+
+Commands:
+$ PYTHONPATH=./ python3 util/crawl_corpus_test.py
+"""
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import tempfile
+import threading
+
+import requests
+from util.crawl_corpus import CrawlCorpus, RecordingAdapter, ReplayAdapter
+from util.feed import Feed
+
+BODY = b"<rss><channel><title>Test</title></channel></rss>"
+
+class CorpusHandler(BaseHTTPRequestHandler):
+    """Serves a gzipped feed at /rss and redirects /old to it.
+    """
+    def do_GET(self):
+        """Handles a GET request.
+        """
+        if self.path == "/old":
+            self.send_response(301)
+            self.send_header("Location", "/rss")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = gzip.compress(BODY)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/rss+xml")
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # pylint: disable=redefined-builtin
+    def log_message(self, format, *args):
+        """Keeps the test output quiet.
+        """
+
+def create_session(adapter):
+    """Creates a session which sends all requests through an adapter.
+    """
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def test_record_and_replay():
+    """Tests recorded responses are replayed without the server.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CorpusHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = "http://127.0.0.1:%d" % server.server_address[1]
+
+    with tempfile.TemporaryDirectory() as corpus_path:
+        corpus = CrawlCorpus(corpus_path)
+        session = create_session(RecordingAdapter(corpus))
+        response = session.get(base_url + "/old", stream=True)
+        assert response.status_code == 200
+        assert b"".join(response.iter_content(chunk_size=8)) == BODY
+        try:
+            session.get("http://127.0.0.1:1/closed", timeout=1)
+            assert False
+        except requests.ConnectionError:
+            pass
+        server.shutdown()
+        server.server_close()
+
+        recorded = corpus.load_response(base_url + "/rss")
+        assert recorded.body == BODY
+        assert "Content-Encoding" not in recorded.headers
+        assert recorded.bytes_transferred == len(gzip.compress(BODY))
+        assert corpus.load_response(base_url + "/old").status_code == 301
+
+        adapter = ReplayAdapter(corpus)
+        session = create_session(adapter)
+        response = session.get(base_url + "/old")
+        assert response.status_code == 200
+        assert response.url == base_url + "/rss"
+        assert response.content == BODY
+        assert response.headers["ETag"] == '"v1"'
+
+        response = session.get(
+            base_url + "/rss", headers={"If-None-Match": '"v1"'})
+        assert response.status_code == 304
+        assert response.content == b""
+
+        try:
+            session.get("http://127.0.0.1:1/closed")
+            assert False
+        except requests.ConnectionError:
+            pass
+
+        assert session.get(base_url + "/missing").status_code == 404
+        assert adapter.num_misses == 1
+
+def test_feeds():
+    """Tests the feed list keeps the latest entry per URL.
+    """
+    with tempfile.TemporaryDirectory() as corpus_path:
+        corpus = CrawlCorpus(corpus_path)
+        assert corpus.load_feeds() == []
+        feed = Feed(
+            url="https://www.example.com/rss", title="Old title",
+            description="Sample", language="ko", feed_type="RSS",
+            changerate=3600)
+        corpus.save_feeds([feed])
+        feed.title = "New title"
+        corpus.save_feeds([feed])
+
+        feeds = corpus.load_feeds()
+        assert len(feeds) == 1
+        assert feeds[0][0].title == "New title"
+        assert feeds[0][0].url_key == feed.url_key
+        assert feeds[0][0].changerate == 3600
+
+def main():
+    """Run tests for CrawlCorpus.
+    """
+    print("TEST started.")
+    test_record_and_replay()
+    test_feeds()
+    print("TEST completed.")
+
+
+if __name__ == "__main__":
+    main()
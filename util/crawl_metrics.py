@@ -0,0 +1,326 @@
+"""CrawlMetrics class definition.
+
+  CrawlMetrics collects per-feed timings of crawl stages (fetch, parse, DB
+  writes, og:image enrichment), bytes, item counts and error classes, and
+  exports latency histograms and the slowest feeds as JSON or in the
+  Prometheus text format.
+
+  Each crawler worker reports its own metrics, labeled with its worker ID.
+
+  Typical usage example:
+
+  from util.crawl_metrics import CrawlMetrics, FeedMetrics
+
+  metrics = CrawlMetrics()
+  feed_metrics = FeedMetrics(url)
+  with feed_metrics.time("fetch"):
+      fetch_result = fetch_rss(url)
+  metrics.add_feed(feed_metrics)
+
+  print(metrics.to_prometheus())
+"""
+from contextlib import contextmanager
+import heapq
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger()
+
+# "total" is the whole processing time of a feed. "enrich" is observed per
+# post as main images are filled in the background.
+STAGES = ("fetch", "parse", "db", "enrich", "total")
+# Upper bounds of latency histogram buckets in seconds.
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DEFAULT_TOP_N = 10
+METRIC_PREFIX = "readmoa_crawl"
+
+class Histogram:
+    """Histogram counts observations in cumulative buckets (Prometheus style).
+
+    Attributes:
+      buckets: Upper bounds of buckets in ascending order.
+      counts: # of observations per bucket (the last one is +Inf).
+      sum: Sum of observed values.
+      count: # of observations.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """Adds an observation.
+
+        Args:
+          value: A value (e.g. seconds) to add.
+        """
+        idx = len(self.buckets)
+        for i, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                idx = i
+                break
+        self.counts[idx] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimates a quantile by the upper bound of its bucket.
+
+        Args:
+          q: A quantile between 0 and 1.
+
+        Returns:
+          The upper bound of the bucket (None if empty, inf if in +Inf).
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative_count = 0
+        for i, count in enumerate(self.counts):
+            cumulative_count += count
+            if cumulative_count >= rank:
+                if i < len(self.buckets):
+                    return self.buckets[i]
+                break
+        return float("inf")
+
+    def cumulative_counts(self):
+        """Returns (upper bound string, cumulative count) pairs.
+        """
+        result = []
+        cumulative_count = 0
+        for i, count in enumerate(self.counts):
+            cumulative_count += count
+            upper_bound = "%g" % self.buckets[i] if (
+                i < len(self.buckets)) else "+Inf"
+            result.append((upper_bound, cumulative_count))
+        return result
+
+def json_quantile(histogram, q):
+    """Returns a quantile of a histogram for JSON ("+Inf" for infinity).
+    """
+    value = histogram.quantile(q)
+    return "+Inf" if value == float("inf") else value
+
+class FeedMetrics:
+    """FeedMetrics holds the measurements of one feed fetch.
+
+    Attributes:
+      url: The feed URL.
+      durations: Seconds spent per stage.
+      bytes_transferred: The # of bytes downloaded.
+      num_items: The # of items parsed.
+      num_new_posts: The # of posts inserted.
+      error_class: The class of an error (e.g. "Timeout", "HTTP 5xx"), or ""
+        if none.
+    """
+    def __init__(self, url):
+        self.url = url
+        self.durations = {}
+        self.bytes_transferred = 0
+        self.num_items = 0
+        self.num_new_posts = 0
+        self.error_class = ""
+
+    @contextmanager
+    def time(self, stage):
+        """Adds the time spent in the 'with' block to a stage.
+
+        Args:
+          stage: One of STAGES.
+        """
+        start_time = time.monotonic()
+        try:
+            yield
+        finally:
+            self.durations[stage] = self.durations.get(stage, 0.0) + (
+                time.monotonic() - start_time)
+
+    def to_dict(self):
+        """Returns the measurements as a dict.
+        """
+        return {
+            "url": self.url,
+            "durations": {
+                stage: round(secs, 6) for stage, secs in
+                self.durations.items()},
+            "bytes_transferred": self.bytes_transferred,
+            "num_items": self.num_items,
+            "num_new_posts": self.num_new_posts,
+            "error_class": self.error_class}
+
+class CrawlMetrics:
+    """CrawlMetrics aggregates FeedMetrics of a crawl. Thread-safe.
+
+    Only the 'top_n' slowest feeds are kept, so memory stays bounded in a
+    long-running crawler.
+
+    Attributes:
+      worker: The ID of the crawler worker ("" for a single crawler). It is
+        a label of every Prometheus sample.
+      histograms: A Histogram per stage.
+      num_feeds: The # of feeds processed.
+      bytes_transferred: Total bytes downloaded.
+      num_items: Total items parsed.
+      num_new_posts: Total posts inserted.
+      errors: # of feeds per error class.
+    """
+    def __init__(self, top_n=DEFAULT_TOP_N, worker=""):
+        self.top_n = top_n
+        self.worker = worker
+        self.histograms = {stage: Histogram() for stage in STAGES}
+        self.num_feeds = 0
+        self.bytes_transferred = 0
+        self.num_items = 0
+        self.num_new_posts = 0
+        self.errors = {}
+        # Min-heap of (total seconds, sequence #, FeedMetrics).
+        self._slowest_feeds = []
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def add_feed(self, feed_metrics):
+        """Adds the measurements of a feed.
+
+        Args:
+          feed_metrics: A FeedMetrics instance.
+        """
+        with self._lock:
+            for stage, secs in feed_metrics.durations.items():
+                self.histograms[stage].observe(secs)
+            self.num_feeds += 1
+            self.bytes_transferred += feed_metrics.bytes_transferred
+            self.num_items += feed_metrics.num_items
+            self.num_new_posts += feed_metrics.num_new_posts
+            if feed_metrics.error_class:
+                self.errors[feed_metrics.error_class] = self.errors.get(
+                    feed_metrics.error_class, 0) + 1
+
+            self._sequence += 1
+            entry = (
+                feed_metrics.durations.get("total", 0.0), self._sequence,
+                feed_metrics)
+            if len(self._slowest_feeds) < self.top_n:
+                heapq.heappush(self._slowest_feeds, entry)
+            else:
+                heapq.heappushpop(self._slowest_feeds, entry)
+
+    def observe(self, stage, secs):
+        """Adds a single timing not tied to a feed (e.g. "enrich" per post).
+
+        Args:
+          stage: One of STAGES.
+          secs: Seconds spent.
+        """
+        with self._lock:
+            self.histograms[stage].observe(secs)
+
+    def slowest_feeds(self):
+        """Returns FeedMetrics of the slowest feeds, slowest first.
+        """
+        with self._lock:
+            entries = sorted(self._slowest_feeds, reverse=True)
+        return [feed_metrics for _, _, feed_metrics in entries]
+
+    def to_json(self):
+        """Returns the report as a JSON string.
+        """
+        slowest_feeds = self.slowest_feeds()
+        with self._lock:
+            report = {
+                "worker": self.worker,
+                "num_feeds": self.num_feeds,
+                "bytes_transferred": self.bytes_transferred,
+                "num_items": self.num_items,
+                "num_new_posts": self.num_new_posts,
+                "errors": dict(self.errors),
+                "stages": {
+                    stage: {
+                        "count": histogram.count,
+                        "sum": round(histogram.sum, 6),
+                        "p50": json_quantile(histogram, 0.5),
+                        "p90": json_quantile(histogram, 0.9),
+                        "p99": json_quantile(histogram, 0.99),
+                        "buckets": dict(histogram.cumulative_counts())}
+                    for stage, histogram in self.histograms.items()},
+            }
+        report["slowest_feeds"] = [
+            feed_metrics.to_dict() for feed_metrics in slowest_feeds]
+        return json.dumps(report, indent=2)
+
+    def labels(self, **labels):
+        """Formats Prometheus labels, with the worker label if set.
+
+        Args:
+          labels: Label names to values.
+
+        Returns:
+          A string like '{worker="w1",stage="fetch"}' ("" if no label).
+        """
+        pairs = [("worker", self.worker)] if self.worker else []
+        pairs.extend(labels.items())
+        if not pairs:
+            return ""
+        return "{%s}" % ",".join(
+            '%s="%s"' % (name, str(value).replace('"', '\\"'))
+            for name, value in pairs)
+
+    def to_prometheus(self):
+        """Returns the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            name = METRIC_PREFIX + "_stage_seconds"
+            lines.append("# HELP %s Time spent in each crawl stage." % name)
+            lines.append("# TYPE %s histogram" % name)
+            for stage, histogram in self.histograms.items():
+                for upper_bound, count in histogram.cumulative_counts():
+                    lines.append("%s_bucket%s %d" % (
+                        name, self.labels(stage=stage, le=upper_bound),
+                        count))
+                lines.append("%s_sum%s %f" % (
+                    name, self.labels(stage=stage), histogram.sum))
+                lines.append("%s_count%s %d" % (
+                    name, self.labels(stage=stage), histogram.count))
+
+            for metric, value, description in (
+                    ("feeds_total", self.num_feeds, "Feeds processed."),
+                    ("bytes_total", self.bytes_transferred,
+                     "Bytes downloaded."),
+                    ("items_total", self.num_items, "Feed items parsed."),
+                    ("new_posts_total", self.num_new_posts,
+                     "Posts inserted.")):
+                name = "%s_%s" % (METRIC_PREFIX, metric)
+                lines.append("# HELP %s %s" % (name, description))
+                lines.append("# TYPE %s counter" % name)
+                lines.append("%s%s %d" % (name, self.labels(), value))
+
+            name = METRIC_PREFIX + "_errors_total"
+            lines.append("# HELP %s Feeds failed per error class." % name)
+            lines.append("# TYPE %s counter" % name)
+            for error_class, count in sorted(self.errors.items()):
+                lines.append("%s%s %d" % (
+                    name, self.labels(**{"class": error_class}), count))
+        return "\n".join(lines) + "\n"
+
+    def write(self, json_path="", prometheus_path=""):
+        """Writes the report to files.
+
+        Args:
+          json_path: A path to write the JSON report (skipped if empty).
+          prometheus_path: A path to write the Prometheus text (e.g. for the
+            node_exporter textfile collector; skipped if empty).
+        """
+        for path, content in (
+                (json_path, self.to_json),
+                (prometheus_path, self.to_prometheus)):
+            if not path:
+                continue
+            try:
+                with open(path, "w") as output_file:
+                    output_file.write(content())
+            except OSError as ex:
+                logger.warning("Failed to write metrics to %s: %s", path, ex)
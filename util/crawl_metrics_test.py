@@ -0,0 +1,100 @@
+"""Tests for CrawlMetrics class.
+
+Commands:
+$ PYTHONPATH=./ python3 util/crawl_metrics_test.py
+"""
+import json
+
+from util.crawl_metrics import CrawlMetrics, FeedMetrics, Histogram
+
+def create_feed_metrics(url, total_secs, error_class=""):
+    """Creates FeedMetrics with fixed timings.
+    """
+    feed_metrics = FeedMetrics(url)
+    feed_metrics.durations = {
+        "fetch": total_secs * 0.8, "parse": total_secs * 0.1,
+        "db": total_secs * 0.1, "total": total_secs}
+    feed_metrics.bytes_transferred = 1000
+    feed_metrics.num_items = 2
+    feed_metrics.error_class = error_class
+    return feed_metrics
+
+def test_histogram():
+    """Tests buckets are cumulative and quantiles are bucket bounds.
+    """
+    histogram = Histogram(buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.7, 3):
+        histogram.observe(value)
+
+    assert histogram.cumulative_counts() == [
+        ("0.1", 1), ("1", 3), ("+Inf", 4)]
+    assert histogram.quantile(0.5) == 1
+    assert histogram.quantile(1) == float("inf")
+    assert Histogram().quantile(0.5) is None
+
+def test_time_stage():
+    """Tests time spent in a stage is added up.
+    """
+    feed_metrics = FeedMetrics("https://www.example.com/rss")
+    with feed_metrics.time("db"):
+        pass
+    with feed_metrics.time("db"):
+        pass
+
+    assert list(feed_metrics.durations) == ["db"]
+    assert feed_metrics.durations["db"] >= 0
+
+def test_report():
+    """Tests the JSON and Prometheus outputs.
+    """
+    metrics = CrawlMetrics(top_n=2)
+    for i, secs in enumerate((0.2, 5, 0.01, 12)):
+        metrics.add_feed(create_feed_metrics(
+            "https://www.example.com/%d" % i, secs,
+            error_class="Timeout" if secs > 10 else ""))
+    metrics.observe("enrich", 0.3)
+
+    report = json.loads(metrics.to_json())
+    assert report["num_feeds"] == 4
+    assert report["bytes_transferred"] == 4000
+    assert report["errors"] == {"Timeout": 1}
+    assert report["stages"]["enrich"]["count"] == 1
+    assert report["stages"]["total"]["buckets"]["+Inf"] == 4
+    assert [feed["url"] for feed in report["slowest_feeds"]] == [
+        "https://www.example.com/3", "https://www.example.com/1"]
+
+    text = metrics.to_prometheus()
+    assert 'readmoa_crawl_stage_seconds_bucket{stage="total",le="+Inf"} 4' in (
+        text)
+    assert 'readmoa_crawl_stage_seconds_count{stage="fetch"} 4' in text
+    assert "readmoa_crawl_items_total 8" in text
+    assert 'readmoa_crawl_errors_total{class="Timeout"} 1' in text
+
+def test_worker_label():
+    """Tests metrics of a worker are labeled with its ID.
+    """
+    metrics = CrawlMetrics(worker="host-1")
+    metrics.add_feed(create_feed_metrics(
+        "https://www.example.com/", 0.2, error_class="Timeout"))
+
+    assert json.loads(metrics.to_json())["worker"] == "host-1"
+    text = metrics.to_prometheus()
+    assert ('readmoa_crawl_stage_seconds_count{worker="host-1",stage="fetch"}'
+            ' 1') in text
+    assert 'readmoa_crawl_feeds_total{worker="host-1"} 1' in text
+    assert ('readmoa_crawl_errors_total{worker="host-1",class="Timeout"} 1'
+            in text)
+
+def main():
+    """Run tests for CrawlMetrics.
+    """
+    print("TEST started.")
+    test_histogram()
+    test_time_stage()
+    test_report()
+    test_worker_label()
+    print("TEST completed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -51,7 +51,14 @@ class Feed:
             generator = "", popularity = 0, first_fetched_time = 0,
             latest_fetched_time = 0, latest_item_url = "",
             latest_item_title = "",
-            scheduled_fetch_time = 0):
+            scheduled_fetch_time = 0, etag = "", last_modified = "",
+            publish_histogram = "", newest_post_published_date = None,
+            publish_interval_mean = None, publish_interval_variance = None,
+            publish_interval_count = None, lease_owner = "",
+            lease_expires_time = None, consecutive_failures = 0,
+            last_error = "", quarantined_time = None, item_budget = None,
+            age_window_secs = None, latest_success_time = None,
+            body_fingerprint = "", link_fingerprint = ""):
         if url_key == "":
             self.url_key = url_to_hashkey(url)
         else:
@@ -73,6 +80,36 @@ class Feed:
             self.scheduled_fetch_time = datetime.utcnow()
         else:
             self.scheduled_fetch_time = scheduled_fetch_time
+        # HTTP cache validators from the latest fetch (conditional GET).
+        self.etag = etag if etag else ""
+        self.last_modified = last_modified if last_modified else ""
+        # Publications per hour of the week (see PublishHistogram).
+        self.publish_histogram = publish_histogram if publish_histogram else ""
+        # EWMA of publication intervals (see ChangerateState). The count is
+        # None until the state is built from the fetch log.
+        self.newest_post_published_date = newest_post_published_date
+        self.publish_interval_mean = publish_interval_mean
+        self.publish_interval_variance = publish_interval_variance
+        self.publish_interval_count = publish_interval_count
+        # The crawler worker processing the feed and until when (see
+        # FeedDB.claim_due_feeds).
+        self.lease_owner = lease_owner if lease_owner else ""
+        self.lease_expires_time = lease_expires_time
+        # Failures in a row, the latest error class, and since when the feed
+        # is quarantined (None if not).
+        self.consecutive_failures = (
+            consecutive_failures if consecutive_failures else 0)
+        self.last_error = last_error if last_error else ""
+        self.quarantined_time = quarantined_time
+        # The max # of items and their max age (in seconds) to read on the
+        # next fetch (None until planned, see util/item_budget.py).
+        self.item_budget = item_budget
+        self.age_window_secs = age_window_secs
+        self.latest_success_time = latest_success_time
+        # Fingerprints of the last document read (see
+        # util/feed_fingerprint.py).
+        self.body_fingerprint = body_fingerprint if body_fingerprint else ""
+        self.link_fingerprint = link_fingerprint if link_fingerprint else ""
 
     def __str__(self):
         """Returns a human-readable string.
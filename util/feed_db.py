@@ -17,46 +17,85 @@
 
   feed_db.insert(feed)
 """
-from datetime import timedelta
+from datetime import date, datetime, timedelta
 import logging
 
 import sqlalchemy
+from util.changerate import (
+    CHANGERATE_HISTORY, DEFAULT_AGE_LIMIT, ChangerateState, changerate_state,
+    to_naive_utc)
+from util.circuit_breaker import (
+    FEED_BASE_BACKOFF_SECS, FEED_MAX_BACKOFF_SECS, QUARANTINE_FAILURES,
+    backoff_secs)
 from util.database import Database
 from util.feed import Feed
+from util.fetch_log_rollup import FUTURE_PARTITION, partition_definitions
+from util.item_budget import (
+    age_window_secs, item_budget, last_success_time, next_item_budget)
+from util.publish_histogram import PublishHistogram, update_histogram
 
 logger = logging.getLogger()
-MAX_CHANGERATE = 14 * 86400
 
-def calculate_changerate(events):
-    """Calculate the changerate from feed event logs.
+# Seconds a crawler worker holds claimed feeds. A worker which dies leaves
+# its feeds to others once the lease expires.
+DEFAULT_LEASE_SECS = 900
+# The size of latest_item_title column.
+MAX_ITEM_TITLE_LENGTH = 128
+
+# Columns to read a Feed from feeds table (see feed_from_row).
+FEED_COLUMNS = """url_key, url, title, changerate, feed_type, label,
+                       language, description, generator, popularity,
+                       first_fetched_time, latest_fetched_time, latest_item_url,
+                       latest_item_title, scheduled_fetch_time, etag,
+                       last_modified, publish_histogram,
+                       newest_post_published_date, publish_interval_mean,
+                       publish_interval_variance, publish_interval_count,
+                       lease_owner, lease_expires_time, consecutive_failures,
+                       last_error, quarantined_time, item_budget,
+                       age_window_secs, latest_success_time,
+                       body_fingerprint, link_fingerprint"""
+
+def feed_from_row(row):
+    """Creates a Feed from a row selected with FEED_COLUMNS.
 
     Args:
-        events: A list of events. An event data looks:
-            {
-                "url_key"
-                "fetched_time"
-                "feed_updated"
-                "newest_post_published_date"
-                "previous_changerate"
-                "previous_scheduled_fetch_time"
-            }
+        row: A row from feeds table.
 
     Returns:
-        The calculated changerate in seconds.
+        A Feed instance.
     """
-    # A simple algorithm to calculate a changerate.
-    # changerate = (latest feed fetched time) - (published time of the
-    #               newest post)
-    events.sort(key=lambda e:e["fetched_time"], reverse=True)
-
-    duration = events[0]["fetched_time"] - events[0]["newest_post_published_date"]
+    return Feed(
+        url_key=row[0], url=row[1], title=row[2],
+        changerate=row[3], feed_type=row[4], label=row[5],
+        language=row[6], description=row[7], generator=row[8],
+        popularity=row[9], first_fetched_time=row[10],
+        latest_fetched_time=row[11], latest_item_url=row[12],
+        latest_item_title=row[13], scheduled_fetch_time=row[14],
+        etag=row[15], last_modified=row[16], publish_histogram=row[17],
+        newest_post_published_date=row[18], publish_interval_mean=row[19],
+        publish_interval_variance=row[20], publish_interval_count=row[21],
+        lease_owner=row[22], lease_expires_time=row[23],
+        consecutive_failures=row[24], last_error=row[25],
+        quarantined_time=row[26], item_budget=row[27],
+        age_window_secs=row[28], latest_success_time=row[29],
+        body_fingerprint=row[30], link_fingerprint=row[31])
+
+def fetch_log_insert_stmt(mode):
+    """Returns the statement to insert a fetch event into feed_fetch_log.
 
-    if duration.seconds <= 0:
-        return 86400   # default: 1 day
-    elif duration.seconds > MAX_CHANGERATE:
-        return MAX_CHANGERATE
-    else:
-        return duration.seconds
+    Args:
+        mode: prod/dev/test mode.
+    """
+    return sqlalchemy.text("""
+        INSERT INTO {mode}_feed_fetch_log
+        (url_key, fetched_time, feed_updated, newest_post_published_date,
+         previous_changerate, previous_scheduled_fetch_time,
+         bytes_transferred)
+        VALUES
+        (:url_key, :fetched_time, :feed_updated,
+         :newest_post_published_date, :previous_changerate,
+         :previous_scheduled_fetch_time, :bytes_transferred)
+        """.format(mode=mode))
 
 class FeedDB:
     """FeedDB class to interact with the feeds table.
@@ -83,60 +122,295 @@ class FeedDB:
         with self.db_instance.connect() as conn:
             # Execute the query and fetch all results
             returned_feeds = conn.execute("""
-                SELECT url_key, url, title, changerate, feed_type, label,
-                       language, description, generator, popularity,
-                       first_fetched_time, latest_fetched_time, latest_item_url,
-                       latest_item_title, scheduled_fetch_time
+                SELECT {columns}
                 FROM {mode}_feeds
                 where url_key = '{url_key}'
-                """.format(mode=self.mode, url_key=url_key)
+                """.format(
+                    columns=FEED_COLUMNS, mode=self.mode, url_key=url_key)
             ).fetchall()
 
             if len(returned_feeds) > 0:
-                row = returned_feeds[0]
-                feed = Feed(url_key=row[0], url=row[1], title=row[2],
-                        changerate=row[3], feed_type=row[4], label=row[5],
-                        language=row[6], description=row[7], generator=row[8],
-                        popularity=row[9], first_fetched_time=row[10],
-                        latest_fetched_time=row[11], latest_item_url=row[12],
-                        latest_item_title=row[13],
-                        scheduled_fetch_time=row[14])
+                feed = feed_from_row(returned_feeds[0])
         return feed
 
-    def update_changerate(self, url_key):
-        """Updates the changerate of a feed.
+    def record_fetch(self, feed, event):
+        """Logs a fetch of a feed and updates its schedule in one transaction.
 
-        Call this method after a new log event for a feed completed.
-        It will calculate a new changerate and update Feeds table.
+        The changerate is estimated from the EWMA state kept on the feed
+        row, so the fetch log is not read (except once, to build the state
+        of a feed without one). The lease of the feed is released. Nothing
+        is written if the feed is gone or leased to another worker (the
+        lease of this worker expired).
+
+        A failed fetch (with "error_class") backs the feed off
+        exponentially on its consecutive failures, and quarantines it after
+        QUARANTINE_FAILURES; quarantined feeds are not scanned nor claimed
+        until released. A successful fetch resets the failures.
 
         Args:
-          url_key: A hash of a feed URL.
+          feed: The fetched Feed instance, as read from feeds table. It is
+            updated in place.
+          event: A dict of the fetch with "fetched_time", "feed_updated",
+            "newest_post_published_date" and "bytes_transferred". "etag",
+            "last_modified", "latest_item_url", "latest_item_title",
+            "body_fingerprint", "link_fingerprint" and "error_class" (of a
+            failed fetch) are stored if present.
+            "item_budget" and "num_items" (the budget of the fetch and the
+            # of items read with it) raise the next budget if it was
+            filled.
+
+        Returns:
+          The new scheduled fetch time of the feed, or None if nothing was
+          written.
+        """
+        histogram = PublishHistogram.from_string(feed.publish_histogram)
+        if feed.publish_interval_count is None:
+            events = FeedFetchLogDB(self.mode).scan(
+                feed.url_key, count=CHANGERATE_HISTORY)
+            state = changerate_state(events)
+            update_histogram(histogram, events)
+        else:
+            state = ChangerateState(
+                newest_published_date=feed.newest_post_published_date,
+                mean_interval=feed.publish_interval_mean,
+                variance=feed.publish_interval_variance,
+                num_intervals=feed.publish_interval_count)
+        if state.add_publication(event["newest_post_published_date"]):
+            histogram.add(event["newest_post_published_date"])
+
+        fetched_time = to_naive_utc(event["fetched_time"])
+        estimate = state.estimate(fetched_time)
+        changerate = estimate.changerate
+        scheduled_fetch_time = histogram.next_fetch_time(
+            fetched_time, changerate, max_delay_secs=DEFAULT_AGE_LIMIT)
+        etag = event.get("etag", feed.etag)
+        last_modified = event.get("last_modified", feed.last_modified)
+        latest_item_url = event.get("latest_item_url", feed.latest_item_url)
+        latest_item_title = event.get(
+            "latest_item_title", feed.latest_item_title)
+        if latest_item_title:
+            latest_item_title = latest_item_title[:MAX_ITEM_TITLE_LENGTH]
+        body_fingerprint = event.get(
+            "body_fingerprint", feed.body_fingerprint)
+        link_fingerprint = event.get(
+            "link_fingerprint", feed.link_fingerprint)
+
+        last_error = event.get("error_class", "")
+        consecutive_failures = 0
+        quarantined_time = None
+        if last_error:
+            consecutive_failures = feed.consecutive_failures + 1
+            scheduled_fetch_time = max(
+                scheduled_fetch_time, fetched_time + timedelta(
+                    seconds=backoff_secs(
+                        consecutive_failures, FEED_BASE_BACKOFF_SECS,
+                        FEED_MAX_BACKOFF_SECS)))
+            if consecutive_failures >= QUARANTINE_FAILURES:
+                quarantined_time = feed.quarantined_time or fetched_time
+                logger.warning(
+                    "Quarantined after %d failures (%s): %s",
+                    consecutive_failures, last_error, feed.url)
+
+        # Plans the item budget and the age window of the next fetch.
+        success_time = (
+            last_success_time(feed) if last_error else fetched_time)
+        planned_elapsed_secs = None
+        if success_time:
+            planned_elapsed_secs = (
+                scheduled_fetch_time - success_time).total_seconds()
+        planned_budget = item_budget(
+            state.mean_interval, planned_elapsed_secs)
+        if event.get("item_budget"):
+            planned_budget = next_item_budget(
+                event["item_budget"], event.get("num_items", 0),
+                planned_budget)
+        planned_window_secs = age_window_secs(planned_elapsed_secs)
+        logger.info(
+            "New changerate for [%s]: %d from %d intervals (next fetch:%s)",
+            feed.url_key, changerate, estimate.num_intervals,
+            scheduled_fetch_time)
+
+        update_stmt = sqlalchemy.text("""
+            UPDATE {mode}_feeds
+            SET
+              changerate = :changerate,
+              latest_fetched_time = :latest_fetched_time,
+              scheduled_fetch_time = :scheduled_fetch_time,
+              publish_histogram = :publish_histogram,
+              newest_post_published_date = :newest_post_published_date,
+              publish_interval_mean = :publish_interval_mean,
+              publish_interval_variance = :publish_interval_variance,
+              publish_interval_count = :publish_interval_count,
+              etag = :etag,
+              last_modified = :last_modified,
+              latest_item_url = :latest_item_url,
+              latest_item_title = :latest_item_title,
+              body_fingerprint = :body_fingerprint,
+              link_fingerprint = :link_fingerprint,
+              consecutive_failures = :consecutive_failures,
+              last_error = :last_error,
+              quarantined_time = :quarantined_time,
+              item_budget = :item_budget,
+              age_window_secs = :age_window_secs,
+              latest_success_time = :latest_success_time,
+              lease_owner = NULL,
+              lease_expires_time = NULL
+            WHERE url_key = :url_key
+              AND (lease_owner IS NULL OR lease_owner = :lease_owner)
+            """.format(mode=self.mode))
+
+        try:
+            with self.db_instance.connect() as conn:
+                with conn.begin():
+                    result = conn.execute(
+                        update_stmt, changerate=changerate,
+                        latest_fetched_time=fetched_time,
+                        scheduled_fetch_time=scheduled_fetch_time,
+                        publish_histogram=histogram.to_string(),
+                        newest_post_published_date=state.newest_published_date,
+                        publish_interval_mean=state.mean_interval,
+                        publish_interval_variance=state.variance,
+                        publish_interval_count=state.num_intervals,
+                        etag=etag, last_modified=last_modified,
+                        latest_item_url=latest_item_url,
+                        latest_item_title=latest_item_title,
+                        body_fingerprint=body_fingerprint,
+                        link_fingerprint=link_fingerprint,
+                        consecutive_failures=consecutive_failures,
+                        last_error=last_error,
+                        quarantined_time=quarantined_time,
+                        item_budget=planned_budget,
+                        age_window_secs=planned_window_secs,
+                        latest_success_time=success_time,
+                        url_key=feed.url_key, lease_owner=feed.lease_owner)
+                    if result.rowcount == 0:
+                        logger.warning(
+                            "Fetch not recorded, the feed is deleted or "
+                            "leased to another worker: %s", feed.url)
+                        return None
+                    conn.execute(
+                        fetch_log_insert_stmt(self.mode),
+                        url_key=feed.url_key, fetched_time=fetched_time,
+                        feed_updated=event["feed_updated"],
+                        newest_post_published_date=event[
+                            "newest_post_published_date"],
+                        previous_changerate=feed.changerate,
+                        previous_scheduled_fetch_time=feed.scheduled_fetch_time,
+                        bytes_transferred=event.get("bytes_transferred"))
+        except self.db_instance.Error as ex:
+            logger.exception(ex)
+            return None
+
+        feed.changerate = changerate
+        feed.latest_fetched_time = fetched_time
+        feed.scheduled_fetch_time = scheduled_fetch_time
+        feed.publish_histogram = histogram.to_string()
+        feed.newest_post_published_date = state.newest_published_date
+        feed.publish_interval_mean = state.mean_interval
+        feed.publish_interval_variance = state.variance
+        feed.publish_interval_count = state.num_intervals
+        feed.etag = etag
+        feed.last_modified = last_modified
+        feed.latest_item_url = latest_item_url
+        feed.latest_item_title = latest_item_title
+        feed.body_fingerprint = body_fingerprint
+        feed.link_fingerprint = link_fingerprint
+        feed.consecutive_failures = consecutive_failures
+        feed.last_error = last_error
+        feed.quarantined_time = quarantined_time
+        feed.item_budget = planned_budget
+        feed.age_window_secs = planned_window_secs
+        feed.latest_success_time = success_time
+        feed.lease_owner = ""
+        feed.lease_expires_time = None
+        return scheduled_fetch_time
+
+    def defer_feed(self, feed, scheduled_fetch_time):
+        """Moves the schedule of a feed without fetching it.
+
+        Used when the circuit of the host of the feed is open. The lease of
+        the feed is released, unless it is leased to another worker.
+
+        Args:
+          feed: A Feed instance, as read from feeds table. It is updated in
+            place.
+          scheduled_fetch_time: A datetime (naive UTC) to fetch the feed.
+
+        Returns:
+          True if the feed is rescheduled.
         """
+        stmt = sqlalchemy.text("""
+            UPDATE {mode}_feeds
+            SET scheduled_fetch_time = :scheduled_fetch_time,
+              lease_owner = NULL,
+              lease_expires_time = NULL
+            WHERE url_key = :url_key
+              AND (lease_owner IS NULL OR lease_owner = :lease_owner)
+            """.format(mode=self.mode))
+
+        try:
+            with self.db_instance.connect() as conn:
+                result = conn.execute(
+                    stmt, scheduled_fetch_time=scheduled_fetch_time,
+                    url_key=feed.url_key, lease_owner=feed.lease_owner)
+        except self.db_instance.Error as ex:
+            logger.exception(ex)
+            return False
+
+        if result.rowcount == 0:
+            return False
+        feed.scheduled_fetch_time = scheduled_fetch_time
+        feed.lease_owner = ""
+        feed.lease_expires_time = None
+        return True
+
+    def scan_quarantined_feeds(self, count=1000):
+        """Scans quarantined feeds, the most recently quarantined first.
+
+        Args:
+          count: Max # of feeds to return.
+
+        Returns:
+          A list of Feed instances.
+        """
+        stmt = sqlalchemy.text("""
+            SELECT {columns}
+            FROM {mode}_feeds
+            WHERE quarantined_time IS NOT NULL
+            ORDER BY quarantined_time DESC LIMIT {limit:d}
+            """.format(columns=FEED_COLUMNS, mode=self.mode, limit=count)
+        )
+
         with self.db_instance.connect() as conn:
-            log_db = FeedFetchLogDB(self.mode)
-            events = log_db.scan(url_key, count=10)
-            changerate = calculate_changerate(events)
-
-            # Sort events in reverse chronological order.
-            events.sort(key=lambda e:e["fetched_time"], reverse=True)
-            latest_fetched_time = events[0]["fetched_time"]
-            scheduled_fetch_time = latest_fetched_time + timedelta(seconds=changerate)
-            logger.info(
-                "New changerate for [%s]: %d (latest fetch:%s)",
-                url_key, changerate, latest_fetched_time)
-            conn.execute("""
-                UPDATE {mode}_feeds
-                SET
-                  changerate = {changerate},
-                  latest_fetched_time = '{latest_fetched_time}',
-                  scheduled_fetch_time = '{scheduled_fetch_time}'
-                WHERE url_key = '{url_key}'
-                """.format(
-                    mode=self.mode, changerate=changerate,
-                    latest_fetched_time=latest_fetched_time,
-                    scheduled_fetch_time=scheduled_fetch_time,
+            rows = conn.execute(stmt).fetchall()
+        return [feed_from_row(row) for row in rows]
+
+    def release_quarantine(self, url_key):
+        """Releases a feed from quarantine and schedules it right away.
+
+        Args:
+          url_key: A hash of a feed URL.
+
+        Returns:
+          True if the feed was quarantined.
+        """
+        stmt = sqlalchemy.text("""
+            UPDATE {mode}_feeds
+            SET quarantined_time = NULL,
+              consecutive_failures = 0,
+              scheduled_fetch_time = :scheduled_fetch_time
+            WHERE url_key = :url_key AND quarantined_time IS NOT NULL
+            """.format(mode=self.mode))
+
+        try:
+            with self.db_instance.connect() as conn:
+                result = conn.execute(
+                    stmt, scheduled_fetch_time=datetime.utcnow(),
                     url_key=url_key)
-            )
+        except self.db_instance.Error as ex:
+            logger.exception(ex)
+            return False
+        return result.rowcount > 0
 
     def scan_feeds(self, start_idx=0, count=10):
         """Scans Feeds table and resturns a list of feeds.
@@ -163,26 +437,122 @@ class FeedDB:
         with self.db_instance.connect() as conn:
             # Execute the query and fetch all results
             recent_feeds = conn.execute("""
-                SELECT url_key, url, title, changerate, feed_type, label,
-                       language, description, generator, popularity,
-                       first_fetched_time, latest_fetched_time, latest_item_url,
-                       latest_item_title, scheduled_fetch_time
+                SELECT {columns}
                 FROM {mode}_feeds
                 ORDER BY latest_fetched_time DESC LIMIT {limit:d}
-                """.format(mode=self.mode, limit=start_idx + count)
+                """.format(
+                    columns=FEED_COLUMNS, mode=self.mode,
+                    limit=start_idx + count)
             ).fetchall()
 
             if len(recent_feeds) > start_idx:
                 for row in recent_feeds[start_idx:]:
-                    feeds.append(Feed(
-                        url_key=row[0], url=row[1], title=row[2],
-                        changerate=row[3], feed_type=row[4], label=row[5],
-                        language=row[6], description=row[7], generator=row[8],
-                        popularity=row[9], first_fetched_time=row[10],
-                        latest_fetched_time=row[11], latest_item_url=row[12],
-                        latest_item_title=row[13],
-                        scheduled_fetch_time=row[14]))
+                    feeds.append(feed_from_row(row))
+
+        return feeds
+
+    def scan_due_feeds(self, due_time, count=1000):
+        """Scans feeds scheduled to be fetched by the given time.
+
+        Feeds are sorted by scheduled_fetch_time (served by an index on the
+        column), so the earliest due feeds are returned first. Quarantined
+        feeds are left out.
+
+        Args:
+          due_time: A datetime (UTC). Feeds scheduled at or before the time
+            will be returned.
+          count: Max # of feeds to return.
+
+        Returns:
+          A list of Feed instances.
+        """
+        feeds = []
+        if count < 0:
+            logger.warning("count is out of range: %d", count)
+            return feeds  # Empty list
+
+        stmt = sqlalchemy.text("""
+            SELECT {columns}
+            FROM {mode}_feeds
+            WHERE scheduled_fetch_time <= :due_time
+              AND quarantined_time IS NULL
+            ORDER BY scheduled_fetch_time LIMIT {limit:d}
+            """.format(columns=FEED_COLUMNS, mode=self.mode, limit=count)
+        )
+
+        with self.db_instance.connect() as conn:
+            due_feeds = conn.execute(stmt, due_time=due_time).fetchall()
+            for row in due_feeds:
+                feeds.append(feed_from_row(row))
+
+        return feeds
+
+    def claim_due_feeds(
+            self, worker_id, due_time, count=100,
+            lease_secs=DEFAULT_LEASE_SECS):
+        """Claims due feeds for a crawler worker.
+
+        Due feeds without a live lease are locked with SELECT ... FOR UPDATE
+        SKIP LOCKED (MySQL 8.0+) and leased to the worker in the same
+        transaction, so concurrent workers never claim the same feed. A
+        lease is released by record_fetch. Feeds whose lease has expired
+        (e.g. the worker died) are claimed again. Quarantined feeds are not
+        claimed.
+
+        Args:
+          worker_id: A unique name of the worker.
+          due_time: A datetime (UTC). Feeds scheduled at or before the time
+            are claimed.
+          count: Max # of feeds to claim.
+          lease_secs: Seconds until the lease expires. It should cover
+            processing all the claimed feeds.
+
+        Returns:
+          A list of Feed instances with the lease.
+        """
+        now = datetime.utcnow()
+        lease_expires_time = now + timedelta(seconds=lease_secs)
+        select_stmt = sqlalchemy.text("""
+            SELECT {columns}
+            FROM {mode}_feeds
+            WHERE scheduled_fetch_time <= :due_time
+              AND quarantined_time IS NULL
+              AND (lease_expires_time IS NULL OR lease_expires_time <= :now)
+            ORDER BY scheduled_fetch_time LIMIT {limit:d}
+            FOR UPDATE SKIP LOCKED
+            """.format(columns=FEED_COLUMNS, mode=self.mode, limit=count))
+        update_stmt = sqlalchemy.text("""
+            UPDATE {mode}_feeds
+            SET lease_owner = :lease_owner,
+              lease_expires_time = :lease_expires_time
+            WHERE url_key IN :url_keys
+            """.format(mode=self.mode)
+        ).bindparams(sqlalchemy.bindparam("url_keys", expanding=True))
 
+        feeds = []
+        try:
+            with self.db_instance.connect() as conn:
+                with conn.begin():
+                    rows = conn.execute(
+                        select_stmt, due_time=due_time, now=now).fetchall()
+                    feeds = [feed_from_row(row) for row in rows]
+                    if feeds:
+                        conn.execute(
+                            update_stmt, lease_owner=worker_id,
+                            lease_expires_time=lease_expires_time,
+                            url_keys=[feed.url_key for feed in feeds])
+        except self.db_instance.Error as ex:
+            logger.exception(ex)
+            return []
+
+        for feed in feeds:
+            if feed.lease_owner:
+                logger.info(
+                    "Recovered an expired lease of %s (%s since %s): %s",
+                    feed.lease_owner, worker_id, feed.lease_expires_time,
+                    feed.url)
+            feed.lease_owner = worker_id
+            feed.lease_expires_time = lease_expires_time
         return feeds
 
     def insert_feed(self, feed):
@@ -200,12 +570,13 @@ class FeedDB:
             (url_key, url, feed_type, title, changerate,  label,
             language, description, generator, popularity, first_fetched_time,
             latest_fetched_time, latest_item_url, latest_item_title,
-            scheduled_fetch_time)
+            scheduled_fetch_time, etag, last_modified, publish_histogram)
             VALUES 
             (:url_key, :url, :feed_type, :title, :changerate, :label,
             :language, :description, :generator, :popularity,
             :first_fetched_time, :latest_fetched_time, :latest_item_url,
-            :latest_item_title, :scheduled_fetch_time)
+            :latest_item_title, :scheduled_fetch_time, :etag, :last_modified,
+            :publish_histogram)
             """.format(mode=self.mode)
         )
 
@@ -223,7 +594,9 @@ class FeedDB:
                         latest_fetched_time=feed.latest_fetched_time,
                         latest_item_url=feed.latest_item_url,
                         latest_item_title=feed.latest_item_title,
-                        scheduled_fetch_time=feed.scheduled_fetch_time)
+                        scheduled_fetch_time=feed.scheduled_fetch_time,
+                        etag=feed.etag, last_modified=feed.last_modified,
+                        publish_histogram=feed.publish_histogram)
         except self.db_instance.Error as ex:
             logger.exception(ex)
             return
@@ -245,7 +618,8 @@ class FeedDB:
 class FeedFetchLogDB:
     """FeedFetchLogDB class to interact with feed_fetch_log table.
 
-    FeedDB provides log, scan operations for feed fetching events.
+    FeedFetchLogDB provides scan operations for feed fetching events. They
+    are logged by FeedDB.record_fetch.
 
     Attributes:
       ...
@@ -254,50 +628,6 @@ class FeedFetchLogDB:
         self.db_instance = Database.get_instance().connection
         self.mode = mode
 
-    def log(
-        self, url_key, fetched_time, feed_updated, newest_post_published_date,
-        previous_changerate, previous_scheduled_fetch_time):
-        """Logs a fetching event for a feed.
-
-        Args:
-          url_key (string): A hash of a feed URL.
-          fetched_time (datetime): The time the fetching event happened.
-          feed_updated (bool): Is the feed updated when it was fetched?
-          newest_post_published_date (datetime): The published date of the
-            newest post when it was fetched.
-          previous_changerate (int): The estimated changerate when the event
-            happened.
-          previous_scheduled_fetch_time (DATETIME): The next scheduled fetch
-            time when the event happened.
-
-        Returns:
-          True if successful.
-        """
-        stmt = sqlalchemy.text("""
-            INSERT INTO {mode}_feed_fetch_log
-            (url_key, fetched_time, feed_updated, newest_post_published_date,
-             previous_changerate, previous_scheduled_fetch_time)
-            VALUES 
-            (:url_key, :fetched_time, :feed_updated,
-             :newest_post_published_date, :previous_changerate,
-             :previous_scheduled_fetch_time)
-            """.format(mode=self.mode)
-        )
-
-        logger.info(stmt)
-
-        try:
-            with self.db_instance.connect() as conn:
-                conn.execute(
-                        stmt, url_key=url_key, fetched_time=fetched_time,
-                        feed_updated=feed_updated,
-                        newest_post_published_date=newest_post_published_date,
-                        previous_changerate=previous_changerate,
-                        previous_scheduled_fetch_time=previous_scheduled_fetch_time)
-        except self.db_instance.Error as ex:
-            logger.exception(ex)
-            return
-
     def scan(self, url_key, count=100):
         """Scan logs for a feed.
 
@@ -314,7 +644,8 @@ class FeedFetchLogDB:
             recent_events = conn.execute("""
                 SELECT url_key, fetched_time, feed_updated,
                   newest_post_published_date,
-                  previous_changerate, previous_scheduled_fetch_time
+                  previous_changerate, previous_scheduled_fetch_time,
+                  bytes_transferred
                 FROM {mode}_feed_fetch_log
                 where url_key = '{url_key}'
                 ORDER BY fetched_time DESC LIMIT {limit:d}
@@ -327,7 +658,8 @@ class FeedFetchLogDB:
                     "feed_updated":row[2],
                     "newest_post_published_date":row[3],
                     "previous_changerate":row[4],
-                    "previous_scheduled_fetch_time":row[5]})
+                    "previous_scheduled_fetch_time":row[5],
+                    "bytes_transferred":row[6]})
         return events
 
     def delete_by_feed(self, feed_key):
@@ -348,6 +680,304 @@ class FeedFetchLogDB:
                     FROM {mode}_feed_fetch_log
                     where url_key = '{url_key}'
                     """.format(mode=self.mode, url_key=feed_key))
+                conn.execute("""
+                    DELETE
+                    FROM {mode}_feed_fetch_daily
+                    where url_key = '{url_key}'
+                    """.format(mode=self.mode, url_key=feed_key))
+        except self.db_instance.Error as ex:
+            logger.exception(ex)
+            return
+
+    def oldest_fetched_time(self):
+        """Returns the time of the oldest fetch event (None if no event).
+        """
+        with self.db_instance.connect() as conn:
+            return conn.execute("""
+                SELECT MIN(fetched_time) FROM {mode}_feed_fetch_log
+                """.format(mode=self.mode)).scalar()
+
+    def latest_rollup_date(self):
+        """Returns the latest day rolled up in feed_fetch_daily (or None).
+        """
+        with self.db_instance.connect() as conn:
+            return conn.execute("""
+                SELECT MAX(fetch_date) FROM {mode}_feed_fetch_daily
+                """.format(mode=self.mode)).scalar()
+
+    def scan_by_time(self, start_time, end_time):
+        """Scans logs of all feeds fetched in [start_time, end_time).
+
+        Args:
+          start_time (datetime): The inclusive start.
+          end_time (datetime): The exclusive end.
+
+        Returns:
+          A list of logs (see scan).
+        """
+        stmt = sqlalchemy.text("""
+            SELECT url_key, fetched_time, feed_updated,
+              newest_post_published_date,
+              previous_changerate, previous_scheduled_fetch_time,
+              bytes_transferred
+            FROM {mode}_feed_fetch_log
+            WHERE fetched_time >= :start_time AND fetched_time < :end_time
+            """.format(mode=self.mode))
+
+        with self.db_instance.connect() as conn:
+            rows = conn.execute(
+                stmt, start_time=start_time, end_time=end_time).fetchall()
+        return [{
+            "url_key":row[0], "fetched_time":row[1],
+            "feed_updated":row[2],
+            "newest_post_published_date":row[3],
+            "previous_changerate":row[4],
+            "previous_scheduled_fetch_time":row[5],
+            "bytes_transferred":row[6]} for row in rows]
+
+    def upsert_daily(self, rollups):
+        """Writes daily rollups, replacing existing ones of the same day.
+
+        Args:
+          rollups: A list of dicts (see fetch_log_rollup.daily_rollups).
+
+        Returns:
+          True if successful.
+        """
+        if not rollups:
+            return True
+
+        stmt = sqlalchemy.text("""
+            INSERT INTO {mode}_feed_fetch_daily
+            (url_key, fetch_date, num_fetches, num_updates, median_gap_secs,
+             bytes_transferred, newest_post_published_date)
+            VALUES
+            (:url_key, :fetch_date, :num_fetches, :num_updates,
+             :median_gap_secs, :bytes_transferred, :newest_post_published_date)
+            ON DUPLICATE KEY UPDATE
+              num_fetches = VALUES(num_fetches),
+              num_updates = VALUES(num_updates),
+              median_gap_secs = VALUES(median_gap_secs),
+              bytes_transferred = VALUES(bytes_transferred),
+              newest_post_published_date = VALUES(newest_post_published_date)
+            """.format(mode=self.mode))
+
+        try:
+            with self.db_instance.connect() as conn:
+                conn.execute(stmt, rollups)
         except self.db_instance.Error as ex:
             logger.exception(ex)
+            return False
+        return True
+
+    def scan_daily(self, url_key, count=30):
+        """Scans daily rollups of a feed.
+
+        Args:
+          url_key (string): A hash of a feed URL.
+          count (int): # of days to return (reverse chronological).
+
+        Returns:
+          A list of dicts (see fetch_log_rollup.daily_rollups).
+        """
+        stmt = sqlalchemy.text("""
+            SELECT url_key, fetch_date, num_fetches, num_updates,
+              median_gap_secs, bytes_transferred, newest_post_published_date
+            FROM {mode}_feed_fetch_daily
+            WHERE url_key = :url_key
+            ORDER BY fetch_date DESC LIMIT {limit:d}
+            """.format(mode=self.mode, limit=count))
+
+        with self.db_instance.connect() as conn:
+            rows = conn.execute(stmt, url_key=url_key).fetchall()
+        return [{
+            "url_key":row[0], "fetch_date":row[1], "num_fetches":row[2],
+            "num_updates":row[3], "median_gap_secs":row[4],
+            "bytes_transferred":row[5],
+            "newest_post_published_date":row[6]} for row in rows]
+
+    def list_partitions(self):
+        """Lists monthly partitions of feed_fetch_log.
+
+        Returns:
+          A list of (partition name, exclusive upper bound date) tuples in
+          ascending order, without FUTURE_PARTITION. Empty if the table is
+          not partitioned.
+        """
+        with self.db_instance.connect() as conn:
+            rows = conn.execute(sqlalchemy.text("""
+                SELECT PARTITION_NAME, PARTITION_DESCRIPTION
+                FROM information_schema.PARTITIONS
+                WHERE TABLE_SCHEMA = DATABASE()
+                  AND TABLE_NAME = :table_name
+                  AND PARTITION_NAME IS NOT NULL
+                ORDER BY PARTITION_ORDINAL_POSITION
+                """), table_name="%s_feed_fetch_log" % self.mode).fetchall()
+        # TO_DAYS('0001-01-01') is 366 while date.toordinal() is 1.
+        return [
+            (row[0], date.fromordinal(int(row[1]) - 365)) for row in rows
+            if row[0] != FUTURE_PARTITION]
+
+    def add_partitions(self, partitions):
+        """Splits new monthly partitions off FUTURE_PARTITION.
+
+        Args:
+          partitions: (name, upper bound date) tuples newer than the
+            existing ones.
+        """
+        if not partitions:
+            return
+        with self.db_instance.connect() as conn:
+            conn.execute("""
+                ALTER TABLE {mode}_feed_fetch_log
+                REORGANIZE PARTITION {future} INTO (
+                    {definitions})
+                """.format(
+                    mode=self.mode, future=FUTURE_PARTITION,
+                    definitions=partition_definitions(partitions)))
+
+    def drop_partitions(self, names):
+        """Drops partitions (and their events) of feed_fetch_log.
+
+        Args:
+          names: Partition names.
+        """
+        if not names:
             return
+        with self.db_instance.connect() as conn:
+            conn.execute("""
+                ALTER TABLE {mode}_feed_fetch_log DROP PARTITION {names}
+                """.format(mode=self.mode, names=", ".join(names)))
+
+    def delete_before(self, cutoff, batch_size=10000):
+        """Deletes events before a time in batches (unpartitioned tables).
+
+        Args:
+          cutoff (datetime): Events fetched before this are deleted.
+          batch_size (int): # of rows deleted per statement, so that locks
+            are held briefly.
+
+        Returns:
+          The # of deleted events.
+        """
+        stmt = sqlalchemy.text("""
+            DELETE FROM {mode}_feed_fetch_log
+            WHERE fetched_time < :cutoff
+            LIMIT {limit:d}
+            """.format(mode=self.mode, limit=batch_size))
+
+        num_deleted = 0
+        with self.db_instance.connect() as conn:
+            while True:
+                result = conn.execute(stmt, cutoff=cutoff)
+                num_deleted += result.rowcount
+                if result.rowcount < batch_size:
+                    break
+        return num_deleted
+
+
+class HostStateDB:
+    """HostStateDB class to interact with host_states table.
+
+    HostStateDB persists the states of CircuitBreaker, so open circuits
+    carry across runs and are shared by crawler workers.
+
+    Attributes:
+      ...
+    """
+    def __init__(self, mode="dev"):
+        self.db_instance = Database.get_instance().connection
+        self.mode = mode
+
+    def load(self):
+        """Loads the states of failing hosts.
+
+        Returns:
+          (host, consecutive failures, open until) tuples for
+          CircuitBreaker.load.
+        """
+        stmt = sqlalchemy.text("""
+            SELECT host, consecutive_failures, open_until
+            FROM {mode}_host_states
+            WHERE consecutive_failures > 0
+            """.format(mode=self.mode))
+
+        try:
+            with self.db_instance.connect() as conn:
+                rows = conn.execute(stmt).fetchall()
+        except self.db_instance.Error as ex:
+            logger.exception(ex)
+            return []
+        return [(row[0], row[1], row[2]) for row in rows]
+
+    def save(self, states):
+        """Saves changed host states (see CircuitBreaker.pop_changed).
+
+        Hosts with no failure are deleted.
+
+        Args:
+          states: (host, consecutive failures, open until) tuples.
+
+        Returns:
+          True if saved.
+        """
+        failing = [
+            {"host": host, "consecutive_failures": failures,
+             "open_until": open_until, "updated_time": datetime.utcnow()}
+            for host, failures, open_until in states if failures > 0]
+        recovered = [host for host, failures, _ in states if failures <= 0]
+
+        upsert_stmt = sqlalchemy.text("""
+            INSERT INTO {mode}_host_states
+            (host, consecutive_failures, open_until, updated_time)
+            VALUES
+            (:host, :consecutive_failures, :open_until, :updated_time)
+            ON DUPLICATE KEY UPDATE
+              consecutive_failures = VALUES(consecutive_failures),
+              open_until = VALUES(open_until),
+              updated_time = VALUES(updated_time)
+            """.format(mode=self.mode))
+        delete_stmt = sqlalchemy.text("""
+            DELETE FROM {mode}_host_states WHERE host IN :hosts
+            """.format(mode=self.mode)
+        ).bindparams(sqlalchemy.bindparam("hosts", expanding=True))
+
+        try:
+            with self.db_instance.connect() as conn:
+                with conn.begin():
+                    if failing:
+                        conn.execute(upsert_stmt, failing)
+                    if recovered:
+                        conn.execute(delete_stmt, hosts=recovered)
+        except self.db_instance.Error as ex:
+            logger.exception(ex)
+            return False
+        return True
+
+    def list_open(self, now):
+        """Lists hosts whose circuit is open.
+
+        Args:
+          now (datetime): The current time (UTC).
+
+        Returns:
+          (host, consecutive failures, open until) tuples.
+        """
+        stmt = sqlalchemy.text("""
+            SELECT host, consecutive_failures, open_until
+            FROM {mode}_host_states
+            WHERE open_until > :now
+            ORDER BY open_until DESC
+            """.format(mode=self.mode))
+
+        with self.db_instance.connect() as conn:
+            rows = conn.execute(stmt, now=now).fetchall()
+        return [(row[0], row[1], row[2]) for row in rows]
+
+    def release(self, host):
+        """Closes the circuit of a host.
+
+        Args:
+          host (string): A host name (netloc).
+        """
+        self.save([(host, 0, None)])
@@ -0,0 +1,150 @@
+"""Tests for leases and quarantine of FeedDB class.
+
+It needs a MySQL 8.0+ instance (SKIP LOCKED), e.g. a local one with
+DB_HOST=127.0.0.1:3306.
+
+Commands:
+$ PYTHONPATH=./ python3 tools/database/reset_feed_tables.py --mode=test --dryrun=false
+$ PYTHONPATH=./ python3 util/feed_db_test.py
+"""
+from datetime import datetime
+import multiprocessing
+import time
+
+from util.circuit_breaker import QUARANTINE_FAILURES
+from util.feed import Feed
+from util.feed_db import FeedDB
+
+NUM_FEEDS = 40
+NUM_WORKERS = 4
+
+def create_feeds(prefix, count):
+    """Inserts feeds due long ago and returns them.
+    """
+    feed_db = FeedDB(mode="test")
+    feeds = []
+    for i in range(count):
+        feed = Feed(
+            url="https://%s.example.com/rss/%d" % (prefix, i),
+            title="Lease test %d" % i, description="Lease test",
+            language="ko", feed_type="RSS", changerate=3600,
+            scheduled_fetch_time=datetime(2000, 1, 1))
+        feed_db.insert_feed(feed)
+        feeds.append(feed)
+    return feeds
+
+def delete_feeds(feeds):
+    """Deletes test feeds.
+    """
+    feed_db = FeedDB(mode="test")
+    for feed in feeds:
+        feed_db.delete_feed(feed.url_key)
+
+def claim_all(worker_id):
+    """Claims due feeds in small batches until none is left.
+
+    Runs in a worker process.
+    """
+    feed_db = FeedDB(mode="test")
+    url_keys = []
+    while True:
+        feeds = feed_db.claim_due_feeds(
+            worker_id, datetime.utcnow(), count=3, lease_secs=60)
+        if not feeds:
+            return url_keys
+        url_keys.extend(feed.url_key for feed in feeds)
+
+def test_claims_are_exclusive():
+    """Tests concurrent workers never claim the same feed.
+    """
+    feeds = create_feeds("claim", NUM_FEEDS)
+    try:
+        # Each process opens its own connection pool.
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(NUM_WORKERS) as pool:
+            claims = pool.map(
+                claim_all, ["worker-%d" % i for i in range(NUM_WORKERS)])
+
+        claimed_keys = [url_key for keys in claims for url_key in keys]
+        assert len(claimed_keys) == len(set(claimed_keys))
+        assert {feed.url_key for feed in feeds} <= set(claimed_keys)
+    finally:
+        delete_feeds(feeds)
+
+def test_expired_lease():
+    """Tests an expired lease is recovered and the former owner is fenced.
+    """
+    feeds = create_feeds("lease", 1)
+    try:
+        feed_db = FeedDB(mode="test")
+        feed_a = [
+            feed for feed in feed_db.claim_due_feeds(
+                "worker-a", datetime.utcnow(), count=1000, lease_secs=1)
+            if feed.url_key == feeds[0].url_key][0]
+        assert feed_a.lease_owner == "worker-a"
+        assert feeds[0].url_key not in [
+            feed.url_key for feed in feed_db.claim_due_feeds(
+                "worker-b", datetime.utcnow(), count=1000)]
+
+        time.sleep(1.5)
+        feed_b = [
+            feed for feed in feed_db.claim_due_feeds(
+                "worker-b", datetime.utcnow(), count=1000)
+            if feed.url_key == feeds[0].url_key][0]
+
+        event = {
+            "fetched_time": datetime.utcnow(), "feed_updated": False,
+            "newest_post_published_date": datetime(1970, 1, 1),
+            "bytes_transferred": 0}
+        assert feed_db.record_fetch(feed_a, dict(event)) is None
+        assert feed_db.record_fetch(feed_b, dict(event)) is not None
+
+        stored_feed = feed_db.lookup_feed(feeds[0].url_key)
+        assert not stored_feed.lease_owner
+        assert stored_feed.scheduled_fetch_time > datetime(2000, 1, 1)
+    finally:
+        delete_feeds(feeds)
+
+def test_quarantine():
+    """Tests a failing feed backs off, is quarantined and released.
+    """
+    feeds = create_feeds("quarantine", 1)
+    try:
+        feed_db = FeedDB(mode="test")
+        feed = feed_db.lookup_feed(feeds[0].url_key)
+        fetched_time = datetime.utcnow()
+        for _ in range(QUARANTINE_FAILURES):
+            feed_db.record_fetch(feed, {
+                "fetched_time": fetched_time, "feed_updated": False,
+                "newest_post_published_date": datetime(1970, 1, 1),
+                "bytes_transferred": 0, "error_class": "HTTP 5xx"})
+
+        stored_feed = feed_db.lookup_feed(feed.url_key)
+        assert stored_feed.consecutive_failures == QUARANTINE_FAILURES
+        assert stored_feed.last_error == "HTTP 5xx"
+        assert stored_feed.quarantined_time
+        assert feed.url_key in [
+            feed.url_key for feed in feed_db.scan_quarantined_feeds()]
+        assert feed.url_key not in [
+            feed.url_key for feed in feed_db.claim_due_feeds(
+                "worker-a", datetime(2100, 1, 1), count=1000)]
+
+        assert feed_db.release_quarantine(feed.url_key)
+        stored_feed = feed_db.lookup_feed(feed.url_key)
+        assert not stored_feed.quarantined_time
+        assert stored_feed.consecutive_failures == 0
+    finally:
+        delete_feeds(feeds)
+
+def main():
+    """Run tests for FeedDB leases and quarantine.
+    """
+    print("TEST started.")
+    test_claims_are_exclusive()
+    test_expired_lease()
+    test_quarantine()
+    print("TEST completed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Fingerprints of feed documents.
+
+  Many hosts ignore conditional requests and send the whole feed on every
+  fetch. The crawler keeps two fingerprints of the last document it read on
+  the feed row, and skips parsing a document which matches either:
+
+  - The body fingerprint is a hash of the document with volatile parts
+    (comments, whitespace and the build time of the channel) dropped.
+  - The link fingerprint is a hash of the list of item links, which stays
+    the same while no item is added or removed, even if the text of an item
+    or an unknown volatile part changes.
+
+  Both scan the bytes with regular expressions, which costs a fraction of
+  parsing the document.
+
+  Typical usage example:
+
+  from util.feed_fingerprint import body_fingerprint, link_fingerprint
+
+  fingerprints = (body_fingerprint(content), link_fingerprint(content))
+"""
+import hashlib
+import re
+
+# Where the items of an RSS or Atom document start.
+FIRST_ITEM_PATTERN = re.compile(rb"<(?:item|entry)[\s>]")
+COMMENT_PATTERN = re.compile(rb"<!--.*?-->", re.DOTALL)
+# Elements of the channel (before the first item) which change on every
+# build of a document.
+VOLATILE_CHANNEL_PATTERN = re.compile(
+    rb"<(lastBuildDate|pubDate|updated|dc:date)\b[^>]*>.*?</\1\s*>",
+    re.DOTALL)
+WHITESPACE_PATTERN = re.compile(rb"\s+")
+# <link>URL</link> of RSS and <link href="URL"/> of Atom.
+ITEM_LINK_PATTERN = re.compile(
+    rb"<link\s*>\s*(?:<!\[CDATA\[)?\s*([^<\]]*?)\s*(?:\]\]>)?\s*</link\s*>|"
+    rb"<link\b[^>]*?\bhref\s*=\s*[\"']([^\"']*)[\"']")
+
+def split_items(content):
+    """Splits a feed document at the first item.
+
+    Returns:
+      A tuple of (the channel part, the items part) as bytes.
+    """
+    match = FIRST_ITEM_PATTERN.search(content)
+    if match is None:
+        return content, b""
+    return content[:match.start()], content[match.start():]
+
+def body_fingerprint(content):
+    """Returns the fingerprint of a normalized feed document.
+
+    Args:
+      content: A feed document as bytes.
+
+    Returns:
+      A hex digest, or "" for an empty document.
+    """
+    if not content:
+        return ""
+    content = COMMENT_PATTERN.sub(b"", content)
+    channel, items = split_items(content)
+    channel = VOLATILE_CHANNEL_PATTERN.sub(b"", channel)
+    normalized = WHITESPACE_PATTERN.sub(b" ", channel + items).strip()
+    return hashlib.sha1(normalized).hexdigest()
+
+def link_fingerprint(content):
+    """Returns the fingerprint of the item links of a feed document.
+
+    Args:
+      content: A feed document as bytes.
+
+    Returns:
+      A hex digest, or "" if no item link is found.
+    """
+    if not content:
+        return ""
+    _, items = split_items(COMMENT_PATTERN.sub(b"", content))
+    links = [
+        rss_link or atom_link
+        for rss_link, atom_link in ITEM_LINK_PATTERN.findall(items)]
+    if not links:
+        return ""
+    return hashlib.sha1(b"\n".join(links)).hexdigest()
@@ -0,0 +1,82 @@
+"""Tests for fingerprints of feed documents.
+
+Commands:
+$ PYTHONPATH=./ python3 util/feed_fingerprint_test.py
+"""
+import os
+
+from util.feed_fingerprint import body_fingerprint, link_fingerprint
+
+TESTDATA_DIR = os.path.join(os.path.dirname(__file__), "testdata")
+
+def read_testdata(name):
+    """Returns a test document as bytes.
+    """
+    with open(os.path.join(TESTDATA_DIR, name), "rb") as testdata_file:
+        return testdata_file.read()
+
+def test_body_fingerprint():
+    """Tests volatile parts of a document don't change the fingerprint.
+    """
+    content = read_testdata("sample_rss.xml")
+    fingerprint = body_fingerprint(content)
+    assert fingerprint
+    assert body_fingerprint(b"") == ""
+
+    rebuilt = content.replace(
+        b"<lastBuildDate>Mon, 05 Oct 2020 09:00:00 +0900</lastBuildDate>",
+        b"<lastBuildDate>Tue, 06 Oct 2020 10:00:00 +0900</lastBuildDate>"
+        b"\n<!-- Generated in 0.12 secs -->")
+    assert rebuilt != content
+    assert body_fingerprint(rebuilt) == fingerprint
+    assert body_fingerprint(content.replace(b"\n", b"\r\n")) == fingerprint
+
+    edited = content.replace(b"Second post", b"Second post (edited)")
+    assert body_fingerprint(edited) != fingerprint
+
+    # The dates of the items are kept.
+    atom = read_testdata("sample_atom.xml")
+    assert body_fingerprint(atom.replace(
+        b"<updated>2020-10-05T09:00:00+09:00</updated>",
+        b"<updated>2020-10-06T09:00:00+09:00</updated>")) == body_fingerprint(
+            atom)
+    assert body_fingerprint(atom.replace(
+        b"<updated>2020-10-04T08:00:00+09:00</updated>",
+        b"<updated>2020-10-06T08:00:00+09:00</updated>")) != body_fingerprint(
+            atom)
+
+def test_link_fingerprint():
+    """Tests the fingerprint follows the item links only.
+    """
+    content = read_testdata("sample_rss.xml")
+    fingerprint = link_fingerprint(content)
+    assert fingerprint
+    edited = content.replace(b"Second post", b"Second post (edited)")
+    assert link_fingerprint(edited) == fingerprint
+    # The link of the channel is not an item link.
+    assert link_fingerprint(content.replace(
+        b"<link>https://sample.tistory.com</link>",
+        b"<link>https://sample.tistory.com/</link>")) == fingerprint
+    added = content.replace(
+        b"<item>",
+        b"<item><title>New</title><link>https://sample.tistory.com/4</link>"
+        b"</item><item>", 1)
+    assert link_fingerprint(added) != fingerprint
+
+    atom = read_testdata("sample_atom.xml")
+    assert link_fingerprint(atom)
+    assert link_fingerprint(atom) != link_fingerprint(atom.replace(
+        b"https://atom.example.com/posts/1", b"https://atom.example.com/posts/3"))
+    assert link_fingerprint(b"<rss><channel></channel></rss>") == ""
+
+def main():
+    """Run tests for feed fingerprints.
+    """
+    print("TEST started.")
+    test_body_fingerprint()
+    test_link_fingerprint()
+    print("TEST completed.")
+
+
+if __name__ == "__main__":
+    main()
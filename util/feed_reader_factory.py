@@ -9,74 +9,46 @@
   reader = FeedReaderFactory().get_reader(
       feed_type=feed_type, url=url, feed_content=feed.content)
   items = reader.read(count=10)
+
+  lxml readers are much faster than the BeautifulSoup ones:
+
+  reader = FeedReaderFactory().get_reader(
+      feed_type=feed_type, url=url, feed_content=feed.content,
+      backend="lxml")
+
+  Parsing in a worker process:
+
+  with ProcessPoolExecutor() as executor:
+      items = executor.submit(
+          parse_feed_items, url, feed.content, count=10).result()
 """
 import html
 import logging
+import re
 from urllib.parse import urlparse
 
 from bs4 import BeautifulSoup
 from dateutil.parser import parse
+from lxml import etree
 from util.feed import FeedItem
+from util.feed_text import (
+    READ_ITEM, STOP_READING, ItemCutoff, extract_from_cdata,
+    extract_from_post, strip_tistory_ads)
+from util.streaming_feed_reader import (
+    StreamingFeedReader, atom_item_from_element, atom_item_url, element_text,
+    find_child, local_name, rss_item_from_element, rss_item_url)
 
 logger = logging.getLogger()
 
 MAX_NUM_RECORDS_TO_READ_PER_FEED = 10000
-MAX_SUMMARY_LENGTH = 150
-
-def extract_from_post(html_text):
-    """Extracts summary text from a RSS summary record.
-
-    Truncates if the text exceeds the threshold.
-
-    Args:
-      html: A text in html.
-
-    Returns:
-      An extracted string from the RSS summary record.
-    """
-    summary_soup = BeautifulSoup(html_text, "html.parser")
-    summary = ""
-    if summary_soup.body:
-        summary_soup = summary_soup.body
-
-    for text in summary_soup.find_all(text=True):
-        unescaped_text = html.unescape(text)
-        summary += "{} ".format(unescaped_text)
-        if len(summary) > MAX_SUMMARY_LENGTH:
-            break
-
-    logger.info("Extracted summary: %s", summary[:MAX_SUMMARY_LENGTH])
-    return summary[:MAX_SUMMARY_LENGTH]
-
-def extract_from_cdata(txt):
-    """Extracts text from CDATA.
-
-    Args:
-      txt: A CDATA string. e.g. <![CDATA[Test]]>
-
-    Returns:
-      An extracted string from the input CDATA string.
-    """
-    result = ""
-    soup = BeautifulSoup(txt, "xml")
-    for cdata in soup.findAll(text=True):
-        if isinstance(cdata, BeautifulSoup.CData):
-            result += "{}".format(html.unescape(repr(cdata)))
-        else:
-            result += "{}".format(html.unescape(cdata))
-    return result
-
-def is_tistory(url):
-    """True if it's a Tistory blog.
-
-    Args:
-      url: A URL string.
-
-    Returns:
-      True if Tistory.
-    """
-    t = urlparse(url).netloc
-    return ".".join(t.split(".")[1:]) == "tistory.com"
+# Feed reader backends (see FeedReaderFactory.get_reader).
+READER_BACKENDS = ("soup", "lxml", "stream")
+DEFAULT_READER_BACKEND = "soup"
+# The # of bytes to look for the root element to infer feed type.
+SNIFF_BYTES = 4096
+XML_COMMENT_PATTERN = re.compile(r"<!--.*?-->", re.DOTALL)
+# The first tag which is not a declaration (<?xml ...?>, <!DOCTYPE ...>).
+ROOT_ELEMENT_PATTERN = re.compile(r"<([A-Za-z_][\w.:-]*)")
 
 # <rss version="2.0">
 #   <channel>
@@ -101,17 +73,24 @@ class RssReader:
         if channel.generator:
             self.generator = channel.generator.text
 
-    def read(self, count=1):
+    def read(self, count=1, published_after=None, stop_at_url=""):
         """Parses the RSS feed and returns 'count' number of items.
 
         Args:
           count: the number of items to return.
+          published_after: A timezone-aware datetime. Items published
+            before it are skipped (optional).
+          stop_at_url: The URL of the newest item seen by the previous
+            fetch. Stops at the item unless it is the first one, so only
+            newer items are returned (optional).
 
         Returns:
           A list of items parsed from the feed.
         """
         items = []
         num_entries = 0
+        cutoff = ItemCutoff(
+            published_after=published_after, stop_at_url=stop_at_url)
         for i in self.feed_soup.findAll("item"):
             if num_entries >= count:
                 break
@@ -119,6 +98,11 @@ class RssReader:
             url = i.link.text
             if not url:
                 raise ValueError("Empty <link>")
+            action = cutoff.check_url(url)
+            if action == STOP_READING:
+                break
+            if action != READ_ITEM:
+                continue
 
             updated = ""
             if i.find("pubDate"):
@@ -137,17 +121,18 @@ class RssReader:
 
             title = html.unescape(i.title.text)
             description = extract_from_post(i.description.text)
-
-            if is_tistory(self.url):
-                # The last two characters of "(adsbygoogle = window.adsbygoogle || []).push({});"
-                start_idx = description.find(");")
-                start_idx = 0 if start_idx < 0 else start_idx + 2
-                description = description[start_idx:]
+            description = strip_tistory_ads(self.url, description)
 
             description = description.strip()
-            items.append(FeedItem(
+            item = FeedItem(
                 url=url, title=title, description=description,
-                published_date=updated, author=author))
+                published_date=updated, author=author)
+            action = cutoff.check_item(item)
+            if action == STOP_READING:
+                break
+            if action != READ_ITEM:
+                continue
+            items.append(item)
 
             num_entries += 1
 
@@ -166,29 +151,44 @@ class AtomReader:
         self.feed_soup = BeautifulSoup(self.feed_content, "xml")
 
         feed = self.feed_soup.feed
-        self.author = feed.author.name.text
+        # Tag.name is the tag's own name, so find the <name> child explicitly.
+        self.author = ""
+        if feed.author and feed.author.find("name"):
+            self.author = feed.author.find("name").get_text()
         self.title = feed.title.text
         self.language = ""
         self.description = ""
         self.generator = ""
 
 
-    def read(self, count=1):
+    def read(self, count=1, published_after=None, stop_at_url=""):
         """Parses the ATOM feed and returns 'count' number of items.
 
         Args:
           count: the number of items to return.
+          published_after: A timezone-aware datetime. Items published
+            before it are skipped (optional).
+          stop_at_url: The URL of the newest item seen by the previous
+            fetch. Stops at the item unless it is the first one, so only
+            newer items are returned (optional).
 
         Returns:
           A list of items parsed from the feed.
         """
         items = []
         num_entries = 0
+        cutoff = ItemCutoff(
+            published_after=published_after, stop_at_url=stop_at_url)
         for i in self.feed_soup.find_all("entry"):
             if num_entries >= count:
                 break
 
             url = i.find("link")["href"]
+            action = cutoff.check_url(url)
+            if action == STOP_READING:
+                break
+            if action != READ_ITEM:
+                continue
 
             updated = ''
             if i.find("updated"):
@@ -198,14 +198,196 @@ class AtomReader:
             title = html.unescape(i.find("title").get_text())
 
             description = description.strip()
-            
-            items.append(FeedItem(
+
+            item = FeedItem(
                 url=url, title=title, description=description,
-                published_date=updated, author=author))
+                published_date=updated, author=author)
+            action = cutoff.check_item(item)
+            if action == STOP_READING:
+                break
+            if action != READ_ITEM:
+                continue
+            items.append(item)
             num_entries += 1
 
         return items
 
+def parse_xml(feed_content):
+    """Parses a feed document into an lxml element tree.
+
+    Bytes are given to libxml2 as they are, so the encoding in the XML
+    declaration is honored without a decode step.
+
+    Args:
+      feed_content: The content of the feed (bytes or string).
+
+    Returns:
+      The root element (None if the document is empty or broken).
+    """
+    if isinstance(feed_content, str):
+        feed_content = feed_content.encode("utf-8")
+    parser = etree.XMLParser(
+        recover=True, resolve_entities=False, remove_comments=True)
+    try:
+        return etree.fromstring(feed_content, parser=parser)
+    except etree.XMLSyntaxError as ex:
+        logger.warning("Failed to parse a feed: %s", ex)
+        return None
+
+# <rss version="2.0">
+#   <channel>
+class LxmlRssReader:
+    """LxmlRssReader parses an RSS feed with lxml.
+
+    Items have the same fields as the ones from RssReader.
+
+    Attributes:
+      feed_content: The content of the feed.
+    """
+    def __init__(self, url, feed_content):
+        self.url = url
+        self.feed_content = feed_content
+        self.root = parse_xml(feed_content)
+
+        self.author = ""
+        self.title = ""
+        self.description = ""
+        self.language = ""
+        self.generator = ""
+        channel = find_child(self.root, "channel") if (
+            self.root is not None) else None
+        if channel is None:
+            raise ValueError("No <channel> in the RSS feed: %s" % url)
+        for name in ("title", "description", "language", "generator"):
+            element = find_child(channel, name, namespace="")
+            if element is not None:
+                setattr(self, name, element_text(element))
+
+    def read(self, count=1, published_after=None, stop_at_url=""):
+        """Parses the RSS feed and returns 'count' number of items.
+
+        Args:
+          count: the number of items to return.
+          published_after: A timezone-aware datetime. Items published
+            before it are skipped (optional).
+          stop_at_url: The URL of the newest item seen by the previous
+            fetch. Stops at the item unless it is the first one, so only
+            newer items are returned (optional).
+
+        Returns:
+          A list of items parsed from the feed.
+        """
+        items = []
+        cutoff = ItemCutoff(
+            published_after=published_after, stop_at_url=stop_at_url)
+        for element in self.root.iter("item"):
+            if len(items) >= count:
+                break
+            action = cutoff.check_url(rss_item_url(element))
+            if action == READ_ITEM:
+                item = rss_item_from_element(self.url, element)
+                action = cutoff.check_item(item)
+            if action == STOP_READING:
+                break
+            if action == READ_ITEM:
+                items.append(item)
+
+        return items
+
+# <feed xmlns="http://www.w3.org/2005/Atom">
+class LxmlAtomReader:
+    """LxmlAtomReader parses an ATOM feed with lxml.
+
+    Items have the same fields as the ones from AtomReader.
+
+    Attributes:
+      feed_content: The content of the feed.
+    """
+    def __init__(self, url, feed_content):
+        self.url = url
+        self.feed_content = feed_content
+        self.root = parse_xml(feed_content)
+        if self.root is None:
+            raise ValueError("Empty ATOM feed: %s" % url)
+
+        self.author = ""
+        author = find_child(self.root, "author")
+        if author is not None and find_child(author, "name") is not None:
+            self.author = element_text(find_child(author, "name"))
+        title = find_child(self.root, "title")
+        self.title = element_text(title) if title is not None else ""
+        self.language = ""
+        self.description = ""
+        self.generator = ""
+
+    def read(self, count=1, published_after=None, stop_at_url=""):
+        """Parses the ATOM feed and returns 'count' number of items.
+
+        Args:
+          count: the number of items to return.
+          published_after: A timezone-aware datetime. Items published
+            before it are skipped (optional).
+          stop_at_url: The URL of the newest item seen by the previous
+            fetch. Stops at the item unless it is the first one, so only
+            newer items are returned (optional).
+
+        Returns:
+          A list of items parsed from the feed.
+        """
+        items = []
+        cutoff = ItemCutoff(
+            published_after=published_after, stop_at_url=stop_at_url)
+        for element in self.root:
+            if len(items) >= count:
+                break
+            if local_name(element) != "entry":
+                continue
+            action = cutoff.check_url(atom_item_url(element))
+            if action == READ_ITEM:
+                item = atom_item_from_element(element)
+                action = cutoff.check_item(item)
+            if action == STOP_READING:
+                break
+            if action == READ_ITEM:
+                items.append(item)
+
+        return items
+
+def sniff_feed_type(content, max_bytes=SNIFF_BYTES):
+    """Infers feed type from the root element in the first bytes.
+
+    Skips the XML declaration, comments, processing instructions and the
+    doctype without parsing the document.
+
+    Args:
+      content (bytes or string): A feed document.
+      max_bytes (int): The # of bytes to look at.
+
+    Returns:
+      "RSS", "ATOM" or "UNKNOWN".
+    """
+    head = content[:max_bytes]
+    if isinstance(head, bytes):
+        if head.startswith((b"\xff\xfe", b"\xfe\xff")):
+            head = head.decode("utf-16", errors="ignore")
+        else:
+            # Tag names of feeds are ASCII in any ASCII compatible encoding.
+            head = head.decode("latin-1")
+
+    head = XML_COMMENT_PATTERN.sub("", head)
+    match = ROOT_ELEMENT_PATTERN.search(head)
+    if not match:
+        return "UNKNOWN"
+
+    # e.g. <rss>, <atom:feed>
+    root_name = match.group(1).split(":")[-1].lower()
+    if root_name == "rss":
+        return "RSS"
+    elif root_name == "feed":
+        return "ATOM"
+    else:
+        return "UNKNOWN"
+
 def infer_feed_type(url, content):
     """Infer feed type from URL and its content
 
@@ -214,7 +396,7 @@ def infer_feed_type(url, content):
       content (string)
 
     Returns:
-      An extracted string from the RSS summary record.
+      "RSS", "ATOM" or "UNKNOWN".
     """
     # Infer from URL.
     parsed_url = urlparse(url)
@@ -224,16 +406,7 @@ def infer_feed_type(url, content):
         return "RSS"
 
     # Infer from content.
-    soup = BeautifulSoup(content, "xml")
-
-    if soup.rss:
-        return "RSS"
-    elif soup.feed:
-        # Could be more stable to check xmlns in
-        #   <feed xmlns="http://www.w3.org/2005/Atom"...
-        return "ATOM"
-    else:
-        return "UNKNOWN"
+    return sniff_feed_type(content)
 
 class FeedReaderFactory:
     """FeedReaderFactory class to return a feed reader.
@@ -244,17 +417,29 @@ class FeedReaderFactory:
       ...
     """
     # pylint: disable=unused-argument
-    def get_reader(self, feed_type, url, feed_content=""):
+    def get_reader(
+            self, feed_type, url, feed_content="",
+            backend=DEFAULT_READER_BACKEND):
         """Returns a feed reader object by feed type.
 
         Args:
           feed_type: The type of the feed.
           url: The feed URL.
           feed_content: The content of the feed.
+          backend: "soup" (BeautifulSoup tree), "lxml" (lxml tree) or
+            "stream" (incremental parsing with early termination).
 
         Returns:
           A feed reader object.
         """
+        if backend == "stream" and feed_type in ("RSS", "ATOM"):
+            return StreamingFeedReader(url=url, feed_content=feed_content)
+        if backend == "lxml":
+            if feed_type == "RSS":
+                return LxmlRssReader(url=url, feed_content=feed_content)
+            if feed_type == "ATOM":
+                return LxmlAtomReader(url=url, feed_content=feed_content)
+
         if feed_type == "RSS":
             return RssReader(url=url, feed_content=feed_content)
         elif feed_type == "ATOM":
@@ -264,3 +449,62 @@ class FeedReaderFactory:
             return None
         else:
             return None
+
+def parse_feed_items(
+        url, feed_content, count, feed_type="",
+        backend=DEFAULT_READER_BACKEND, published_after=None,
+        stop_at_url="", max_count=0):
+    """Parses a feed document and returns its items.
+
+    A module-level function taking and returning plain data, so it can run in
+    a worker process (e.g. concurrent.futures.ProcessPoolExecutor).
+
+    Items above the high-water mark are new, so with 'stop_at_url' reading
+    goes on past 'count' items in the same pass, up to 'max_count', until
+    the mark.
+
+    Args:
+      url (string): A feed URL.
+      feed_content (bytes): The raw content of the feed.
+      count (int): The max # of items to return.
+      feed_type (string): The type of the feed, e.g. the stored one in feeds
+        table. Inferred if empty or if parsing as the type fails.
+      backend (string): The reader backend (see FeedReaderFactory).
+      published_after (datetime): Items published before it are skipped
+        (optional).
+      stop_at_url (string): The URL of the newest item seen by the previous
+        fetch (the high-water mark). Stops at the item unless it is the
+        first one (optional).
+      max_count (int): The max # of items to return with 'stop_at_url'
+        (optional).
+
+    Returns:
+      A list of FeedItem instances.
+    """
+    if stop_at_url and max_count > count:
+        count = max_count
+    if feed_type not in ("RSS", "ATOM"):
+        feed_type = infer_feed_type(url, feed_content)
+
+    def read_items(feed_type):
+        reader = FeedReaderFactory().get_reader(
+            feed_type=feed_type, url=url, feed_content=feed_content,
+            backend=backend)
+        if reader is None:
+            logger.warning("Unsupported feed type (%s): %s", feed_type, url)
+            return []
+        return reader.read(
+            count=count, published_after=published_after,
+            stop_at_url=stop_at_url)
+
+    try:
+        return read_items(feed_type)
+    except (AttributeError, TypeError, ValueError) as ex:
+        # The feed may have moved to another format since it was added.
+        inferred_feed_type = infer_feed_type(url, feed_content)
+        if inferred_feed_type == feed_type:
+            raise
+        logger.warning(
+            "Failed to parse %s as %s, retrying as %s: %s", url, feed_type,
+            inferred_feed_type, ex)
+        return read_items(inferred_feed_type)
@@ -0,0 +1,124 @@
+"""Tests for feed readers.
+
+Commands:
+$ PYTHONPATH=./ python3 util/feed_reader_factory_test.py
+"""
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+from util.feed_reader_factory import (
+    FeedReaderFactory, LxmlAtomReader, LxmlRssReader, parse_feed_items,
+    sniff_feed_type)
+
+TESTDATA_PATH = os.path.join(os.path.dirname(__file__), "testdata")
+
+def read_testdata(filename):
+    """Reads a test feed document as bytes.
+    """
+    with open(os.path.join(TESTDATA_PATH, filename), "rb") as feed_file:
+        return feed_file.read()
+
+def item_fields(items):
+    """Returns comparable fields of FeedItems.
+    """
+    return [
+        (item.url, item.title, item.description, item.published_date,
+         item.author) for item in items]
+
+def test_parse_rss():
+    """Tests parse_feed_items on an RSS feed.
+    """
+    items = parse_feed_items(
+        "https://sample.tistory.com/rss", read_testdata("sample_rss.xml"),
+        count=2)
+
+    assert len(items) == 2
+    assert items[0].url == "https://sample.tistory.com/3"
+    assert items[0].title == "첫 번째 글 & 소개"
+    assert items[0].author == "Kim & Lee"
+    assert items[1].author == "Test Lee"
+
+def test_parse_atom():
+    """Tests parse_feed_items on an ATOM feed.
+    """
+    items = parse_feed_items(
+        "https://atom.example.com/feed", read_testdata("sample_atom.xml"),
+        count=10)
+
+    assert len(items) == 2
+    assert items[0].url == "https://atom.example.com/posts/2"
+    assert items[0].author == "Choi"
+
+def test_lxml_readers():
+    """Tests lxml readers return the same items as BeautifulSoup readers.
+    """
+    feeds = [
+        ("RSS", "https://sample.tistory.com/rss", "sample_rss.xml"),
+        ("ATOM", "https://atom.example.com/feed", "sample_atom.xml")]
+    for feed_type, url, filename in feeds:
+        content = read_testdata(filename)
+        factory = FeedReaderFactory()
+        reader = factory.get_reader(
+            feed_type=feed_type, url=url, feed_content=content,
+            backend="lxml")
+        soup_reader = factory.get_reader(
+            feed_type=feed_type, url=url, feed_content=content)
+
+        assert isinstance(reader, (LxmlRssReader, LxmlAtomReader))
+        assert reader.title == soup_reader.title
+        assert reader.author == soup_reader.author
+        assert item_fields(reader.read(count=10)) == item_fields(
+            soup_reader.read(count=10))
+
+def test_sniff_feed_type():
+    """Tests feed type is inferred from the root element.
+    """
+    assert sniff_feed_type(read_testdata("sample_rss.xml")) == "RSS"
+    assert sniff_feed_type(read_testdata("sample_atom.xml")) == "ATOM"
+    assert sniff_feed_type(
+        b'<?xml version="1.0"?><!-- <rss> --><!DOCTYPE feed>'
+        b'<feed xmlns="http://www.w3.org/2005/Atom"></feed>') == "ATOM"
+    assert sniff_feed_type(
+        '<?xml version="1.0"?><rss version="2.0"/>'.encode(
+            "utf-16")) == "RSS"
+    assert sniff_feed_type(b"<html><body>Not found</body></html>") == (
+        "UNKNOWN")
+
+def test_parse_with_wrong_feed_type():
+    """Tests feed type is inferred again if parsing as the given type fails.
+    """
+    for backend in ("soup", "lxml", "stream"):
+        items = parse_feed_items(
+            "https://atom.example.com/feed", read_testdata("sample_atom.xml"),
+            count=10, feed_type="RSS", backend=backend)
+        assert len(items) == 2
+
+def test_parse_in_process_pool():
+    """Tests items parsed in a worker process match in-process results.
+    """
+    feeds = [
+        ("https://sample.tistory.com/rss", read_testdata("sample_rss.xml")),
+        ("https://atom.example.com/feed", read_testdata("sample_atom.xml"))]
+
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        for url, content in feeds:
+            pooled_items = executor.submit(
+                parse_feed_items, url, content, 10).result()
+            items = parse_feed_items(url, content, 10)
+            assert item_fields(pooled_items) == item_fields(items)
+
+def main():
+    """Run tests for feed readers.
+    """
+    print("TEST started.")
+    test_parse_rss()
+    test_parse_atom()
+    test_lxml_readers()
+    test_sniff_feed_type()
+    test_parse_with_wrong_feed_type()
+    test_parse_in_process_pool()
+    print("TEST completed.")
+
+
+if __name__ == "__main__":
+    main()
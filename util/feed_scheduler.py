@@ -0,0 +1,104 @@
+"""FeedScheduler class definition.
+
+  FeedScheduler keeps feeds in a min-heap keyed on scheduled_fetch_time and
+  hands out feeds when they are due.
+
+  Typical usage example:
+
+  from util.feed_scheduler import FeedScheduler
+
+  scheduler = FeedScheduler()
+  for feed in feed_db.scan_due_feeds(due_time=datetime.utcnow()):
+      scheduler.push(feed)
+
+  for feed in scheduler.pop_due(datetime.utcnow()):
+      process(feed)
+"""
+import heapq
+import itertools
+
+class FeedScheduler:
+    """FeedScheduler holds feeds ordered by their scheduled fetch time.
+
+    A feed is in the scheduler at most once. Pushing a feed which is already
+    scheduled replaces its schedule; the stale heap entry is skipped when it
+    reaches the top of the heap.
+
+    Attributes:
+      ...
+    """
+    def __init__(self):
+        # Heap entries: [scheduled_fetch_time, sequence #, url_key].
+        self._heap = []
+        # url_key -> (Feed, sequence # of the live heap entry).
+        self._feeds = {}
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return len(self._feeds)
+
+    def __contains__(self, url_key):
+        return url_key in self._feeds
+
+    def push(self, feed, scheduled_fetch_time=None):
+        """Schedules a feed.
+
+        Args:
+          feed: A Feed instance.
+          scheduled_fetch_time: A datetime (UTC) to fetch the feed at. Uses
+            feed.scheduled_fetch_time if None.
+        """
+        if scheduled_fetch_time is None:
+            scheduled_fetch_time = feed.scheduled_fetch_time
+
+        sequence = next(self._sequence)
+        self._feeds[feed.url_key] = (feed, sequence)
+        heapq.heappush(
+            self._heap, [scheduled_fetch_time, sequence, feed.url_key])
+
+    def remove(self, url_key):
+        """Unschedules a feed.
+
+        Args:
+          url_key: A hash of a feed URL.
+        """
+        self._feeds.pop(url_key, None)
+
+    def next_fetch_time(self):
+        """Returns the earliest scheduled fetch time or None if empty.
+        """
+        self._drop_stale_entries()
+        if not self._heap:
+            return None
+        return self._heap[0][0]
+
+    def pop_due(self, now, count=None):
+        """Pops feeds scheduled at or before 'now'.
+
+        Args:
+          now: A datetime (UTC).
+          count: Max # of feeds to pop (no limit if None).
+
+        Returns:
+          A list of due Feed instances, the earliest first.
+        """
+        due_feeds = []
+        while count is None or len(due_feeds) < count:
+            self._drop_stale_entries()
+            if not self._heap or self._heap[0][0] > now:
+                break
+
+            _, _, url_key = heapq.heappop(self._heap)
+            feed, _ = self._feeds.pop(url_key)
+            due_feeds.append(feed)
+
+        return due_feeds
+
+    def _drop_stale_entries(self):
+        """Pops heap entries replaced by a later push or removed.
+        """
+        while self._heap:
+            _, sequence, url_key = self._heap[0]
+            if url_key in self._feeds and self._feeds[url_key][1] == sequence:
+                return
+            heapq.heappop(self._heap)
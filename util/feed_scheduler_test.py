@@ -0,0 +1,76 @@
+"""Tests for FeedScheduler class.
+
+Commands:
+$ PYTHONPATH=./ python3 util/feed_scheduler_test.py
+"""
+from datetime import datetime, timedelta
+
+from util.feed import Feed
+from util.feed_scheduler import FeedScheduler
+
+BASE_TIME = datetime(2020, 10, 5, 9, 0, 0)
+
+def create_feed(name, minutes):
+    """Creates a feed scheduled 'minutes' after BASE_TIME.
+    """
+    return Feed(
+        url="https://{}.example.com/rss".format(name), title=name,
+        description="", language="ko",
+        scheduled_fetch_time=BASE_TIME + timedelta(minutes=minutes))
+
+def test_pop_due_in_order():
+    """Tests due feeds are popped in the order of scheduled fetch time.
+    """
+    scheduler = FeedScheduler()
+    scheduler.push(create_feed("c", 30))
+    scheduler.push(create_feed("a", 10))
+    scheduler.push(create_feed("b", 20))
+
+    assert scheduler.next_fetch_time() == BASE_TIME + timedelta(minutes=10)
+
+    due_feeds = scheduler.pop_due(BASE_TIME + timedelta(minutes=20))
+    assert [feed.title for feed in due_feeds] == ["a", "b"]
+    assert len(scheduler) == 1
+    assert scheduler.pop_due(BASE_TIME) == []
+
+def test_push_replaces_schedule():
+    """Tests rescheduling a feed keeps a single entry with the new time.
+    """
+    scheduler = FeedScheduler()
+    feed = create_feed("a", 10)
+    scheduler.push(feed)
+    scheduler.push(feed, scheduled_fetch_time=BASE_TIME + timedelta(hours=1))
+
+    assert len(scheduler) == 1
+    assert scheduler.pop_due(BASE_TIME + timedelta(minutes=30)) == []
+    assert scheduler.next_fetch_time() == BASE_TIME + timedelta(hours=1)
+
+    due_feeds = scheduler.pop_due(BASE_TIME + timedelta(hours=1))
+    assert len(due_feeds) == 1
+    assert scheduler.next_fetch_time() is None
+
+def test_remove():
+    """Tests removed feeds are not popped.
+    """
+    scheduler = FeedScheduler()
+    feed = create_feed("a", 10)
+    scheduler.push(feed)
+    scheduler.push(create_feed("b", 20))
+    scheduler.remove(feed.url_key)
+
+    assert feed.url_key not in scheduler
+    due_feeds = scheduler.pop_due(BASE_TIME + timedelta(hours=1), count=1)
+    assert [feed.title for feed in due_feeds] == ["b"]
+
+def main():
+    """Run tests for FeedScheduler.
+    """
+    print("TEST started.")
+    test_pop_due_in_order()
+    test_push_replaces_schedule()
+    test_remove()
+    print("TEST completed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""Text helpers shared by feed readers.
+
+  Typical usage example:
+
+  from util.feed_text import extract_from_post
+
+  summary = extract_from_post("<p>Hello</p>")
+"""
+import html
+from html.parser import HTMLParser
+import logging
+import re
+from urllib.parse import urlparse
+
+from bs4 import BeautifulSoup
+
+logger = logging.getLogger()
+
+MAX_SUMMARY_LENGTH = 150
+# Characters to parse at a time until a summary is long enough.
+SUMMARY_CHUNK_SIZE = 1024
+BODY_TAG_PATTERN = re.compile(r"<body[\s/>]", re.IGNORECASE)
+# Readers stop after this many old (or seen) items in a row.
+MAX_CONSECUTIVE_OLD_ITEMS = 3
+# What ItemCutoff tells a reader to do with an item.
+READ_ITEM = "read"
+SKIP_ITEM = "skip"
+STOP_READING = "stop"
+
+class SummaryParser(HTMLParser):
+    """SummaryParser collects text nodes of an HTML document up to a limit.
+
+    Text nodes are the ones BeautifulSoup(html_text, "html.parser") finds
+    with find_all(text=True): text, comments, declarations and CDATA. Only
+    the ones in <body> are collected if the document has a <body>. Data
+    fed in several pieces (e.g. across chunks) is kept pending until the
+    next markup, so it makes a single text node as with BeautifulSoup.
+
+    Attributes:
+      texts: Collected (unescaped) text nodes.
+      length: The length of the summary built from 'texts'.
+    """
+    def __init__(self, max_length, has_body=False):
+        super().__init__(convert_charrefs=True)
+        self.max_length = max_length
+        self.texts = []
+        self.length = 0
+        self._in_body = not has_body
+        # Pieces of the text node being read.
+        self._pending = []
+
+    def is_full(self):
+        """True if enough text is collected.
+
+        The pending text node is collected if it makes the summary long
+        enough, as the rest of it would be cut anyway.
+        """
+        if self.length > self.max_length:
+            return True
+        if self._pending and self.length + len(
+                html.unescape("".join(self._pending))) >= self.max_length:
+            self._flush()
+            return True
+        return False
+
+    def close(self):
+        """Parses the rest of the buffered input and ends the last node.
+        """
+        super().close()
+        self._flush()
+
+    def _flush(self):
+        if self._pending:
+            text = "".join(self._pending)
+            self._pending = []
+            self._add(text)
+
+    def _add(self, text):
+        if not self._in_body or self.length > self.max_length:
+            return
+        unescaped_text = html.unescape(text)
+        self.texts.append(unescaped_text)
+        # Each text node is followed by a space.
+        self.length += len(unescaped_text) + 1
+
+    def handle_starttag(self, tag, attrs):
+        self._flush()
+        if tag == "body":
+            self._in_body = True
+
+    def handle_endtag(self, tag):
+        self._flush()
+        if tag == "body":
+            self._in_body = False
+
+    def handle_data(self, data):
+        if self._in_body:
+            self._pending.append(data)
+
+    def handle_comment(self, data):
+        self._flush()
+        self._add(data)
+
+    def handle_decl(self, decl):
+        self._flush()
+        if decl.startswith("DOCTYPE "):
+            decl = decl[len("DOCTYPE "):]
+        self._add(decl)
+
+    def unknown_decl(self, data):
+        self._flush()
+        if data.upper().startswith("CDATA["):
+            data = data[len("CDATA["):]
+        self._add(data)
+
+    def handle_pi(self, data):
+        self._flush()
+        self._add(data)
+
+def extract_from_post(html_text, max_length=MAX_SUMMARY_LENGTH):
+    """Extracts summary text from a RSS summary record.
+
+    Truncates if the text exceeds the threshold. The document is parsed
+    incrementally and parsing stops once there is enough text, so the cost
+    is bounded regardless of the length of the post.
+
+    Args:
+      html_text: A text in html.
+      max_length: The max length of the summary.
+
+    Returns:
+      An extracted string from the RSS summary record.
+    """
+    parser = SummaryParser(
+        max_length, has_body=BODY_TAG_PATTERN.search(html_text) is not None)
+    for i in range(0, len(html_text), SUMMARY_CHUNK_SIZE):
+        parser.feed(html_text[i:i + SUMMARY_CHUNK_SIZE])
+        if parser.is_full():
+            break
+    else:
+        parser.close()
+
+    summary = "".join("{} ".format(text) for text in parser.texts)
+    logger.info("Extracted summary: %s", summary[:max_length])
+    return summary[:max_length]
+
+def extract_from_post_with_soup(html_text):
+    """Extracts summary text with BeautifulSoup (the former implementation).
+
+    Parses the whole document, so the cost grows with the length of the
+    post. Kept as a reference for tests and benchmarks of extract_from_post.
+
+    Args:
+      html_text: A text in html.
+
+    Returns:
+      An extracted string from the RSS summary record.
+    """
+    summary_soup = BeautifulSoup(html_text, "html.parser")
+    summary = ""
+    if summary_soup.body:
+        summary_soup = summary_soup.body
+
+    for text in summary_soup.find_all(text=True):
+        unescaped_text = html.unescape(text)
+        summary += "{} ".format(unescaped_text)
+        if len(summary) > MAX_SUMMARY_LENGTH:
+            break
+
+    return summary[:MAX_SUMMARY_LENGTH]
+
+def extract_from_cdata(txt):
+    """Extracts text from CDATA.
+
+    Args:
+      txt: A CDATA string. e.g. <![CDATA[Test]]>
+
+    Returns:
+      An extracted string from the input CDATA string.
+    """
+    result = ""
+    soup = BeautifulSoup(txt, "xml")
+    for cdata in soup.findAll(text=True):
+        if isinstance(cdata, BeautifulSoup.CData):
+            result += "{}".format(html.unescape(repr(cdata)))
+        else:
+            result += "{}".format(html.unescape(cdata))
+    return result
+
+def is_tistory(url):
+    """True if it's a Tistory blog.
+
+    Args:
+      url: A URL string.
+
+    Returns:
+      True if Tistory.
+    """
+    t = urlparse(url).netloc
+    return ".".join(t.split(".")[1:]) == "tistory.com"
+
+def strip_tistory_ads(url, description):
+    """Strips the inline AdSense script text from Tistory posts.
+
+    Args:
+      url: The feed URL.
+      description: An extracted summary.
+
+    Returns:
+      The summary without the script text.
+    """
+    if is_tistory(url):
+        # The last two characters of "(adsbygoogle = window.adsbygoogle || []).push({});"
+        start_idx = description.find(");")
+        start_idx = 0 if start_idx < 0 else start_idx + 2
+        description = description[start_idx:]
+    return description
+
+def is_older_than(item, published_after):
+    """True if the item was published before the cutoff.
+
+    Items without a published date are never considered old. A naive date is
+    compared as UTC.
+
+    Args:
+      item: A FeedItem instance.
+      published_after: A timezone-aware datetime (no cutoff if None).
+
+    Returns:
+      True if the item is older than the cutoff.
+    """
+    published_date = item.published_date
+    if not published_date or published_after is None:
+        return False
+    if published_date.tzinfo is None:
+        published_date = published_date.replace(tzinfo=published_after.tzinfo)
+    return published_date < published_after
+
+class ItemCutoff:
+    """ItemCutoff decides which items of a feed a reader reads.
+
+    Feeds list the newest items first, but the first item can be pinned or
+    out of order. An item published before the cutoff is skipped, and
+    reading stops after MAX_CONSECUTIVE_OLD_ITEMS of them in a row. Reading
+    stops at the newest item seen by the previous fetch, unless it is the
+    first item (e.g. a pinned post), which is skipped.
+
+    Attributes:
+      published_after: A timezone-aware datetime (no cutoff if None).
+      stop_at_url: The URL of the newest item seen by the previous fetch.
+    """
+    def __init__(self, published_after=None, stop_at_url=""):
+        self.published_after = published_after
+        self.stop_at_url = stop_at_url
+        self._num_items = 0
+        self._num_old_items = 0
+
+    def check_url(self, url):
+        """Checks the next item by its URL, before it is parsed.
+
+        Args:
+          url: The URL of the item ("" if not known).
+
+        Returns:
+          READ_ITEM, SKIP_ITEM or STOP_READING.
+        """
+        self._num_items += 1
+        if not self.stop_at_url or url != self.stop_at_url:
+            return READ_ITEM
+        if self._num_items > 1:
+            logger.info("Stop reading at a seen item: %s", url)
+            return STOP_READING
+        logger.info("Skipped a seen first item: %s", url)
+        return self._skip(url)
+
+    def check_item(self, item):
+        """Checks a parsed item by its published date.
+
+        Args:
+          item: A FeedItem instance.
+
+        Returns:
+          READ_ITEM, SKIP_ITEM or STOP_READING.
+        """
+        if not is_older_than(item, self.published_after):
+            self._num_old_items = 0
+            return READ_ITEM
+        return self._skip(item.url)
+
+    def _skip(self, url):
+        self._num_old_items += 1
+        if self._num_old_items >= MAX_CONSECUTIVE_OLD_ITEMS:
+            logger.info("Stop reading at an old item: %s", url)
+            return STOP_READING
+        return SKIP_ITEM
@@ -0,0 +1,80 @@
+"""Tests for feed text helpers.
+
+Commands:
+$ PYTHONPATH=./ python3 util/feed_text_test.py
+"""
+import time
+
+from util.feed_text import (
+    MAX_SUMMARY_LENGTH, SUMMARY_CHUNK_SIZE, extract_from_post,
+    extract_from_post_with_soup)
+
+def test_same_as_soup():
+    """Tests summaries match the ones extracted with BeautifulSoup.
+    """
+    posts = [
+        "<!-- ad --><p>Hello &amp;amp; welcome</p><script>var x = 1;</script>",
+        "<html><head><title>Head</title></head><body><p>Body</p></body></html>",
+        "<html><head><title>" + "t" * 300 + "</title></head>"
+        "<BODY class='post'><p>Body after a long head</p></BODY></html>",
+        "<!DOCTYPE html><p>a<![CDATA[cdata]]>b</p>",
+        "plain &lt;b&gt; text &nbsp; &copy;",
+        "<p>a</p>\n<p>b</p>",
+        "<div>" + "<p>단락 &amp; 텍스트</p>" * 200 + "</div>",
+        "<p>unterminated &amp",
+        ""]
+    for post in posts:
+        assert extract_from_post(post) == extract_from_post_with_soup(post)
+
+def test_text_across_chunks():
+    """Tests a text node straddling a chunk boundary stays a single node.
+    """
+    for offset in range(-12, 12, 3):
+        padding = "a" * (SUMMARY_CHUNK_SIZE - 14 + offset)
+        posts = [
+            '<img src="' + padding + '">'
+            "<p>Hello world this is a sentence</p>",
+            '<img src="' + padding + '"><p>Tom &amp; Jerry &amp;amp; co</p>',
+            "<p>" + "word " * (SUMMARY_CHUNK_SIZE // 5 + offset) + "</p>",
+            '<img src="' + padding + '"><p>short</p><!-- c --><p>'
+            + "long text " * 20 + "</p>"]
+        for post in posts:
+            assert extract_from_post(post) == extract_from_post_with_soup(post)
+
+    post = (
+        '<img src="' + "a" * 1000 + '">'
+        "<p>Hello world this is a sentence</p>")
+    assert extract_from_post(post) == "Hello world this is a sentence "
+
+def test_bounded_cost():
+    """Tests the cost doesn't grow with the length of the post.
+    """
+    short_post = "<p>" + "word " * 100 + "</p>"
+    long_post = short_post * 10000
+
+    summary = extract_from_post(long_post)
+    assert summary == extract_from_post(short_post)
+    assert len(summary) == MAX_SUMMARY_LENGTH
+
+    start_time = time.perf_counter()
+    for _ in range(100):
+        extract_from_post(long_post)
+    # Parsing ~5MB 100 times would take far longer.
+    assert time.perf_counter() - start_time < 1
+
+    text_only_post = "word " * 1000000
+    assert extract_from_post(text_only_post) == extract_from_post_with_soup(
+        text_only_post[:SUMMARY_CHUNK_SIZE])
+
+def main():
+    """Run tests for feed text helpers.
+    """
+    print("TEST started.")
+    test_same_as_soup()
+    test_text_across_chunks()
+    test_bounded_cost()
+    print("TEST completed.")
+
+
+if __name__ == "__main__":
+    main()
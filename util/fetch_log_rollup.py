@@ -0,0 +1,155 @@
+"""Rollups and partitions of the feed fetch log.
+
+  Raw fetch events (see FeedDB.record_fetch) are kept for RETENTION_DAYS.
+  Older events are compacted into one row per feed and day in
+  {mode}_feed_fetch_daily, then dropped. feed_fetch_log is partitioned by
+  month, so dropping old events is a DROP PARTITION instead of a DELETE.
+
+  Typical usage example:
+
+  from util.fetch_log_rollup import daily_rollups, monthly_partitions
+
+  rollups = daily_rollups(events)
+  partitions = monthly_partitions(first_month, last_month)
+"""
+from datetime import date, datetime, timedelta
+
+# Raw events younger than this are kept (changerates are estimated from
+# the latest CHANGERATE_HISTORY events within it).
+RETENTION_DAYS = 30
+# Partitions to create ahead of the current month.
+PARTITION_MONTHS_AHEAD = 3
+# The catch-all partition for rows beyond the last monthly one.
+FUTURE_PARTITION = "p_future"
+
+def median(values):
+    """Returns the median of values (None if empty).
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+def daily_rollups(events):
+    """Aggregates fetch events per feed and day.
+
+    Args:
+      events: Fetch log events (see FeedFetchLogDB.scan), in any order.
+
+    Returns:
+      A list of dicts with url_key, fetch_date, num_fetches, num_updates,
+      median_gap_secs (between consecutive fetches of the day, None with a
+      single fetch), bytes_transferred and newest_post_published_date,
+      sorted by (url_key, fetch_date).
+    """
+    groups = {}
+    for event in events:
+        if not event.get("fetched_time"):
+            continue
+        key = (event["url_key"], event["fetched_time"].date())
+        groups.setdefault(key, []).append(event)
+
+    rollups = []
+    for (url_key, fetch_date), day_events in sorted(groups.items()):
+        day_events.sort(key=lambda e: e["fetched_time"])
+        gaps = [
+            (later["fetched_time"] - earlier["fetched_time"]).total_seconds()
+            for earlier, later in zip(day_events, day_events[1:])]
+        gap = median(gaps)
+        published_dates = [
+            e["newest_post_published_date"] for e in day_events
+            if e.get("newest_post_published_date")]
+        rollups.append({
+            "url_key": url_key,
+            "fetch_date": fetch_date,
+            "num_fetches": len(day_events),
+            "num_updates": sum(1 for e in day_events if e.get("feed_updated")),
+            "median_gap_secs": int(gap) if gap is not None else None,
+            "bytes_transferred": sum(
+                e.get("bytes_transferred") or 0 for e in day_events),
+            "newest_post_published_date": max(
+                published_dates) if published_dates else None})
+    return rollups
+
+def retention_cutoff(now, retention_days=RETENTION_DAYS):
+    """Returns the midnight before which raw events are rolled up.
+
+    Args:
+      now: The current datetime (naive UTC).
+      retention_days: Days of raw events to keep.
+
+    Returns:
+      A datetime at 00:00.
+    """
+    cutoff = now - timedelta(days=retention_days)
+    return datetime(cutoff.year, cutoff.month, cutoff.day)
+
+def month_start(time):
+    """Returns the first day of the month of a date or datetime.
+    """
+    return date(time.year, time.month, 1)
+
+def next_month(month):
+    """Returns the first day of the month after 'month'.
+    """
+    if month.month == 12:
+        return date(month.year + 1, 1, 1)
+    return date(month.year, month.month + 1, 1)
+
+def partition_name(month):
+    """Returns the name of the partition holding a month (e.g. p202610).
+    """
+    return "p%04d%02d" % (month.year, month.month)
+
+def monthly_partitions(first_month, last_month):
+    """Lists monthly partitions covering [first_month, last_month].
+
+    Args:
+      first_month: A date or datetime in the first month.
+      last_month: A date or datetime in the last month.
+
+    Returns:
+      A list of (partition name, exclusive upper bound date) tuples.
+    """
+    partitions = []
+    month = month_start(first_month)
+    while month <= month_start(last_month):
+        upper_bound = next_month(month)
+        partitions.append((partition_name(month), upper_bound))
+        month = upper_bound
+    return partitions
+
+def partition_definitions(partitions):
+    """Returns the partition list of a PARTITION BY RANGE clause.
+
+    Args:
+      partitions: (name, upper bound date) tuples (see monthly_partitions).
+
+    Returns:
+      A SQL string ending with the FUTURE_PARTITION.
+    """
+    definitions = [
+        "PARTITION {name} VALUES LESS THAN (TO_DAYS('{upper_bound}'))".format(
+            name=name, upper_bound=upper_bound.isoformat())
+        for name, upper_bound in partitions]
+    definitions.append(
+        "PARTITION {name} VALUES LESS THAN MAXVALUE".format(
+            name=FUTURE_PARTITION))
+    return ",\n    ".join(definitions)
+
+def expired_partitions(partitions, cutoff):
+    """Returns the names of partitions holding only events before 'cutoff'.
+
+    Args:
+      partitions: (name, upper bound date) tuples.
+      cutoff: A datetime; events before it have been rolled up.
+
+    Returns:
+      A list of partition names.
+    """
+    return [
+        name for name, upper_bound in partitions
+        if name != FUTURE_PARTITION and upper_bound <= cutoff.date()]
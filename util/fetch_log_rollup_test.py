@@ -0,0 +1,88 @@
+"""Tests for rollups and partitions of the feed fetch log.
+
+Commands:
+$ PYTHONPATH=./ python3 util/fetch_log_rollup_test.py
+"""
+from datetime import date, datetime, timedelta
+
+from util.fetch_log_rollup import (
+    FUTURE_PARTITION, daily_rollups, expired_partitions, median,
+    monthly_partitions, partition_definitions, retention_cutoff)
+
+def create_event(url_key, fetched_time, feed_updated, bytes_transferred=100):
+    """Creates a fetch event the way FeedFetchLogDB.scan returns it.
+    """
+    return {
+        "url_key": url_key, "fetched_time": fetched_time,
+        "feed_updated": feed_updated,
+        "newest_post_published_date": fetched_time - timedelta(hours=1),
+        "previous_changerate": 3600,
+        "previous_scheduled_fetch_time": fetched_time,
+        "bytes_transferred": bytes_transferred}
+
+def test_daily_rollups():
+    """Tests events are aggregated per feed and day.
+    """
+    day = datetime(2020, 10, 5)
+    events = [
+        create_event("a", day + timedelta(hours=1), True),
+        create_event("a", day + timedelta(hours=2), False),
+        create_event("a", day + timedelta(hours=6), True, None),
+        create_event("b", day + timedelta(hours=3), False),
+        create_event("a", day + timedelta(days=1, hours=1), False)]
+
+    rollups = daily_rollups(reversed(events))
+
+    assert [(r["url_key"], r["fetch_date"]) for r in rollups] == [
+        ("a", date(2020, 10, 5)), ("a", date(2020, 10, 6)),
+        ("b", date(2020, 10, 5))]
+    assert rollups[0]["num_fetches"] == 3
+    assert rollups[0]["num_updates"] == 2
+    # Gaps of 1 and 4 hours.
+    assert rollups[0]["median_gap_secs"] == 9000
+    assert rollups[0]["bytes_transferred"] == 200
+    assert rollups[0]["newest_post_published_date"] == day + timedelta(
+        hours=5)
+    assert rollups[1]["median_gap_secs"] is None
+    assert daily_rollups([]) == []
+
+def test_median():
+    """Tests the median of odd and even counts.
+    """
+    assert median([]) is None
+    assert median([3, 1, 2]) == 2
+    assert median([4, 1, 2, 3]) == 2.5
+
+def test_partitions():
+    """Tests monthly partitions across a year and their expiry.
+    """
+    partitions = monthly_partitions(
+        datetime(2020, 11, 20), datetime(2021, 1, 3))
+    assert partitions == [
+        ("p202011", date(2020, 12, 1)), ("p202012", date(2021, 1, 1)),
+        ("p202101", date(2021, 2, 1))]
+
+    definitions = partition_definitions(partitions)
+    assert "PARTITION p202011 VALUES LESS THAN (TO_DAYS('2020-12-01'))" in (
+        definitions)
+    assert definitions.endswith(
+        "PARTITION %s VALUES LESS THAN MAXVALUE" % FUTURE_PARTITION)
+
+    cutoff = retention_cutoff(datetime(2021, 1, 31, 15), 30)
+    assert cutoff == datetime(2021, 1, 1)
+    assert expired_partitions(partitions, cutoff) == ["p202011", "p202012"]
+    assert expired_partitions(partitions, datetime(2020, 12, 31)) == [
+        "p202011"]
+
+def main():
+    """Run tests for fetch log rollups.
+    """
+    print("TEST started.")
+    test_daily_rollups()
+    test_median()
+    test_partitions()
+    print("TEST completed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""HttpFetcher class definition.
+
+  HttpFetcher is a shared HTTP client. Connections are pooled per host and
+  kept alive between requests, DNS lookups of its connections are cached,
+  and every request has connect and read timeouts so a hung host can't
+  stall a crawl.
+
+  Typical usage example:
+
+  from util.http_fetcher import HttpFetcher
+
+  response = HttpFetcher.get_instance().get(url, headers=headers)
+"""
+import logging
+import socket
+import threading
+import time
+
+import requests
+from requests.adapters import DEFAULT_POOLBLOCK, HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError
+from urllib3.poolmanager import PoolManager
+
+logger = logging.getLogger()
+
+# Seconds to wait for a connection and for each read from the socket.
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 20
+# The # of hosts to keep connection pools for.
+DEFAULT_POOL_CONNECTIONS = 256
+# Max # of idle connections to keep per host.
+DEFAULT_POOL_MAXSIZE = 4
+DEFAULT_DNS_CACHE_TTL = 300 # seconds
+# Max # of lookups to keep in a DnsCache.
+DEFAULT_DNS_CACHE_SIZE = 4096
+CHUNK_SIZE = 16 * 1024
+
+class DnsCache:
+    """DnsCache caches socket.getaddrinfo results. Thread-safe.
+
+    Only connections opened through a DnsCachingAdapter use it; the resolver
+    of the process is left as it is. Failed lookups are not cached. Expired
+    entries are dropped once the cache is full, then the oldest ones.
+
+    Attributes:
+      ttl_secs: Seconds to keep a resolved address.
+      max_entries: Max # of lookups to keep.
+    """
+    def __init__(
+            self, ttl_secs=DEFAULT_DNS_CACHE_TTL,
+            max_entries=DEFAULT_DNS_CACHE_SIZE):
+        self.ttl_secs = ttl_secs
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def getaddrinfo(self, *args, **kwargs):
+        """socket.getaddrinfo with caching.
+        """
+        key = (args, tuple(sorted(kwargs.items())))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and entry[0] > now:
+            return entry[1]
+
+        result = socket.getaddrinfo(*args, **kwargs)
+        with self._lock:
+            # Re-inserted, so the entries stay in the order of expiry.
+            self._entries.pop(key, None)
+            if len(self._entries) >= self.max_entries:
+                self._entries = {
+                    entry_key: entry
+                    for entry_key, entry in self._entries.items()
+                    if entry[0] > now}
+            while len(self._entries) >= self.max_entries:
+                del self._entries[next(iter(self._entries))]
+            self._entries[key] = (now + self.ttl_secs, result)
+        return result
+
+class CachedDnsConnectionMixin:
+    """Resolves the host of a urllib3 connection through a DnsCache.
+
+    The addresses are tried in order, as socket.create_connection does.
+    Error messages and TLS checks still use the host name.
+
+    Attributes:
+      dns_cache: A DnsCache instance (None to resolve as usual).
+    """
+    dns_cache = None
+
+    def _new_conn(self):
+        if self.dns_cache is None:
+            return super()._new_conn()
+        dns_host = self._dns_host
+        try:
+            addresses = self.dns_cache.getaddrinfo(
+                dns_host, self.port, 0, socket.SOCK_STREAM)
+        except socket.gaierror:
+            # Raises the error of urllib3.
+            return super()._new_conn()
+
+        error = None
+        try:
+            for address in addresses:
+                self._dns_host = address[4][0]
+                try:
+                    return super()._new_conn()
+                except ConnectTimeoutError as ex:
+                    error = ex
+        finally:
+            self._dns_host = dns_host
+        if error is None:
+            return super()._new_conn()
+        raise error
+
+class CachedDnsHTTPConnection(CachedDnsConnectionMixin, HTTPConnection):
+    """HTTPConnection resolving its host through a DnsCache.
+    """
+
+class CachedDnsHTTPSConnection(CachedDnsConnectionMixin, HTTPSConnection):
+    """HTTPSConnection resolving its host through a DnsCache.
+    """
+
+class CachedDnsHTTPConnectionPool(HTTPConnectionPool):
+    """HTTPConnectionPool whose connections share a DnsCache.
+    """
+    ConnectionCls = CachedDnsHTTPConnection
+    dns_cache = None
+
+    def _new_conn(self):
+        conn = super()._new_conn()
+        conn.dns_cache = self.dns_cache
+        return conn
+
+class CachedDnsHTTPSConnectionPool(HTTPSConnectionPool):
+    """HTTPSConnectionPool whose connections share a DnsCache.
+    """
+    ConnectionCls = CachedDnsHTTPSConnection
+    dns_cache = None
+
+    def _new_conn(self):
+        conn = super()._new_conn()
+        conn.dns_cache = self.dns_cache
+        return conn
+
+class CachedDnsPoolManager(PoolManager):
+    """PoolManager whose pools share a DnsCache.
+    """
+    def __init__(self, dns_cache, **kwargs):
+        super().__init__(**kwargs)
+        self.dns_cache = dns_cache
+        self.pool_classes_by_scheme = {
+            "http": CachedDnsHTTPConnectionPool,
+            "https": CachedDnsHTTPSConnectionPool}
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        pool = super()._new_pool(
+            scheme, host, port, request_context=request_context)
+        pool.dns_cache = self.dns_cache
+        return pool
+
+class DnsCachingAdapter(HTTPAdapter):
+    """DnsCachingAdapter caches DNS lookups of the connections it opens.
+
+    Requests through a proxy resolve as usual.
+
+    Attributes:
+      dns_cache: A DnsCache instance.
+    """
+    def __init__(self, dns_cache, **kwargs):
+        # Set first, as HTTPAdapter.__init__ calls init_poolmanager.
+        self.dns_cache = dns_cache
+        super().__init__(**kwargs)
+
+    def init_poolmanager(
+            self, connections, maxsize, block=DEFAULT_POOLBLOCK,
+            **pool_kwargs):
+        """Creates a CachedDnsPoolManager (see HTTPAdapter).
+        """
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = CachedDnsPoolManager(
+            self.dns_cache, num_pools=connections, maxsize=maxsize,
+            block=block, **pool_kwargs)
+
+class HttpFetcher:
+    """Singleton HttpFetcher class to send HTTP requests.
+
+    Thread-safe. A single requests.Session keeps a connection pool per host,
+    so repeated requests to a host reuse a kept-alive connection.
+
+    Attributes:
+      session: A requests.Session instance.
+      timeout: A (connect, read) timeout tuple in seconds.
+    """
+    __instance = None
+    __lock = threading.Lock()
+    @staticmethod
+    def get_instance():
+        """ Static access method. """
+        with HttpFetcher.__lock:
+            if HttpFetcher.__instance is None:
+                HttpFetcher.__instance = HttpFetcher()
+        return HttpFetcher.__instance
+
+    def __init__(
+            self, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+            read_timeout=DEFAULT_READ_TIMEOUT,
+            pool_connections=DEFAULT_POOL_CONNECTIONS,
+            pool_maxsize=DEFAULT_POOL_MAXSIZE,
+            dns_cache_ttl=DEFAULT_DNS_CACHE_TTL):
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        if dns_cache_ttl > 0:
+            adapter = DnsCachingAdapter(
+                DnsCache(dns_cache_ttl), pool_connections=pool_connections,
+                pool_maxsize=pool_maxsize)
+        else:
+            adapter = HTTPAdapter(
+                pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # Bodies are decompressed by urllib3.
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
+
+    def mount(self, adapter):
+        """Routes HTTP(S) requests through a transport adapter.
+
+        e.g. util.crawl_corpus.ReplayAdapter to crawl without network
+        access.
+
+        Args:
+          adapter: A requests.adapters.BaseAdapter instance.
+        """
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, url, headers=None, stream=False, timeout=None):
+        """Sends a GET request.
+
+        Args:
+          url: A URL to fetch.
+          headers: Extra request headers (optional).
+          stream: If True, the body is read on demand (Response.iter_content)
+            and the response should be closed by the caller.
+          timeout: A (connect, read) timeout tuple to override the default.
+
+        Returns:
+          A requests.Response instance.
+
+        Raises:
+          requests.RequestException: The request failed or timed out.
+        """
+        return self.session.get(
+            url, headers=headers, stream=stream,
+            timeout=timeout or self.timeout)
+
+def read_capped(response, max_bytes, chunk_size=CHUNK_SIZE):
+    """Reads the body of a streamed response up to a byte cap.
+
+    Args:
+      response: A requests.Response from HttpFetcher.get(stream=True).
+      max_bytes: Max # of (decompressed) bytes to read.
+      chunk_size: Bytes to read at a time.
+
+    Returns:
+      A tuple of (body bytes, # of bytes transferred on the wire, True if
+      the body was cut at max_bytes).
+    """
+    chunks = []
+    num_bytes = 0
+    truncated = False
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        if num_bytes + len(chunk) > max_bytes:
+            chunks.append(chunk[:max_bytes - num_bytes])
+            truncated = True
+            break
+        chunks.append(chunk)
+        num_bytes += len(chunk)
+
+    # Compressed bytes read from the socket so far.
+    bytes_transferred = response.raw.tell() if response.raw else 0
+    return b"".join(chunks), bytes_transferred, truncated
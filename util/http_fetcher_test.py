@@ -0,0 +1,155 @@
+"""Tests for HttpFetcher class.
+
+Commands:
+$ PYTHONPATH=./ python3 util/http_fetcher_test.py
+"""
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import socket
+import threading
+import time
+
+import requests
+from util.http_fetcher import DnsCache, HttpFetcher, read_capped
+
+BODY = b"<rss><channel><title>Test</title></channel></rss>"
+LARGE_BODY = b"<rss><channel>" + b"<item>Repeated item</item>" * 100000
+
+class FeedHandler(BaseHTTPRequestHandler):
+    """Serves a feed with keep-alive, and /slow after a delay.
+    """
+    protocol_version = "HTTP/1.1"
+    client_ports = set()
+
+    def do_GET(self):
+        """Handles a GET request.
+        """
+        FeedHandler.client_ports.add(self.client_address[1])
+        if self.path == "/slow":
+            time.sleep(1)
+        body = LARGE_BODY if self.path == "/large" else BODY
+        self.send_response(200)
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        """Silences access logs.
+        """
+
+def start_server():
+    """Starts a feed server on a free port.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FeedHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def test_keep_alive_and_gzip():
+    """Tests requests reuse a connection and gzip bodies are decoded.
+    """
+    server = start_server()
+    try:
+        FeedHandler.client_ports.clear()
+        fetcher = HttpFetcher(dns_cache_ttl=0)
+        url = "http://127.0.0.1:%d/rss" % server.server_port
+        for _ in range(3):
+            response = fetcher.get(url)
+            assert response.status_code == 200
+            assert response.content == BODY
+            assert response.headers["Content-Encoding"] == "gzip"
+
+        assert len(FeedHandler.client_ports) == 1
+    finally:
+        server.shutdown()
+
+def test_read_capped():
+    """Tests a body is cut at the cap and compressed bytes are counted.
+    """
+    server = start_server()
+    try:
+        fetcher = HttpFetcher(dns_cache_ttl=0)
+        url = "http://127.0.0.1:%d/large" % server.server_port
+        with fetcher.get(url, stream=True) as response:
+            content, bytes_transferred, truncated = read_capped(
+                response, max_bytes=100000)
+        assert truncated
+        assert content == LARGE_BODY[:100000]
+        assert 0 < bytes_transferred < 100000
+
+        with fetcher.get(url, stream=True) as response:
+            content, bytes_transferred, truncated = read_capped(
+                response, max_bytes=len(LARGE_BODY))
+        assert not truncated
+        assert content == LARGE_BODY
+        # gzip shrinks the repeated items a lot.
+        assert bytes_transferred < len(LARGE_BODY) / 10
+    finally:
+        server.shutdown()
+
+def test_read_timeout():
+    """Tests a slow host fails with a timeout instead of blocking.
+    """
+    server = start_server()
+    try:
+        fetcher = HttpFetcher(read_timeout=0.2, dns_cache_ttl=0)
+        start_time = time.monotonic()
+        try:
+            fetcher.get("http://127.0.0.1:%d/slow" % server.server_port)
+            assert False, "Timeout expected"
+        except requests.Timeout:
+            pass
+        assert time.monotonic() - start_time < 1
+    finally:
+        server.shutdown()
+
+def test_dns_cache():
+    """Tests a host is resolved once while the entry is fresh.
+    """
+    cache = DnsCache(ttl_secs=60)
+    result = cache.getaddrinfo("localhost", 80, 0, socket.SOCK_STREAM)
+
+    assert cache.getaddrinfo("localhost", 80, 0, socket.SOCK_STREAM) is result
+    expired_cache = DnsCache(ttl_secs=0)
+    expired_result = expired_cache.getaddrinfo(
+        "localhost", 80, 0, socket.SOCK_STREAM)
+    assert expired_cache.getaddrinfo(
+        "localhost", 80, 0, socket.SOCK_STREAM) is not expired_result
+
+    small_cache = DnsCache(ttl_secs=60, max_entries=2)
+    for port in (80, 81, 82):
+        small_cache.getaddrinfo("localhost", port, 0, socket.SOCK_STREAM)
+    assert len(small_cache) == 2
+
+def test_dns_cache_scope():
+    """Tests only the connections of a fetcher use its DNS cache.
+    """
+    getaddrinfo = socket.getaddrinfo
+    server = start_server()
+    try:
+        fetcher = HttpFetcher()
+        assert socket.getaddrinfo is getaddrinfo
+        url = "http://localhost:%d/rss" % server.server_port
+        assert fetcher.get(url).content == BODY
+        dns_cache = fetcher.session.get_adapter(url).dns_cache
+        assert len(dns_cache) == 1
+    finally:
+        server.shutdown()
+
+def main():
+    """Run tests for HttpFetcher.
+    """
+    print("TEST started.")
+    test_keep_alive_and_gzip()
+    test_read_capped()
+    test_read_timeout()
+    test_dns_cache()
+    test_dns_cache_scope()
+    print("TEST completed.")
+
+
+if __name__ == "__main__":
+    main()
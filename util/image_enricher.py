@@ -0,0 +1,180 @@
+"""ImageEnricher class definition.
+
+  ImageEnricher fills main images (og:image) of posts in the background, so
+  the crawler can insert posts without waiting for their pages to be fetched.
+
+  Typical usage example:
+
+  from util.image_enricher import ImageEnricher
+
+  enricher = ImageEnricher(
+      post_db, num_workers=4, cache=PageMetadataCache())
+  enricher.start()
+  for post in new_posts:
+      enricher.enqueue(post)
+  enricher.stop()  # Waits for queued posts to be processed.
+"""
+import logging
+import queue
+import threading
+import time
+from urllib.parse import urlparse
+
+from util.page_metadata import (
+    FETCH_DELAY_SECS, PageMetadata, fetch_main_image_from_post)
+
+logger = logging.getLogger()
+
+DEFAULT_NUM_WORKERS = 4
+# Max # of attempts to fetch a page before giving up.
+MAX_ATTEMPTS = 3
+
+class HostPoliteness:
+    """HostPoliteness spaces out requests to the same host.
+
+    Each request reserves the next free slot of its host, so requests to
+    different hosts don't wait for each other.
+
+    Attributes:
+      delay_secs: Min seconds between requests to the same host.
+    """
+    def __init__(self, delay_secs=FETCH_DELAY_SECS):
+        self.delay_secs = delay_secs
+        self._next_slots = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        """Blocks until a request to the host of 'url' is allowed.
+
+        Args:
+          url: A URL to request.
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slots.get(host, now))
+            self._next_slots[host] = slot + self.delay_secs
+
+        if slot > now:
+            time.sleep(slot - now)
+
+class ImageEnricher:
+    """ImageEnricher backfills main_image_url of posts with worker threads.
+
+    Pages found in the cache (if given) are neither fetched nor delayed by
+    the per host politeness.
+
+    Attributes:
+      num_enriched: # of posts updated with a main image.
+      num_failed: # of posts given up after MAX_ATTEMPTS failures.
+      num_cache_hits: # of posts served from the cache.
+    """
+    def __init__(
+            self, post_db, num_workers=DEFAULT_NUM_WORKERS,
+            per_host_delay_secs=FETCH_DELAY_SECS, max_attempts=MAX_ATTEMPTS,
+            cache=None, metrics=None):
+        self.post_db = post_db
+        self.cache = cache
+        # A CrawlMetrics to observe the time to enrich a post (optional).
+        self.metrics = metrics
+        self.num_workers = num_workers
+        self.max_attempts = max_attempts
+        self.politeness = HostPoliteness(per_host_delay_secs)
+        self.num_enriched = 0
+        self.num_failed = 0
+        self.num_cache_hits = 0
+        # Jobs: (post key, post URL, attempt #) or None to stop a worker.
+        self._queue = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Starts worker threads.
+        """
+        for _ in range(self.num_workers):
+            worker = threading.Thread(target=self._run, daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self):
+        """Waits for queued posts to be processed and stops worker threads.
+        """
+        self._queue.join()
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    def enqueue(self, post):
+        """Queues a post to fetch its main image.
+
+        Args:
+          post: A Post instance.
+        """
+        self._queue.put((post.key, post.post_url, 1))
+
+    def _run(self):
+        """Processes jobs until a stop signal (None) arrives.
+        """
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                start_time = time.monotonic()
+                self._enrich(*job)
+                if self.metrics:
+                    self.metrics.observe(
+                        "enrich", time.monotonic() - start_time)
+            finally:
+                self._queue.task_done()
+
+    def _enrich(self, key, url, attempt):
+        """Fetches the main image of a post and updates posts table.
+
+        Args:
+          key: A hash of a post URL.
+          url: The post URL.
+          attempt: The attempt # (starts from 1).
+        """
+        cached_metadata = self.cache.get(url) if self.cache else None
+        if cached_metadata is not None:
+            with self._lock:
+                self.num_cache_hits += 1
+            self._update(key, cached_metadata.image)
+            return
+
+        self.politeness.wait(url)
+        try:
+            main_image_url = fetch_main_image_from_post(
+                url, fetch_delay_secs=0, cache=self.cache)
+        # pylint: disable=broad-except
+        except Exception as ex:
+            if attempt < self.max_attempts:
+                logger.info(
+                    "Retrying main image (attempt %d) for %s: %s",
+                    attempt, url, ex)
+                self._queue.put((key, url, attempt + 1))
+            else:
+                logger.warning("Failed to fetch main image for %s: %s", url, ex)
+                with self._lock:
+                    self.num_failed += 1
+                # Not to retry the page on every run until the entry expires.
+                if self.cache:
+                    self.cache.put(url, PageMetadata())
+            return
+
+        self._update(key, main_image_url)
+
+    def _update(self, key, main_image_url):
+        """Updates the main image of a post if there is one.
+
+        Args:
+          key: A hash of a post URL.
+          main_image_url: The main image URL (can be empty).
+        """
+        if main_image_url:
+            self.post_db.update_main_image_url(key, main_image_url)
+            with self._lock:
+                self.num_enriched += 1
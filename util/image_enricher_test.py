@@ -0,0 +1,86 @@
+"""Tests for ImageEnricher class.
+
+Commands:
+$ PYTHONPATH=./ python3 util/image_enricher_test.py
+"""
+import time
+
+from util import image_enricher
+from util.image_enricher import HostPoliteness, ImageEnricher
+from util.post import Post
+
+class FakePostDB:
+    """Records main image updates instead of writing posts table.
+    """
+    def __init__(self):
+        self.main_image_urls = {}
+
+    def update_main_image_url(self, key, main_image_url):
+        """Stores the main image URL.
+        """
+        self.main_image_urls[key] = main_image_url
+
+def create_post(url):
+    """Creates a post without a main image.
+    """
+    return Post(post_url=url, title="Test", author="", published_date=None)
+
+def test_politeness_per_host():
+    """Tests requests are spaced out per host, not globally.
+    """
+    politeness = HostPoliteness(delay_secs=0.2)
+    start_time = time.monotonic()
+    politeness.wait("https://a.example.com/1")
+    politeness.wait("https://b.example.com/1")
+    assert time.monotonic() - start_time < 0.1
+
+    politeness.wait("https://a.example.com/2")
+    assert time.monotonic() - start_time >= 0.2
+
+def test_enrich_and_retry():
+    """Tests main images are filled and failures are retried up to a limit.
+    """
+    attempts = {}
+    def fake_fetch(page_url, fetch_delay_secs, cache=None):
+        assert fetch_delay_secs == 0
+        attempts[page_url] = attempts.get(page_url, 0) + 1
+        if "broken" in page_url:
+            raise IOError("Connection failed")
+        if "flaky" in page_url and attempts[page_url] < 2:
+            raise IOError("Connection reset")
+        return page_url + "/image.png"
+
+    original_fetch = image_enricher.fetch_main_image_from_post
+    image_enricher.fetch_main_image_from_post = fake_fetch
+    try:
+        post_db = FakePostDB()
+        enricher = ImageEnricher(
+            post_db, num_workers=2, per_host_delay_secs=0, max_attempts=3)
+        enricher.start()
+        posts = [
+            create_post("https://ok.example.com/1"),
+            create_post("https://flaky.example.com/1"),
+            create_post("https://broken.example.com/1")]
+        for post in posts:
+            enricher.enqueue(post)
+        enricher.stop()
+    finally:
+        image_enricher.fetch_main_image_from_post = original_fetch
+
+    assert enricher.num_enriched == 2
+    assert enricher.num_failed == 1
+    assert attempts["https://broken.example.com/1"] == 3
+    assert (post_db.main_image_urls[posts[1].key] ==
+            "https://flaky.example.com/1/image.png")
+
+def main():
+    """Run tests for ImageEnricher.
+    """
+    print("TEST started.")
+    test_politeness_per_host()
+    test_enrich_and_retry()
+    print("TEST completed.")
+
+
+if __name__ == "__main__":
+    main()
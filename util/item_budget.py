@@ -0,0 +1,140 @@
+"""Per-feed item budgets and age windows of the crawler.
+
+  The crawler reads at most 'item budget' items of a feed, and no item
+  published before its age window. Both follow the publication rate of
+  the feed (the EWMA interval kept on the feed row, see ChangerateState)
+  and the time since its last successful fetch, so a busy feed fetched
+  late reads all its new items and a quiet feed reads a few.
+
+  FeedDB.record_fetch stores the budget and the window planned for the
+  next scheduled fetch on the feed row, and plan_items widens them if the
+  fetch comes later than planned. Items above the newest item of the
+  previous fetch are new, so those are read past the budget in the same
+  pass, up to MAX_ITEM_BUDGET. A fetch which fills its budget may have
+  missed items, and makes the next one start from a doubled budget (see
+  next_item_budget).
+
+  Typical usage example:
+
+  from util.item_budget import plan_items
+
+  budget, window_secs = plan_items(feed, datetime.utcnow())
+"""
+import math
+
+from util.changerate import DEFAULT_AGE_LIMIT
+
+# Items to read of a feed whose publication rate is unknown.
+DEFAULT_ITEM_BUDGET = 10
+MIN_ITEM_BUDGET = 2
+# Also the max # of items read above the newest item of the previous fetch.
+MAX_ITEM_BUDGET = 200
+# Read this many times the expected # of new items (publications are
+# bursty), plus one.
+BUDGET_MARGIN = 2.0
+# Items published this long before the last successful fetch are still
+# read (feeds date posts before they appear, e.g. drafts).
+MIN_AGE_WINDOW_SECS = DEFAULT_AGE_LIMIT
+MAX_AGE_WINDOW_SECS = 30 * 86400
+
+def expected_items(mean_interval, elapsed_secs):
+    """Returns the expected # of items published in a period.
+
+    Args:
+      mean_interval: Mean seconds between publications (None if unknown).
+      elapsed_secs: The length of the period in seconds (None if unknown).
+
+    Returns:
+      The expected # of items, or None if unknown.
+    """
+    if not mean_interval or mean_interval <= 0 or elapsed_secs is None:
+        return None
+    return max(0.0, elapsed_secs) / mean_interval
+
+def item_budget(mean_interval, elapsed_secs, min_budget=MIN_ITEM_BUDGET):
+    """Returns the max # of items to read of a feed.
+
+    Args:
+      mean_interval: Mean seconds between publications (None if unknown).
+      elapsed_secs: Seconds since the last successful fetch (None if
+        unknown).
+      min_budget: The lower bound (e.g. raised after a filled budget).
+
+    Returns:
+      The # of items, in [min_budget, MAX_ITEM_BUDGET].
+    """
+    expected = expected_items(mean_interval, elapsed_secs)
+    if expected is None:
+        budget = DEFAULT_ITEM_BUDGET
+    else:
+        budget = math.ceil(expected * BUDGET_MARGIN) + 1
+    return max(MIN_ITEM_BUDGET, min(MAX_ITEM_BUDGET, max(budget, min_budget)))
+
+def age_window_secs(elapsed_secs, min_window_secs=MIN_AGE_WINDOW_SECS):
+    """Returns how old an item can be to be read.
+
+    Args:
+      elapsed_secs: Seconds since the last successful fetch (None if
+        unknown).
+      min_window_secs: The window right after a fetch.
+
+    Returns:
+      Seconds, in [min_window_secs, MAX_AGE_WINDOW_SECS].
+    """
+    if elapsed_secs is None:
+        return min_window_secs
+    return int(min(
+        max(MAX_AGE_WINDOW_SECS, min_window_secs),
+        max(0, elapsed_secs) + min_window_secs))
+
+def last_success_time(feed):
+    """Returns the time of the last successful fetch of a feed (or None).
+    """
+    if feed.latest_success_time:
+        return feed.latest_success_time
+    if feed.latest_fetched_time and not feed.consecutive_failures:
+        # Rows from before latest_success_time was kept.
+        return feed.latest_fetched_time
+    return None
+
+def plan_items(feed, now, min_window_secs=MIN_AGE_WINDOW_SECS):
+    """Returns the item budget and the age window of a fetch of a feed.
+
+    The ones stored on the feed row (planned for the scheduled time) are
+    widened if the feed is fetched later.
+
+    Args:
+      feed: A Feed instance as read from feeds table.
+      now: The fetch time (naive UTC).
+      min_window_secs: The window right after a fetch.
+
+    Returns:
+      A tuple of (item budget, age window in seconds).
+    """
+    success_time = last_success_time(feed)
+    elapsed_secs = None
+    if success_time:
+        elapsed_secs = (now - success_time).total_seconds()
+
+    return (
+        item_budget(
+            feed.publish_interval_mean, elapsed_secs,
+            min_budget=feed.item_budget or MIN_ITEM_BUDGET),
+        max(feed.age_window_secs or 0, age_window_secs(
+            elapsed_secs, min_window_secs=min_window_secs)))
+
+def next_item_budget(budget, num_items, planned_budget):
+    """Returns the item budget to store for the next fetch.
+
+    Args:
+      budget: The budget of this fetch.
+      num_items: The # of items read with the budget.
+      planned_budget: The budget from the publication rate alone.
+
+    Returns:
+      At least a doubled budget if it was filled (items may have been
+      missed), else 'planned_budget' (so a raised budget doesn't stick).
+    """
+    if num_items >= budget:
+        return max(planned_budget, min(MAX_ITEM_BUDGET, budget * 2))
+    return planned_budget
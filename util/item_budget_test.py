@@ -0,0 +1,76 @@
+"""Tests for item budgets and age windows.
+
+Commands:
+$ PYTHONPATH=./ python3 util/item_budget_test.py
+"""
+from datetime import datetime, timedelta
+
+from util.feed import Feed
+from util.item_budget import (
+    DEFAULT_ITEM_BUDGET, MAX_AGE_WINDOW_SECS, MAX_ITEM_BUDGET,
+    MIN_AGE_WINDOW_SECS, MIN_ITEM_BUDGET, age_window_secs, item_budget,
+    next_item_budget, plan_items)
+
+def test_item_budget():
+    """Tests the budget follows the expected # of new items.
+    """
+    assert item_budget(None, 3600) == DEFAULT_ITEM_BUDGET
+    assert item_budget(3600, None) == DEFAULT_ITEM_BUDGET
+    # A post a day, fetched an hour later.
+    assert item_budget(86400, 3600) == MIN_ITEM_BUDGET
+    # A post an hour, fetched 10 hours later: 10 expected.
+    assert item_budget(3600, 36000) == 21
+    assert item_budget(60, 86400) == MAX_ITEM_BUDGET
+    assert item_budget(86400, 3600, min_budget=8) == 8
+
+def test_age_window_secs():
+    """Tests the window widens with the time since the last success.
+    """
+    assert age_window_secs(None) == MIN_AGE_WINDOW_SECS
+    assert age_window_secs(3600) == MIN_AGE_WINDOW_SECS + 3600
+    assert age_window_secs(365 * 86400) == MAX_AGE_WINDOW_SECS
+    assert age_window_secs(3600, min_window_secs=60) == 3660
+
+def test_plan_items():
+    """Tests the stored plan is widened by a late fetch.
+    """
+    now = datetime(2020, 10, 5, 12)
+    feed = Feed(
+        url="https://www.example.com/rss", title="Sample",
+        description="Sample", language="ko", feed_type="RSS",
+        publish_interval_mean=3600)
+    assert plan_items(feed, now) == (DEFAULT_ITEM_BUDGET, MIN_AGE_WINDOW_SECS)
+
+    feed.latest_fetched_time = now - timedelta(hours=10)
+    assert plan_items(feed, now) == (21, MIN_AGE_WINDOW_SECS + 36000)
+
+    # The last fetch failed: the window starts at the last success.
+    feed.consecutive_failures = 1
+    feed.latest_success_time = now - timedelta(hours=20)
+    assert plan_items(feed, now) == (41, MIN_AGE_WINDOW_SECS + 72000)
+
+    feed.item_budget = 100
+    feed.age_window_secs = MAX_AGE_WINDOW_SECS
+    assert plan_items(feed, now) == (100, MAX_AGE_WINDOW_SECS)
+
+def test_next_item_budget():
+    """Tests a filled budget is doubled for the next fetch.
+    """
+    assert next_item_budget(10, 3, 5) == 5
+    assert next_item_budget(10, 10, 5) == 20
+    assert next_item_budget(10, 10, 30) == 30
+    assert next_item_budget(150, 200, 5) == MAX_ITEM_BUDGET
+
+def main():
+    """Run tests for item budgets.
+    """
+    print("TEST started.")
+    test_item_budget()
+    test_age_window_secs()
+    test_plan_items()
+    test_next_item_budget()
+    print("TEST completed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,53 +6,211 @@
 
   main_image_url = fetch_main_image_from_post("https://www.example.com/")
   print("Main image URL: ", main_image_url)
+
+  Metadata (OpenGraph) of a page:
+
+  metadata = fetch_page_metadata("https://www.example.com/")
+  print(metadata.title, metadata.image, metadata.url, metadata.description)
 """
+import codecs
+from html.parser import HTMLParser
 import logging
+import re
 import time
 
-from bs4 import BeautifulSoup
-import requests
+from util.http_fetcher import HttpFetcher
 
 logger = logging.getLogger()
 
 # Aritificial delay for fetching web resources to avoid hammering web servers.
 FETCH_DELAY_SECS = 1
+# Max bytes of a page to read for metadata. Metadata is in <head>, so reading
+# stops at </head> (or <body>) usually much earlier.
+MAX_HEAD_BYTES = 256 * 1024
+CHUNK_SIZE = 8 * 1024
+DEFAULT_ENCODING = "utf-8"
+# Bytes to buffer before detecting the encoding from <meta charset>.
+ENCODING_SNIFF_BYTES = 1024
+
+# OpenGraph property to PageMetadata attribute.
+OG_PROPERTIES = {
+    "og:title": "title",
+    "og:image": "image",
+    "og:url": "url",
+    "og:description": "description",
+}
+
+META_CHARSET_PATTERN = re.compile(
+    rb"""<meta[^>]+charset\s*=\s*["']?\s*([A-Za-z0-9_\-]+)""", re.IGNORECASE)
+
+class PageMetadata:
+    """PageMetadata holds OpenGraph metadata of a page.
+
+    Attributes:
+      title string: og:title.
+      image string: og:image.
+      url string: og:url.
+      description string: og:description.
+    """
+    def __init__(self, title="", image="", url="", description=""):
+        self.title = title
+        self.image = image
+        self.url = url
+        self.description = description
+
+class HeadMetadataParser(HTMLParser):
+    """HeadMetadataParser collects OpenGraph <meta> tags incrementally.
+
+    Feed the page in chunks and stop feeding once 'done' is True (the end of
+    <head> is reached). The first value of each property is kept.
+
+    Attributes:
+      metadata: A PageMetadata instance.
+      done: True once </head> or <body> is seen.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.metadata = PageMetadata()
+        self.done = False
+        self._seen = set()
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "body":
+            self.done = True
+        elif tag == "meta":
+            attrs = dict(attrs)
+            attr_name = OG_PROPERTIES.get(attrs.get("property"))
+            if attr_name and attr_name not in self._seen:
+                self._seen.add(attr_name)
+                setattr(self.metadata, attr_name, attrs.get("content") or "")
+
+    def handle_endtag(self, tag):
+        if tag == "head":
+            self.done = True
+
+def detect_encoding(first_chunk, content_type=""):
+    """Detects the encoding of a page from its first bytes.
+
+    Args:
+      first_chunk: The first bytes of a page (ENCODING_SNIFF_BYTES or so).
+      content_type: The Content-Type header value.
+
+    Returns:
+      An encoding name.
+    """
+    match = re.search(r"charset=([A-Za-z0-9_\-]+)", content_type or "")
+    if not match:
+        match = META_CHARSET_PATTERN.search(first_chunk)
+    if match:
+        encoding = match.group(1)
+        if isinstance(encoding, bytes):
+            encoding = encoding.decode("ascii")
+        try:
+            codecs.lookup(encoding)
+            return encoding
+        except LookupError:
+            logger.info("Unknown encoding: %s", encoding)
+    return DEFAULT_ENCODING
+
+def extract_page_metadata(chunks, max_bytes=MAX_HEAD_BYTES, content_type=""):
+    """Extracts OpenGraph metadata from a page in a single pass.
 
-def fetch_main_image_from_post(page_url):
+    Parses chunks as they arrive and stops at the end of <head> or after
+    'max_bytes', so the rest of the page is never read.
+
+    Args:
+      chunks: An iterable of bytes (e.g. Response.iter_content()).
+      max_bytes: Max # of bytes to read.
+      content_type: The Content-Type header value (to detect the encoding).
+
+    Returns:
+      A PageMetadata instance.
+    """
+    parser = HeadMetadataParser()
+    decoder = None
+    buffered = b""
+    num_bytes = 0
+    for chunk in chunks:
+        chunk = chunk[:max_bytes - num_bytes]
+        num_bytes += len(chunk)
+        if decoder is None:
+            # Buffers the first bytes to find <meta charset>.
+            buffered += chunk
+            if (len(buffered) < ENCODING_SNIFF_BYTES
+                    and num_bytes < max_bytes
+                    and b"</head" not in buffered.lower()):
+                continue
+            decoder = codecs.getincrementaldecoder(
+                detect_encoding(buffered, content_type))(errors="replace")
+            chunk = buffered
+
+        parser.feed(decoder.decode(chunk))
+        if parser.done:
+            break
+        if num_bytes >= max_bytes:
+            logger.info("No end of <head> in the first %d bytes.", max_bytes)
+            break
+    else:
+        if decoder is None and buffered:
+            # A page shorter than ENCODING_SNIFF_BYTES.
+            decoder = codecs.getincrementaldecoder(
+                detect_encoding(buffered, content_type))(errors="replace")
+            parser.feed(decoder.decode(buffered, final=True))
+
+    return parser.metadata
+
+def fetch_page_metadata(page_url, max_bytes=MAX_HEAD_BYTES):
+    """Fetches OpenGraph metadata of a page.
+
+    The page is streamed and the connection is closed once the metadata is
+    read, so memory and latency are bounded by the size of <head>.
+
+    Args:
+      page_url: The document URL.
+      max_bytes: Max # of bytes to read.
+
+    Returns:
+      A PageMetadata instance.
+    """
+    with HttpFetcher.get_instance().get(page_url, stream=True) as response:
+        return extract_page_metadata(
+            response.iter_content(chunk_size=CHUNK_SIZE), max_bytes=max_bytes,
+            content_type=response.headers.get("Content-Type", ""))
+
+def fetch_main_image_from_post(
+        page_url, fetch_delay_secs=FETCH_DELAY_SECS, cache=None):
     """Fetch the main image link from the input page.
 
     This involves calling external web servers.
 
     Args:
       page_url: The document URL (can be a frameset document).
+      fetch_delay_secs: Artificial delay before fetching the page. Callers
+        enforcing their own politeness per host can set it to 0.
+      cache: A PageMetadataCache (optional). Cached pages aren't fetched and
+        fetched pages are stored, including pages without og:image.
 
     Returns:
       Fetch a main image URL (og:image for now).
     """
-    time.sleep(FETCH_DELAY_SECS)
-    source_code = requests.get(page_url).text
-    main_soup = BeautifulSoup(source_code, "html.parser")
+    if cache:
+        metadata = cache.get(page_url)
+        if metadata is not None:
+            return metadata.image
 
-    main_image = ""
-
-    # Crawl and parse a webpage.
     if (page_url.startswith("https://blog.naver.com")
         or page_url.startswith("http://blog.naver.com")):
         # Images on Naver blog have strict-origin-when-cross-origin referrer
-        # policy. The images can't be embedded on a third-party site.
-        return main_image
-        # main_frame_url = main_soup.find(id="mainFrame")["src"]
-        # main_frame_url = "https://blog.naver.com" + main_frame_url
-        # logger.info("Naver blog's main frame: %s", main_frame_url)
-        #
-        # time.sleep(FETCH_DELAY_SECS)
-        # main_frame_source_code = requests.get(main_frame_url).text
-        # main_soup = BeautifulSoup(main_frame_source_code, "html.parser")
-
-    for each_text in main_soup.findAll("meta"):
-        if each_text.get("property") == "og:image":
-            main_image = each_text.get("content")
-            logger.info("Extracted main image URL: %s", main_image)
-            break
+        # policy. The images can't be embedded on a third-party site, so the
+        # page isn't fetched at all.
+        metadata = PageMetadata()
+    else:
+        if fetch_delay_secs > 0:
+            time.sleep(fetch_delay_secs)
+        metadata = fetch_page_metadata(page_url)
+        if metadata.image:
+            logger.info("Extracted main image URL: %s", metadata.image)
 
-    return main_image
+    if cache:
+        cache.put(page_url, metadata)
+    return metadata.image
@@ -0,0 +1,164 @@
+"""PageMetadataCache class definition.
+
+  PageMetadataCache stores page metadata (og:image, ...) keyed by the hash of
+  a page URL in a local SQLite file, so it survives across crawler runs.
+  Negative results (no og:image, failed fetches) are cached too, with a
+  shorter TTL.
+
+  Typical usage example:
+
+  from util.page_metadata_cache import PageMetadataCache
+
+  cache = PageMetadataCache("/tmp/page_metadata.sqlite3")
+  metadata = cache.get(url)
+  if metadata is None:
+      metadata = fetch_page_metadata(url)
+      cache.put(url, metadata)
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from util.page_metadata import PageMetadata
+from util.url import url_to_hashkey
+
+logger = logging.getLogger()
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "readmoa", "page_metadata.sqlite3")
+DEFAULT_TTL_SECS = 30 * 86400
+# TTL for pages without og:image or failed to fetch.
+DEFAULT_NEGATIVE_TTL_SECS = 86400
+DEFAULT_MAX_ENTRIES = 100000
+# Entries to keep (ratio of max_entries) after an eviction.
+EVICTION_TARGET_RATIO = 0.9
+
+class PageMetadataCache:
+    """PageMetadataCache is an on-disk cache of PageMetadata.
+
+    Entries expire after their TTL. When the cache grows beyond
+    'max_entries', the least recently used entries are evicted. The cache is
+    safe to share between threads.
+
+    Attributes:
+      path: The SQLite file path.
+      ttl_secs: TTL of entries with og:image.
+      negative_ttl_secs: TTL of negative entries.
+      max_entries: Max # of entries to keep.
+    """
+    def __init__(
+            self, path=DEFAULT_CACHE_PATH, ttl_secs=DEFAULT_TTL_SECS,
+            negative_ttl_secs=DEFAULT_NEGATIVE_TTL_SECS,
+            max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl_secs = ttl_secs
+        self.negative_ttl_secs = negative_ttl_secs
+        self.max_entries = max_entries
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS page_metadata (
+                  url_key TEXT PRIMARY KEY,
+                  title TEXT,
+                  image TEXT,
+                  url TEXT,
+                  description TEXT,
+                  expires_at REAL,
+                  accessed_at REAL
+                )""")
+            self._conn.execute("""
+                CREATE INDEX IF NOT EXISTS page_metadata_accessed_at_idx
+                ON page_metadata (accessed_at)""")
+        self._num_entries = self._count()
+
+    def get(self, page_url):
+        """Looks up the metadata of a page.
+
+        Args:
+          page_url: A page URL.
+
+        Returns:
+          A PageMetadata instance or None if not cached (or expired).
+        """
+        url_key = url_to_hashkey(page_url)
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("""
+                SELECT title, image, url, description, expires_at
+                FROM page_metadata WHERE url_key = ?""", (url_key,)).fetchone()
+            if row is None:
+                return None
+            if row[4] < now:
+                self._conn.execute(
+                    "DELETE FROM page_metadata WHERE url_key = ?", (url_key,))
+                self._num_entries -= 1
+                return None
+
+            self._conn.execute(
+                "UPDATE page_metadata SET accessed_at = ? WHERE url_key = ?",
+                (now, url_key))
+        return PageMetadata(
+            title=row[0], image=row[1], url=row[2], description=row[3])
+
+    def put(self, page_url, metadata):
+        """Stores the metadata of a page.
+
+        Metadata without og:image is stored as a negative entry.
+
+        Args:
+          page_url: A page URL.
+          metadata: A PageMetadata instance.
+        """
+        now = time.time()
+        ttl_secs = self.ttl_secs if metadata.image else self.negative_ttl_secs
+        url_key = url_to_hashkey(page_url)
+        with self._lock, self._conn:
+            exists = self._conn.execute(
+                "SELECT 1 FROM page_metadata WHERE url_key = ?",
+                (url_key,)).fetchone()
+            self._conn.execute("""
+                INSERT OR REPLACE INTO page_metadata
+                (url_key, title, image, url, description, expires_at,
+                 accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)""", (
+                    url_key, metadata.title, metadata.image, metadata.url,
+                    metadata.description, now + ttl_secs, now))
+            if not exists:
+                self._num_entries += 1
+            if self._num_entries > self.max_entries:
+                self._evict(now)
+
+    def __len__(self):
+        with self._lock:
+            return self._count()
+
+    def _count(self):
+        """Returns the # of entries in the cache file.
+        """
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM page_metadata").fetchone()[0]
+
+    def _evict(self, now):
+        """Removes expired entries, then the least recently used ones.
+
+        Called with the lock held.
+
+        Args:
+          now: The current time in seconds.
+        """
+        self._conn.execute(
+            "DELETE FROM page_metadata WHERE expires_at < ?", (now,))
+        num_to_keep = int(self.max_entries * EVICTION_TARGET_RATIO)
+        self._conn.execute("""
+            DELETE FROM page_metadata WHERE url_key IN (
+              SELECT url_key FROM page_metadata
+              ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)""", (num_to_keep,))
+        self._num_entries = self._count()
+        logger.info("Evicted page metadata cache: %d entries left.",
+                    self._num_entries)
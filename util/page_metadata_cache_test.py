@@ -0,0 +1,76 @@
+"""Tests for PageMetadataCache class.
+
+Commands:
+$ PYTHONPATH=./ python3 util/page_metadata_cache_test.py
+"""
+import os
+import tempfile
+import time
+
+from util.page_metadata import PageMetadata
+from util.page_metadata_cache import PageMetadataCache
+
+def test_persistence():
+    """Tests cached metadata is read back by another cache instance.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "cache.sqlite3")
+        cache = PageMetadataCache(path)
+        cache.put(
+            "https://www.example.com/1",
+            PageMetadata(title="Title", image="https://www.example.com/1.png"))
+
+        metadata = PageMetadataCache(path).get("https://www.example.com/1")
+
+        assert metadata.title == "Title"
+        assert metadata.image == "https://www.example.com/1.png"
+        assert PageMetadataCache(path).get("https://www.example.com/2") is None
+
+def test_negative_ttl():
+    """Tests pages without og:image are cached with the negative TTL.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache = PageMetadataCache(
+            os.path.join(temp_dir, "cache.sqlite3"), ttl_secs=60,
+            negative_ttl_secs=0.1)
+        cache.put("https://www.example.com/no-image", PageMetadata())
+        cache.put(
+            "https://www.example.com/image", PageMetadata(image="image.png"))
+
+        assert cache.get("https://www.example.com/no-image").image == ""
+        time.sleep(0.2)
+        assert cache.get("https://www.example.com/no-image") is None
+        assert cache.get("https://www.example.com/image").image == "image.png"
+
+def test_eviction():
+    """Tests the least recently used entries are evicted.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache = PageMetadataCache(
+            os.path.join(temp_dir, "cache.sqlite3"), max_entries=10)
+        for i in range(10):
+            cache.put(
+                "https://www.example.com/%d" % i, PageMetadata(image="i.png"))
+            time.sleep(0.001)
+        # Touches the oldest entry to keep it.
+        assert cache.get("https://www.example.com/0") is not None
+
+        cache.put("https://www.example.com/10", PageMetadata(image="i.png"))
+
+        assert len(cache) == 9
+        assert cache.get("https://www.example.com/0") is not None
+        assert cache.get("https://www.example.com/1") is None
+        assert cache.get("https://www.example.com/10") is not None
+
+def main():
+    """Run tests for PageMetadataCache.
+    """
+    print("TEST started.")
+    test_persistence()
+    test_negative_ttl()
+    test_eviction()
+    print("TEST completed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Tests for page metadata utility functions.
+
+Commands:
+$ PYTHONPATH=./ python3 util/page_metadata_test.py
+"""
+from util.page_metadata import extract_page_metadata
+
+PAGE_HEAD = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="{charset}">
+<title>Page title</title>
+<meta property="og:title" content="리드모아 &amp; 글">
+<meta property="og:image" content="https://www.example.com/main.png">
+<meta property="og:image" content="https://www.example.com/second.png">
+<meta property="og:url" content="/posts/1">
+<meta property="og:description" content="A description.">
+</head>
+"""
+
+def split_into_chunks(data, chunk_size):
+    """Splits bytes into chunks.
+    """
+    return [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+def test_extract_across_chunks():
+    """Tests metadata split across small chunks is extracted.
+    """
+    page = PAGE_HEAD.format(charset="utf-8").encode("utf-8")
+    metadata = extract_page_metadata(split_into_chunks(page, 7))
+
+    assert metadata.title == "리드모아 & 글"
+    assert metadata.image == "https://www.example.com/main.png"
+    assert metadata.url == "/posts/1"
+    assert metadata.description == "A description."
+
+def test_stop_at_end_of_head():
+    """Tests the body of a page is never read.
+    """
+    def chunks():
+        yield PAGE_HEAD.format(charset="utf-8").encode("utf-8")
+        raise AssertionError("Read beyond </head>")
+
+    metadata = extract_page_metadata(chunks())
+    assert metadata.image == "https://www.example.com/main.png"
+
+def test_encoding_from_meta_charset():
+    """Tests a page in a legacy encoding is decoded by <meta charset>.
+    """
+    page = PAGE_HEAD.format(charset="euc-kr").encode("euc-kr")
+    metadata = extract_page_metadata(split_into_chunks(page, 5))
+
+    assert metadata.title == "리드모아 & 글"
+
+def test_max_bytes():
+    """Tests reading stops at the byte cap.
+    """
+    page = ("<html><head>" + " " * 1000 +
+            "<meta property=\"og:image\" content=\"late.png\">").encode("utf-8")
+    metadata = extract_page_metadata(
+        split_into_chunks(page, 100), max_bytes=500)
+
+    assert metadata.image == ""
+
+def main():
+    """Run tests for page metadata utility functions.
+    """
+    print("TEST started.")
+    test_extract_across_chunks()
+    test_stop_at_end_of_head()
+    test_encoding_from_meta_charset()
+    test_max_bytes()
+    print("TEST completed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -84,17 +84,22 @@ class Post:
 
         return True
 
-def post_from_feed_item(feed_item):
+def post_from_feed_item(feed_item, fetch_main_image=True):
     """Creates a Post from a FeedItem data.
 
     Args:
         feed_item (util.feed_reader_factory.FeedItem): a FeedItem data.
+        fetch_main_image (bool): Fetches the main image of the post if True.
+            Otherwise main_image_url is left empty to be filled later (see
+            util.image_enricher.ImageEnricher).
     """
     # Fetches the main image link from the post because FeedItem data
     # doesn't have main image link.
     # NOTE: fetch_main_image_from_post has artificial delays for
     # external connection.
-    main_image_url = fetch_main_image_from_post(feed_item.url)
+    main_image_url = ""
+    if fetch_main_image:
+        main_image_url = fetch_main_image_from_post(feed_item.url)
 
     return Post(
         post_url=feed_item.url, title=feed_item.title,
@@ -25,8 +25,31 @@ from util.post import Post
 # Max post index to return in scan().
 MAX_POSTS_TO_START = 1000
 
+# Columns to read a Post from posts table (see post_from_row).
+POST_COLUMNS = """post_url_hash, post_url, title, post_author, post_author_hash,
+                       post_published_date, submission_time,
+                       main_image_url, description, user_display_name,
+                       user_email, user_photo_url, user_id, user_provider_id"""
+
 logger = logging.getLogger()
 
+def post_from_row(row):
+    """Creates a Post from a row selected with POST_COLUMNS.
+
+    Args:
+        row: A row from posts table.
+
+    Returns:
+        A Post instance.
+    """
+    return Post(
+        post_url=row[1], title=row[2], author=row[3],
+        author_hash=row[4], published_date=row[5],
+        submission_time=row[6], main_image_url=row[7],
+        description=row[8], user_display_name=row[9],
+        user_email=row[10], user_photo_url=row[11],
+        user_id=row[12], user_provider_id=row[13])
+
 class PostDB:
     """PostDB class to interact with the posts table.
 
@@ -72,6 +95,35 @@ class PostDB:
                     user_id=row[12], user_provider_id=row[13])
         return post
 
+    def lookup_many(self, keys):
+        """Looks up posts from posts table with the input keys.
+
+        All the keys are looked up with a single query.
+
+        Args:
+          keys: A list of hashes of post URLs.
+
+        Returns:
+          A dict of key to Post instance for the keys found in posts table.
+        """
+        posts = {}
+        if not keys:
+            return posts
+
+        stmt = sqlalchemy.text("""
+            SELECT {columns}
+            FROM {mode}_posts_serving
+            WHERE post_url_hash IN :keys
+            """.format(columns=POST_COLUMNS, mode=self.mode)
+        ).bindparams(sqlalchemy.bindparam("keys", expanding=True))
+
+        with self.db_instance.connect() as conn:
+            returned_posts = conn.execute(stmt, keys=list(keys)).fetchall()
+            for row in returned_posts:
+                post = post_from_row(row)
+                posts[post.key] = post
+        return posts
+
     def scan(self, author_key="", start_idx=0, count=10):
         """Scans posts table and resturns a list of Post instances.
 
@@ -175,6 +227,106 @@ class PostDB:
             logger.exception(ex)
             return
 
+    def insert_many(self, posts):
+        """Insert post records into posts table.
+
+        Posts are inserted with a single multi-row INSERT. Posts which already
+        exist in posts table are skipped by the database (INSERT IGNORE), so
+        there is no need to look them up before inserting.
+
+        Args:
+          posts: A list of Post instances.
+
+        Returns:
+          The # of posts inserted.
+        """
+        params = []
+        for post in posts:
+            if not post.is_valid():
+                logger.error("Invalid post: %s", post.post_url)
+                continue
+            params.append({
+                "url_hash": post.post_url_hash, "url": post.post_url,
+                "author": post.author, "author_hash": post.author_hash,
+                "published_date": post.published_date,
+                "submission_time": post.submission_time,
+                "title": post.title, "main_image_url": post.main_image_url,
+                "description": post.description, "user_id": post.user_id,
+                "user_display_name": post.user_display_name,
+                "user_email": post.user_email,
+                "user_photo_url": post.user_photo_url,
+                "user_provider_id": post.user_provider_id})
+
+        if not params:
+            return 0
+
+        stmt = sqlalchemy.text("""
+            INSERT IGNORE INTO {mode}_posts_serving
+            (post_url_hash, post_url, post_author, post_author_hash,
+            post_published_date, submission_time, title, main_image_url,
+            description, user_id, user_display_name, user_email,
+            user_photo_url, user_provider_id)
+            VALUES
+            (:url_hash, :url, :author, :author_hash, :published_date,
+            :submission_time, :title, :main_image_url, :description,
+            :user_id, :user_display_name, :user_email, :user_photo_url,
+            :user_provider_id)
+            """.format(mode=self.mode)
+        )
+
+        try:
+            with self.db_instance.connect() as conn:
+                # The driver batches the rows into a multi-row INSERT.
+                result = conn.execute(stmt, params)
+                return result.rowcount
+        except self.db_instance.Error as ex:
+            logger.exception(ex)
+            return 0
+
+    def scan_missing_main_image(self, since, count=100):
+        """Scans posts without a main image submitted since the given time.
+
+        Args:
+          since: A datetime (UTC).
+          count: Max # of posts to return.
+
+        Returns:
+          A list of posts, the most recently submitted first.
+        """
+        stmt = sqlalchemy.text("""
+            SELECT {columns}
+            FROM {mode}_posts_serving
+            WHERE submission_time >= :since
+              AND (main_image_url IS NULL OR main_image_url = '')
+            ORDER BY submission_time DESC LIMIT {limit:d}
+            """.format(columns=POST_COLUMNS, mode=self.mode, limit=count)
+        )
+
+        with self.db_instance.connect() as conn:
+            rows = conn.execute(stmt, since=since).fetchall()
+            return [post_from_row(row) for row in rows]
+
+    def update_main_image_url(self, key, main_image_url):
+        """Updates the main image URL of a post.
+
+        Args:
+          key: A hash of a post URL.
+          main_image_url: The main image URL.
+        """
+        stmt = sqlalchemy.text("""
+            UPDATE {mode}_posts_serving
+            SET main_image_url = :main_image_url
+            WHERE post_url_hash = :key
+            """.format(mode=self.mode)
+        )
+
+        try:
+            with self.db_instance.connect() as conn:
+                conn.execute(stmt, main_image_url=main_image_url, key=key)
+        except self.db_instance.Error as ex:
+            logger.exception(ex)
+            return
+
     def delete(self, key):
         """Deletes a post from posts table with the input key.
 
@@ -57,12 +57,37 @@ def test_scan():
     post_db.delete(post1.key)
     post_db.delete(post2.key)
 
+def test_insert_many():
+    """Test insert_many and lookup_many operations.
+    """
+    post_db = PostDB(mode="test")
+    post1 = Post(
+        post_url = "https://www.example.com/many/1",
+        title = "TestMany1", author = "Tester", published_date = None)
+    post2 = Post(
+        post_url = "https://www.example.com/many/2",
+        title = "TestMany2", author = "Tester", published_date = None)
+
+    assert post_db.insert_many([post1]) == 1
+    # post1 already exists, so only post2 is inserted.
+    assert post_db.insert_many([post1, post2]) == 1
+
+    stored_posts = post_db.lookup_many([post1.key, post2.key, "not-exist"])
+
+    assert len(stored_posts) == 2
+    assert stored_posts[post1.key].title == post1.title
+    assert stored_posts[post2.key].post_url == post2.post_url
+
+    post_db.delete(post1.key)
+    post_db.delete(post2.key)
+
 def main():
     """Run tests for PostDB.
     """
     print("TEST started.")
     test_insert()
     test_scan()
+    test_insert_many()
     print("TEST completed.")
 
 
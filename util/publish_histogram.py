@@ -0,0 +1,197 @@
+"""PublishHistogram class definition.
+
+  PublishHistogram counts the publications of a feed per hour of the week
+  (UTC) and schedules fetches around them. It is stored in feeds table as
+  a 168 character string, one base-36 digit per hour.
+
+  Typical usage example:
+
+  from util.publish_histogram import PublishHistogram
+
+  histogram = PublishHistogram.from_string(feed.publish_histogram)
+  histogram.add(newest_post_published_date)
+  scheduled_fetch_time = histogram.next_fetch_time(
+      latest_fetched_time, changerate)
+  feed.publish_histogram = histogram.to_string()
+"""
+from datetime import timedelta
+
+from util.changerate import (
+    DEFAULT_AGE_LIMIT, MIN_CHANGERATE, MIN_PUBLISHED_DATE, estimate_changerate,
+    publication_times, to_naive_utc)
+
+HOURS_PER_WEEK = 7 * 24
+DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+# All counts are halved when one reaches the max, so old habits fade out.
+MAX_COUNT = len(DIGITS) - 1
+# Min # of publications to schedule by the histogram.
+MIN_PUBLICATIONS = 8
+# Added to every hour not to stop fetching in hours without a post yet.
+SMOOTHING = 0.1
+
+def hour_of_week(time):
+    """Returns the hour of the week (0: Monday 00:00-00:59 UTC).
+
+    Args:
+      time: A naive (UTC) or timezone-aware datetime.
+
+    Returns:
+      An integer in [0, 168).
+    """
+    time = to_naive_utc(time)
+    return time.weekday() * 24 + time.hour
+
+class PublishHistogram:
+    """PublishHistogram holds publication counts per hour of the week.
+
+    Attributes:
+      counts: A list of 168 counts.
+    """
+    def __init__(self, counts=None):
+        self.counts = list(counts) if counts else [0] * HOURS_PER_WEEK
+
+    @staticmethod
+    def from_string(encoded):
+        """Decodes a histogram stored in feeds table.
+
+        Args:
+          encoded: A string from to_string (empty or None for no data).
+
+        Returns:
+          A PublishHistogram instance.
+        """
+        if not encoded or len(encoded) != HOURS_PER_WEEK:
+            return PublishHistogram()
+        return PublishHistogram([DIGITS.index(c) for c in encoded.upper()])
+
+    def to_string(self):
+        """Encodes the histogram in 168 characters.
+        """
+        return "".join(DIGITS[count] for count in self.counts)
+
+    def total(self):
+        """Returns the sum of counts.
+        """
+        return sum(self.counts)
+
+    def add(self, published_date):
+        """Counts a publication.
+
+        Args:
+          published_date: The published date of a post.
+        """
+        hour = hour_of_week(published_date)
+        if self.counts[hour] >= MAX_COUNT:
+            self.counts = [count // 2 for count in self.counts]
+        self.counts[hour] += 1
+
+    def hourly_weights(self):
+        """Returns the weight of each hour (1.0 on average).
+
+        A weight is the share of publications in the hour, relative to a
+        uniform schedule.
+        """
+        total = self.total() + SMOOTHING * HOURS_PER_WEEK
+        return [
+            (count + SMOOTHING) * HOURS_PER_WEEK / total
+            for count in self.counts]
+
+    def next_fetch_time(
+            self, latest_fetched_time, changerate, max_delay_secs=None):
+        """Schedules the next fetch around likely publication hours.
+
+        Time is weighted by the publication share of each hour: the fetch is
+        placed when 'changerate' seconds of weighted time have passed since
+        the latest fetch, rounded up to the end of that hour (but not sooner
+        than MIN_CHANGERATE). Busy hours bring a fetch forward, dead hours
+        push it back. Without enough publications, it is
+        latest_fetched_time + changerate.
+
+        Args:
+          latest_fetched_time: The time of the latest fetch (naive UTC).
+          changerate: The interval in seconds on a uniform schedule.
+          max_delay_secs: The max seconds after latest_fetched_time
+            (optional).
+
+        Returns:
+          A naive UTC datetime.
+        """
+        uniform_time = latest_fetched_time + timedelta(seconds=changerate)
+        if self.total() < MIN_PUBLICATIONS:
+            return uniform_time
+
+        weights = self.hourly_weights()
+        min_time = latest_fetched_time + timedelta(seconds=MIN_CHANGERATE)
+        max_time = max(min_time, latest_fetched_time + timedelta(
+            seconds=max_delay_secs if max_delay_secs else changerate * 4))
+
+        remaining = float(changerate)
+        hour_start = latest_fetched_time.replace(
+            minute=0, second=0, microsecond=0)
+        time = latest_fetched_time
+        while time < max_time:
+            hour_end = hour_start + timedelta(hours=1)
+            weight = weights[hour_of_week(hour_start)]
+            weighted_secs = (hour_end - time).total_seconds() * weight
+            if weighted_secs >= remaining:
+                # Right after the hour which is likely to have a new post.
+                return min(max(hour_end, min_time), max_time)
+            remaining -= weighted_secs
+            time = hour_start = hour_end
+        return max_time
+
+def update_histogram(histogram, events):
+    """Counts a new publication found by the latest fetch.
+
+    An empty histogram (e.g. of a feed added before histograms) is filled
+    from all publications in the events instead.
+
+    Args:
+      histogram: A PublishHistogram instance to update.
+      events: Fetch log events (see FeedFetchLogDB.scan), in any order.
+
+    Returns:
+      True if the histogram has changed.
+    """
+    if histogram.total() == 0:
+        publications = publication_times(events)
+        for published_date in publications:
+            histogram.add(published_date)
+        return bool(publications)
+
+    events = sorted(events, key=lambda e: e["fetched_time"], reverse=True)
+    published_date = events[0].get("newest_post_published_date") if (
+        events) else None
+    if not published_date:
+        return False
+    published_date = to_naive_utc(published_date)
+    if published_date < MIN_PUBLISHED_DATE:
+        return False
+    if len(events) > 1:
+        # Already counted when the previous fetch saw it.
+        previous_date = events[1].get("newest_post_published_date")
+        if previous_date and to_naive_utc(previous_date) >= published_date:
+            return False
+    histogram.add(published_date)
+    return True
+
+def histogram_changerate(events):
+    """The histogram policy for backtests (see util.changerate.backtest).
+
+    The histogram is built from the publications in the events, and the
+    EWMA changerate is spread over the week by it.
+
+    Args:
+      events: Fetch log events.
+
+    Returns:
+      The changerate in seconds.
+    """
+    histogram = PublishHistogram()
+    update_histogram(histogram, events)
+    latest_fetched_time = max(
+        to_naive_utc(event["fetched_time"]) for event in events)
+    changerate = estimate_changerate(events).changerate
+    next_fetch_time = histogram.next_fetch_time(
+        latest_fetched_time, changerate, max_delay_secs=DEFAULT_AGE_LIMIT)
+    return int((next_fetch_time - latest_fetched_time).total_seconds())
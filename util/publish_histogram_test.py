@@ -0,0 +1,162 @@
+"""Tests for PublishHistogram class.
+
+Commands:
+$ PYTHONPATH=./ python3 util/publish_histogram_test.py
+"""
+from datetime import datetime, timedelta
+
+from util.changerate import (
+    DEFAULT_AGE_LIMIT, MIN_CHANGERATE, backtest, ewma_changerate)
+from util.publish_histogram import (
+    HOURS_PER_WEEK, MAX_COUNT, PublishHistogram, hour_of_week,
+    histogram_changerate, update_histogram)
+
+# A Monday.
+START_TIME = datetime(2020, 10, 5)
+
+def weekday_morning_posts(num_weeks):
+    """Returns posts at 00:10-00:50 UTC on weekdays, 1-2 a day.
+    """
+    publications = []
+    for day in range(num_weeks * 7):
+        date = START_TIME + timedelta(days=day)
+        if date.weekday() >= 5:
+            continue
+        publications.append(date + timedelta(minutes=10 + day % 3 * 5))
+        if day % 2 == 0:
+            publications.append(date + timedelta(minutes=50))
+    return publications
+
+def test_encoding():
+    """Tests a histogram survives a round trip through its string form.
+    """
+    histogram = PublishHistogram()
+    assert histogram.to_string() == "0" * HOURS_PER_WEEK
+    histogram.add(datetime(2020, 10, 5, 1, 30))
+    for _ in range(20):
+        histogram.add(datetime(2020, 10, 11, 23, 59))
+
+    encoded = histogram.to_string()
+    assert len(encoded) == HOURS_PER_WEEK
+    assert encoded[1] == "1" and encoded[-1] == "K"
+    assert PublishHistogram.from_string(encoded).counts == histogram.counts
+    assert PublishHistogram.from_string("").total() == 0
+    assert PublishHistogram.from_string(None).total() == 0
+
+def test_decay():
+    """Tests counts are halved when an hour saturates.
+    """
+    histogram = PublishHistogram()
+    histogram.add(datetime(2020, 10, 6, 12))
+    histogram.add(datetime(2020, 10, 6, 12))
+    histogram.add(datetime(2020, 10, 6, 12))
+    for _ in range(MAX_COUNT + 1):
+        histogram.add(datetime(2020, 10, 5, 9))
+
+    assert histogram.counts[hour_of_week(datetime(2020, 10, 5, 9))] == (
+        MAX_COUNT // 2 + 1)
+    assert histogram.counts[hour_of_week(datetime(2020, 10, 6, 12))] == 1
+    assert max(histogram.counts) <= MAX_COUNT
+
+def test_schedule_after_busy_hour():
+    """Tests a fetch lands right after the hour posts usually come in.
+    """
+    histogram = PublishHistogram()
+    for publication in weekday_morning_posts(4):
+        histogram.add(publication)
+
+    # Tuesday 20:00, with a changerate of 12 hours.
+    latest_fetched_time = datetime(2020, 11, 3, 20)
+    next_fetch_time = histogram.next_fetch_time(
+        latest_fetched_time, 43200, max_delay_secs=DEFAULT_AGE_LIMIT)
+    assert next_fetch_time == datetime(2020, 11, 4, 1)
+
+def test_backoff_in_dead_hours():
+    """Tests fetches are pushed back through hours without posts.
+    """
+    histogram = PublishHistogram()
+    for publication in weekday_morning_posts(4):
+        histogram.add(publication)
+
+    # Friday 02:00 with a changerate of 2 hours: nothing comes until Monday.
+    latest_fetched_time = datetime(2020, 11, 6, 2)
+    next_fetch_time = histogram.next_fetch_time(
+        latest_fetched_time, 7200, max_delay_secs=DEFAULT_AGE_LIMIT)
+    assert next_fetch_time > latest_fetched_time + timedelta(hours=4)
+
+    # Not later than the max delay, since posts older are not read.
+    next_fetch_time = histogram.next_fetch_time(
+        latest_fetched_time, 86400, max_delay_secs=DEFAULT_AGE_LIMIT)
+    assert next_fetch_time == latest_fetched_time + timedelta(
+        seconds=DEFAULT_AGE_LIMIT)
+
+    # Never sooner than MIN_CHANGERATE even in the busy hour.
+    latest_fetched_time = datetime(2020, 11, 6, 0, 55)
+    next_fetch_time = histogram.next_fetch_time(latest_fetched_time, 60)
+    assert next_fetch_time == latest_fetched_time + timedelta(
+        seconds=MIN_CHANGERATE)
+
+def test_uniform_fallback():
+    """Tests a histogram with a few posts keeps the changerate as is.
+    """
+    histogram = PublishHistogram()
+    histogram.add(datetime(2020, 10, 5, 9))
+    latest_fetched_time = datetime(2020, 11, 6, 2)
+
+    assert histogram.next_fetch_time(latest_fetched_time, 7200) == (
+        latest_fetched_time + timedelta(seconds=7200))
+
+def test_update_histogram():
+    """Tests a publication is counted once, and empty histograms backfill.
+    """
+    published_date = datetime(2020, 10, 5, 9, 30)
+    events = [
+        {"fetched_time": datetime(2020, 10, 5, 8),
+         "newest_post_published_date": datetime(1970, 1, 1)},
+        {"fetched_time": datetime(2020, 10, 5, 10),
+         "newest_post_published_date": published_date}]
+
+    histogram = PublishHistogram()
+    assert update_histogram(histogram, events)
+    assert histogram.total() == 1
+
+    assert update_histogram(histogram, events)
+    assert histogram.total() == 2
+
+    events.append({
+        "fetched_time": datetime(2020, 10, 5, 12),
+        "newest_post_published_date": published_date})
+    assert not update_histogram(histogram, events)
+    assert histogram.total() == 2
+
+def test_backtest():
+    """Tests the histogram policy fetches less and sooner on a weekly habit.
+    """
+    publications = weekday_morning_posts(8)
+    start_time = START_TIME
+    end_time = START_TIME + timedelta(weeks=8)
+
+    ewma = backtest(publications, start_time, end_time, ewma_changerate)
+    histogram = backtest(
+        publications, start_time, end_time, histogram_changerate)
+
+    assert histogram.num_fetches < ewma.num_fetches
+    assert histogram.mean_delay() < ewma.mean_delay()
+    assert histogram.num_missed == 0
+
+def main():
+    """Run tests for PublishHistogram.
+    """
+    print("TEST started.")
+    test_encoding()
+    test_decay()
+    test_schedule_after_busy_hour()
+    test_backoff_in_dead_hours()
+    test_uniform_fallback()
+    test_update_histogram()
+    test_backtest()
+    print("TEST completed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""StreamingFeedReader and lxml element helpers for feed readers.
+
+  StreamingFeedReader parses an RSS/ATOM feed incrementally (lxml pull parser)
+  and yields items as soon as they are parsed. Reading stops once enough
+  items are read, or old or seen items are reached (see ItemCutoff), so the
+  rest of the document is never parsed.
+
+  Typical usage example:
+
+  from util.streaming_feed_reader import StreamingFeedReader
+
+  reader = StreamingFeedReader(url=url, feed_content=response.content)
+  items = reader.read(
+      count=2, published_after=cutoff_time, stop_at_url=feed.latest_item_url)
+
+  feed_content can also be an iterable of bytes such as
+  Response.iter_content().
+"""
+import html
+import logging
+
+from dateutil.parser import parse
+from lxml import etree
+from util.feed import FeedItem
+from util.feed_text import (
+    READ_ITEM, STOP_READING, ItemCutoff, extract_from_cdata,
+    extract_from_post, strip_tistory_ads)
+
+logger = logging.getLogger()
+
+# Bytes to feed the parser at a time if the whole document is given.
+CHUNK_SIZE = 16 * 1024
+DC_NAMESPACE = "http://purl.org/dc/elements/1.1/"
+
+def local_name(element):
+    """Returns the tag name without a namespace.
+
+    Args:
+      element: An lxml element.
+
+    Returns:
+      The local name of the tag ("" for comments and processing instructions).
+    """
+    if not isinstance(element.tag, str):
+        return ""
+    return etree.QName(element).localname
+
+def find_child(element, name, namespace=None):
+    """Finds the first child element by local name.
+
+    Args:
+      element: An lxml element.
+      name: A local name of the child.
+      namespace: The namespace of the child (any namespace if None).
+
+    Returns:
+      The child element or None.
+    """
+    for child in element:
+        if local_name(child) != name:
+            continue
+        # namespace "" matches a child without a namespace.
+        if namespace is None or (
+                (etree.QName(child).namespace or "") == namespace):
+            return child
+    return None
+
+def element_text(element):
+    """Returns all the text in an element (like BeautifulSoup's get_text).
+
+    Args:
+      element: An lxml element.
+
+    Returns:
+      A string.
+    """
+    return "".join(element.itertext())
+
+def rss_item_url(item):
+    """Returns the link of an RSS <item> element ("" if missing).
+    """
+    link = find_child(item, "link", namespace="")
+    return element_text(link) if link is not None else ""
+
+def atom_item_url(entry):
+    """Returns the link of an ATOM <entry> element ("" if missing).
+    """
+    link = find_child(entry, "link")
+    return link.get("href", "") if link is not None else ""
+
+def rss_item_from_element(feed_url, item):
+    """Creates a FeedItem from an RSS <item> element.
+
+    Keeps the same field semantics as RssReader.
+
+    Args:
+      feed_url: The feed URL.
+      item: An lxml element of <item>.
+
+    Returns:
+      A FeedItem instance.
+    """
+    url = rss_item_url(item)
+    if not url:
+        raise ValueError("Empty <link>")
+
+    updated = ""
+    pub_date = find_child(item, "pubDate")
+    if pub_date is not None:
+        updated = parse(element_text(pub_date))
+
+    author = ""
+    author_element = find_child(item, "author", namespace="")
+    creator = find_child(item, "creator", namespace=DC_NAMESPACE)
+    if author_element is not None:
+        author = html.unescape(element_text(author_element))
+    elif creator is not None:
+        # Example: <dc:creator><![CDATA[Test Lee]]></dc:creator>
+        author_src_text = element_text(creator).strip()
+        if author_src_text.startswith("<![CDATA["):
+            author = extract_from_cdata(author_src_text)
+        else:
+            author = author_src_text
+
+    title_element = find_child(item, "title")
+    title = html.unescape(element_text(title_element)) if (
+        title_element is not None) else ""
+    description_element = find_child(item, "description")
+    description = extract_from_post(element_text(description_element)) if (
+        description_element is not None) else ""
+    description = strip_tistory_ads(feed_url, description).strip()
+
+    return FeedItem(
+        url=url, title=title, description=description,
+        published_date=updated, author=author)
+
+def atom_item_from_element(entry):
+    """Creates a FeedItem from an ATOM <entry> element.
+
+    Keeps the same field semantics as AtomReader.
+
+    Args:
+      entry: An lxml element of <entry>.
+
+    Returns:
+      A FeedItem instance.
+    """
+    url = atom_item_url(entry)
+
+    updated = ""
+    updated_element = find_child(entry, "updated")
+    if updated_element is not None:
+        updated = parse(element_text(updated_element))
+
+    author = ""
+    author_element = find_child(entry, "author")
+    if author_element is not None:
+        name = find_child(author_element, "name")
+        if name is not None:
+            author = html.unescape(element_text(name))
+
+    summary = find_child(entry, "summary")
+    if summary is None:
+        summary = find_child(entry, "content")
+    description = extract_from_post(element_text(summary)) if (
+        summary is not None) else ""
+    title_element = find_child(entry, "title")
+    title = html.unescape(element_text(title_element)) if (
+        title_element is not None) else ""
+
+    return FeedItem(
+        url=url, title=title, description=description.strip(),
+        published_date=updated, author=author)
+
+class StreamingFeedReader:
+    """StreamingFeedReader parses an RSS or ATOM feed incrementally.
+
+    The feed type is detected from the root element. Channel metadata
+    (title, description, ...) before the first item is read in the
+    constructor. Parsed items are cleared right away, so memory stays flat
+    regardless of the size of the feed.
+
+    Attributes:
+      feed_type: "RSS", "ATOM" or "UNKNOWN".
+      title, description, language, generator, author: Feed metadata.
+    """
+    def __init__(self, url, feed_content):
+        self.url = url
+        self.feed_type = "UNKNOWN"
+        self.title = ""
+        self.description = ""
+        self.language = ""
+        self.generator = ""
+        self.author = ""
+
+        if isinstance(feed_content, (bytes, str)):
+            if isinstance(feed_content, str):
+                feed_content = feed_content.encode("utf-8")
+            chunks = (
+                feed_content[i:i + CHUNK_SIZE]
+                for i in range(0, len(feed_content), CHUNK_SIZE))
+        else:
+            chunks = feed_content
+        self._parser = etree.XMLPullParser(
+            events=("start", "end"), recover=True, resolve_entities=False)
+        self._events = self._iter_events(chunks)
+        self._read_metadata()
+
+    def _iter_events(self, chunks):
+        """Feeds chunks to the parser and yields parse events.
+        """
+        for chunk in chunks:
+            if not chunk:
+                continue
+            self._parser.feed(chunk)
+            for event in self._parser.read_events():
+                yield event
+        try:
+            self._parser.close()
+        except etree.XMLSyntaxError as ex:
+            logger.warning("Failed to parse a feed (%s): %s", self.url, ex)
+        for event in self._parser.read_events():
+            yield event
+
+    def _item_tag(self):
+        """Returns the tag name of items for the feed type.
+        """
+        return "item" if self.feed_type == "RSS" else "entry"
+
+    def _read_metadata(self):
+        """Reads events up to the first item to fill feed metadata.
+        """
+        for event, element in self._events:
+            name = local_name(element)
+            if event == "start":
+                if self.feed_type == "UNKNOWN":
+                    if name == "rss":
+                        self.feed_type = "RSS"
+                    elif name == "feed":
+                        self.feed_type = "ATOM"
+                    else:
+                        logger.warning(
+                            "Unknown root element <%s>: %s", name, self.url)
+                        return
+                elif name == self._item_tag():
+                    return
+                continue
+
+            parent = element.getparent()
+            parent_name = local_name(parent) if parent is not None else ""
+            if self.feed_type == "RSS" and parent_name == "channel":
+                if name in ("title", "description", "language", "generator"):
+                    setattr(self, name, element_text(element))
+            elif self.feed_type == "ATOM" and parent_name == "feed":
+                if name == "title":
+                    self.title = element_text(element)
+                elif name == "author":
+                    author_name = find_child(element, "name")
+                    if author_name is not None:
+                        self.author = element_text(author_name)
+
+    def iter_items(self, published_after=None, stop_at_url=""):
+        """Yields items as they are parsed.
+
+        Args:
+          published_after: A timezone-aware datetime. Items published
+            before it are skipped, and reading stops after a few in a row
+            (feeds list the newest items first).
+          stop_at_url: The URL of the newest item seen by the previous
+            fetch. Stops at the item before parsing it, unless it is the
+            first item.
+
+        Yields:
+          FeedItem instances.
+        """
+        if self.feed_type == "UNKNOWN":
+            return
+
+        item_tag = self._item_tag()
+        cutoff = ItemCutoff(
+            published_after=published_after, stop_at_url=stop_at_url)
+        for event, element in self._events:
+            if event != "end" or local_name(element) != item_tag:
+                continue
+
+            url = ""
+            if stop_at_url:
+                url = (rss_item_url(element) if self.feed_type == "RSS"
+                       else atom_item_url(element))
+            action = cutoff.check_url(url)
+            item = None
+            if action == READ_ITEM:
+                if self.feed_type == "RSS":
+                    item = rss_item_from_element(self.url, element)
+                else:
+                    item = atom_item_from_element(element)
+                action = cutoff.check_item(item)
+
+            # Frees parsed items to keep memory flat.
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+            if action == STOP_READING:
+                return
+            if action == READ_ITEM:
+                yield item
+
+    def read(self, count=1, published_after=None, stop_at_url=""):
+        """Parses the feed and returns up to 'count' items.
+
+        Args:
+          count: The max # of items to return.
+          published_after: A timezone-aware datetime. Items published
+            before it are skipped.
+          stop_at_url: The URL of the newest item seen by the previous
+            fetch. Stops at the item (unless it is the first one), so only
+            newer items are returned.
+
+        Returns:
+          A list of items parsed from the feed.
+        """
+        items = []
+        if count <= 0:
+            return items
+        for item in self.iter_items(
+                published_after=published_after, stop_at_url=stop_at_url):
+            items.append(item)
+            if len(items) >= count:
+                break
+        return items
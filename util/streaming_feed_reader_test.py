@@ -0,0 +1,199 @@
+"""Tests for StreamingFeedReader class.
+
+Commands:
+$ PYTHONPATH=./ python3 util/streaming_feed_reader_test.py
+"""
+from datetime import datetime, timedelta, timezone
+import resource
+
+from util.feed_reader_factory import parse_feed_items
+from util.feed_reader_factory_test import item_fields, read_testdata
+from util.streaming_feed_reader import StreamingFeedReader
+
+RSS_URL = "https://sample.tistory.com/rss"
+ATOM_URL = "https://atom.example.com/feed"
+
+def test_parity_with_soup_readers():
+    """Tests streamed items match the items of the BeautifulSoup readers.
+    """
+    feeds = [
+        (RSS_URL, read_testdata("sample_rss.xml")),
+        (ATOM_URL, read_testdata("sample_atom.xml"))]
+    for url, content in feeds:
+        items = parse_feed_items(url, content, 10, backend="stream")
+        soup_items = parse_feed_items(url, content, 10, backend="soup")
+        assert items
+        assert item_fields(items) == item_fields(soup_items)
+
+def test_metadata():
+    """Tests channel metadata is read before the first item.
+    """
+    reader = StreamingFeedReader(RSS_URL, read_testdata("sample_rss.xml"))
+
+    assert reader.feed_type == "RSS"
+    assert reader.title == "리드모아 샘플 블로그"
+    assert reader.language == "ko"
+    assert reader.generator == "TISTORY"
+
+    reader = StreamingFeedReader(ATOM_URL, read_testdata("sample_atom.xml"))
+    assert reader.feed_type == "ATOM"
+
+def test_early_termination():
+    """Tests reading stops at 'count' items or at an old item.
+    """
+    content = read_testdata("sample_rss.xml")
+    assert len(StreamingFeedReader(RSS_URL, content).read(count=1)) == 1
+
+    cutoff = datetime(2020, 10, 4, 12, 0, tzinfo=timezone.utc)
+    items = StreamingFeedReader(RSS_URL, content).read(
+        count=10, published_after=cutoff)
+    assert [item.url for item in items] == [
+        "https://sample.tistory.com/3", "https://sample.tistory.com/2"]
+
+    soup_items = parse_feed_items(
+        RSS_URL, content, 10, backend="soup", published_after=cutoff)
+    assert item_fields(soup_items) == item_fields(items)
+
+def test_stop_at_seen_item():
+    """Tests every backend stops at the high-water mark of a feed.
+    """
+    feeds = [
+        (RSS_URL, read_testdata("sample_rss.xml"),
+         "https://sample.tistory.com/2", ["https://sample.tistory.com/3"]),
+        (ATOM_URL, read_testdata("sample_atom.xml"),
+         "https://atom.example.com/posts/1",
+         ["https://atom.example.com/posts/2"]),
+        # A seen first item may be pinned, so the items below it are read.
+        (ATOM_URL, read_testdata("sample_atom.xml"),
+         "https://atom.example.com/posts/2",
+         ["https://atom.example.com/posts/1"])]
+    for url, content, stop_at_url, expected_urls in feeds:
+        for backend in ("soup", "lxml", "stream"):
+            items = parse_feed_items(
+                url, content, 10, backend=backend, stop_at_url=stop_at_url)
+            assert [item.url for item in items] == expected_urls, backend
+
+    # An unknown mark (e.g. the item was deleted) doesn't stop reading.
+    items = StreamingFeedReader(RSS_URL, read_testdata("sample_rss.xml")).read(
+        count=10, stop_at_url="https://sample.tistory.com/deleted")
+    assert len(items) == 3
+
+def create_pinned_feed():
+    """Returns an RSS feed with a pinned old post above new ones.
+    """
+    published_date = datetime(2020, 10, 5, tzinfo=timezone.utc)
+    ages = [
+        ("pinned", timedelta(days=365)), ("new1", timedelta(hours=1)),
+        ("new2", timedelta(hours=2)), ("old1", timedelta(days=3)),
+        ("old2", timedelta(days=4)), ("old3", timedelta(days=5)),
+        ("new3", timedelta(hours=3))]
+    items = "".join(
+        "<item><title>%s</title><link>https://pinned.example.com/%s</link>"
+        "<description>Text</description><pubDate>%s</pubDate></item>" % (
+            name, name, (published_date - age).strftime(
+                "%a, %d %b %Y %H:%M:%S %z"))
+        for name, age in ages)
+    return ('<?xml version="1.0" encoding="UTF-8"?><rss version="2.0">'
+            "<channel><title>Pinned</title>" + items +
+            "</channel></rss>").encode("utf-8")
+
+def test_pinned_first_item():
+    """Tests an old or seen first item doesn't hide the new items below it.
+    """
+    url = "https://pinned.example.com/rss"
+    content = create_pinned_feed()
+    cutoff = datetime(2020, 10, 4, tzinfo=timezone.utc)
+    for backend in ("soup", "lxml", "stream"):
+        items = parse_feed_items(
+            url, content, 10, backend=backend, published_after=cutoff)
+        # Stops after 3 old items in a row.
+        assert [item.title for item in items] == ["new1", "new2"], backend
+
+        items = parse_feed_items(
+            url, content, 10, backend=backend, published_after=cutoff,
+            stop_at_url="https://pinned.example.com/pinned")
+        assert [item.title for item in items] == ["new1", "new2"], backend
+
+        items = parse_feed_items(
+            url, content, 10, backend=backend, published_after=cutoff,
+            stop_at_url="https://pinned.example.com/new2")
+        assert [item.title for item in items] == ["new1"], backend
+
+def test_chunked_input():
+    """Tests an iterable of small chunks is parsed the same way.
+    """
+    content = read_testdata("sample_rss.xml")
+    chunks = (content[i:i + 7] for i in range(0, len(content), 7))
+
+    items = StreamingFeedReader(RSS_URL, chunks).read(count=10)
+
+    assert item_fields(items) == item_fields(
+        StreamingFeedReader(RSS_URL, content).read(count=10))
+
+def create_large_feed(num_items):
+    """Yields chunks of an RSS feed with 'num_items' items.
+    """
+    yield (b'<?xml version="1.0" encoding="UTF-8"?>'
+           b'<rss version="2.0"><channel><title>Large</title>')
+    published_date = datetime(2020, 10, 5, tzinfo=timezone.utc)
+    for i in range(num_items):
+        yield ((
+            "<item><title>Post %d</title>"
+            "<link>https://large.example.com/%d</link>"
+            "<description>%s</description><pubDate>%s</pubDate></item>" % (
+                i, i, "Text " * 1000,
+                (published_date - timedelta(minutes=i)).strftime(
+                    "%a, %d %b %Y %H:%M:%S %z"))).encode("utf-8"))
+    yield b"</channel></rss>"
+
+def test_read_past_count_to_mark():
+    """Tests items above the high-water mark are read past 'count'.
+    """
+    url = "https://large.example.com/rss"
+    content = b"".join(create_large_feed(30))
+    mark = "https://large.example.com/20"
+    for backend in ("soup", "lxml", "stream"):
+        items = parse_feed_items(
+            url, content, 5, backend=backend, max_count=50)
+        assert len(items) == 5, backend
+        items = parse_feed_items(
+            url, content, 5, backend=backend, stop_at_url=mark, max_count=50)
+        assert len(items) == 20, backend
+        items = parse_feed_items(
+            url, content, 5, backend=backend, stop_at_url=mark, max_count=12)
+        assert len(items) == 12, backend
+
+def test_flat_memory():
+    """Tests memory stays flat while streaming a multi-megabyte feed.
+    """
+    num_items = 2000
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    num_read = 0
+    for _ in StreamingFeedReader(
+            "https://large.example.com/rss",
+            create_large_feed(num_items)).iter_items():
+        num_read += 1
+
+    assert num_read == num_items
+    # The feed is ~10MB; a parsed tree of it would take far more than this.
+    assert resource.getrusage(
+        resource.RUSAGE_SELF).ru_maxrss - peak_rss_kb < 10 * 1024
+
+def main():
+    """Run tests for StreamingFeedReader.
+    """
+    print("TEST started.")
+    test_parity_with_soup_readers()
+    test_metadata()
+    test_early_termination()
+    test_stop_at_seen_item()
+    test_pinned_first_item()
+    test_chunked_input()
+    test_read_past_count_to_mark()
+    test_flat_memory()
+    print("TEST completed.")
+
+
+if __name__ == "__main__":
+    main()